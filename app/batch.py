@@ -0,0 +1,147 @@
+# app/batch.py
+import asyncio, json, math, os, random, time
+from typing import Dict, List, Optional
+from .graph import get_graph
+from .telemetry import summarize
+from .llm import retryable, retry_after
+
+# Offline batch generation (nightly story packs).
+# Input JSONL:  {"id": "...", "user_request": "..."} per line (id defaults to the line number)
+# Output JSONL: one result per line, appended as each story finishes, so a crash
+# loses at most the stories in flight; rerunning with resume=True skips ids that
+# already have status "ok" (failed ones are retried).
+
+def read_requests(path: str) -> List[Dict]:
+    reqs = []
+    with open(path, encoding="utf-8") as f:
+        for i, line in enumerate(f):
+            line = line.strip()
+            if not line:
+                continue
+            obj = json.loads(line)
+            if isinstance(obj, str):
+                obj = {"user_request": obj}
+            obj["id"] = str(obj.get("id", i))
+            reqs.append(obj)
+    return reqs
+
+def completed_ids(output_path: str) -> set:
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue   # torn last line from a crash
+            if rec.get("status") == "ok":
+                done.add(str(rec.get("id")))
+    return done
+
+def _torn_tail(path: str) -> bool:
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() == 0:
+            return False
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) != b"\n"
+
+def percentile(values: List[float], p: float) -> float:
+    # nearest-rank percentile; 0.0 for an empty list
+    if not values:
+        return 0.0
+    vals = sorted(values)
+    k = max(0, math.ceil(p / 100.0 * len(vals)) - 1)
+    return vals[k]
+
+async def _run_one(graph, req: Dict, max_retries: int, base_delay: float) -> Dict:
+    state = {"user_request": req["user_request"], "revise_count": 0}
+    for attempt in range(max_retries + 1):
+        try:
+            return await graph.ainvoke(state)
+        except retryable() as e:
+            if attempt == max_retries:
+                raise
+            # honour Retry-After when given, else exponential backoff with full jitter
+            delay = retry_after(e)
+            if delay is None:
+                delay = random.uniform(0, base_delay * (2 ** attempt))
+            await asyncio.sleep(delay)
+
+def _record(req: Dict, state: Optional[Dict], latency: float, error: Optional[BaseException]) -> Dict:
+    rec = {"id": req["id"], "user_request": req["user_request"], "latency_s": round(latency, 3)}
+    if error is not None:
+        rec.update(status="error", error=f"{type(error).__name__}: {error}")
+        return rec
+    report = state.get("judge_report", {})
+    rec.update(
+        status="ok",
+        final_story=state.get("final_story"),
+        verdict=report.get("verdict"),
+        scores=report.get("scores"),
+        metrics=report.get("metrics"),
+        revise_count=state.get("revise_count", 0),
+        telemetry=summarize(state.get("telemetry")),
+    )
+    return rec
+
+async def run_batch(
+    input_path: str,
+    output_path: str,
+    concurrency: int = 8,
+    resume: bool = True,
+    max_retries: int = 5,
+    base_delay: float = 1.0,
+    **graph_options,
+) -> Dict:
+    """Run every request in input_path through the async graph; returns run stats."""
+    graph = get_graph(use_async=True, **graph_options)
+    reqs = read_requests(input_path)
+    skip = completed_ids(output_path) if resume else set()
+    todo = [r for r in reqs if r["id"] not in skip]
+
+    sem = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+    t0 = time.perf_counter()
+
+    with open(output_path, "a" if resume else "w", encoding="utf-8") as out:
+        if resume and _torn_tail(output_path):
+            out.write("\n")   # crash mid-write: don't glue the next record onto it
+        async def one(req):
+            nonlocal errors
+            async with sem:
+                t = time.perf_counter()
+                state, err = None, None
+                try:
+                    state = await _run_one(graph, req, max_retries, base_delay)
+                except Exception as e:
+                    err = e
+                latency = time.perf_counter() - t
+                rec = _record(req, state, latency, err)
+                # single event loop: no await between write and flush, so lines never interleave
+                out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                out.flush()
+                if err is None:
+                    latencies.append(latency)
+                else:
+                    errors += 1
+
+        await asyncio.gather(*(one(r) for r in todo))
+
+    elapsed = time.perf_counter() - t0
+    return {
+        "total": len(reqs),
+        "skipped": len(reqs) - len(todo),
+        "ok": len(latencies),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 2),
+        "stories_per_min": round(len(latencies) * 60.0 / elapsed, 2) if elapsed > 0 else 0.0,
+        "p50_latency_s": round(percentile(latencies, 50), 3),
+        "p95_latency_s": round(percentile(latencies, 95), 3),
+    }
+
+def run_batch_sync(input_path: str, output_path: str, **kwargs) -> Dict:
+    return asyncio.run(run_batch(input_path, output_path, **kwargs))
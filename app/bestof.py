@@ -0,0 +1,129 @@
+# app/bestof.py
+import asyncio, contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+from .nodes import (
+    _chat, _achat, _tell_call, _soften_call, _judge_metrics, _judge_call, _judge_apply,
+    _judge_raw, _ajudge_raw, _prejudge,
+)
+from .safety import get_scanner
+from .repair import failing_scores, local_faults, unfixable
+from .telemetry import instrument
+
+# Best-of-N drafting: replaces tell_step + judge_step with one node that writes
+# N drafts in parallel, drops the ones local checks already doom, judges the
+# survivors concurrently and keeps the best. A passing pick goes straight to
+# finalize, saving the serial revise round trip; otherwise the usual
+# repair/revise path sees the best failing draft and its report.
+
+# spread around the storyteller's 0.8 so drafts differ
+DRAFT_TEMPERATURES = (0.8, 0.95, 0.65, 1.05, 0.9, 0.7)
+
+def draft_temperatures(n: int) -> List[float]:
+    return [DRAFT_TEMPERATURES[i % len(DRAFT_TEMPERATURES)] for i in range(n)]
+
+def _screen(state: dict, stories: List[str], temps: List[float]) -> List[Dict]:
+    cands = []
+    for i, (story, temp) in enumerate(zip(stories, temps)):
+        st = {**state, "draft_story": story.strip()}
+        metrics = _judge_metrics(st)
+        hits = get_scanner().scan(story)
+        faults = (["unsafe"] if hits else []) + local_faults(metrics)
+        cands.append({"index": i, "temperature": temp, "state": st, "metrics": metrics,
+                      "hits": hits, "faults": faults})
+    return cands
+
+def _to_judge(cands: List[Dict]) -> List[Dict]:
+    # mechanical faults (tail, slight overshoot, dialogue) are cleared by
+    # repair_step for free, so only unsafe drafts and unfixable faults are doomed
+    viable = [c for c in cands if not unfixable(c["faults"])]
+    if viable:
+        return viable
+    # nothing can pass: judge only the most repairable draft (safe, fewest faults,
+    # preferring faults code can fix) so repair/revise get a report to work from
+    def badness(c):
+        return ("unsafe" in c["faults"], len(unfixable(c["faults"])), len(c["faults"]), c["index"])
+    return [min(cands, key=badness)]
+
+def _softened(c: Dict, story: str) -> Dict:
+    # every draft was unsafe: soften the one we kept, as storyteller_node would
+    c["state"]["draft_story"] = story.strip()
+    c["metrics"] = _judge_metrics(c["state"])
+    return c
+
+def _prejudged(judged: List[Dict], prejudge: bool) -> List[Dict]:
+    # a lone least-bad draft the metrics already fail gets the local report;
+    # returns the candidates that still need the LLM judge
+    if not prejudge:
+        return judged
+    llm = []
+    for c in judged:
+        pre = _prejudge(c["state"], c["metrics"])
+        if pre is None:
+            llm.append(c)
+        else:
+            c["state"].update(pre)
+    return llm
+
+def _rank(c: Dict):
+    scores = c["state"]["judge_report"].get("scores", {})
+    passed = not failing_scores(scores)
+    total = sum(v for v in scores.values() if isinstance(v, (int, float)))
+    return (passed, total, -len(c["state"]["judge_report"].get("required_fixes", [])), -c["index"])
+
+def _pick(cands: List[Dict], judged: List[Dict]) -> dict:
+    best = max(judged, key=_rank)
+    candidates = [{
+        "index": c["index"],
+        "temperature": c["temperature"],
+        "word_count": c["metrics"]["word_count"],
+        "faults": c["faults"],
+        "verdict": c["state"].get("judge_report", {}).get("verdict"),
+        "picked": c is best,
+    } for c in cands]
+    return {
+        "draft_story": best["state"]["draft_story"],
+        "judge_report": best["state"]["judge_report"],
+        "safety_hits": [h.as_dict() for h in best["hits"]],
+        "candidates": candidates,
+    }
+
+def make_best_of_node(n: int, use_async: bool = False, prejudge: bool = True):
+    temps = draft_temperatures(n)
+
+    if use_async:
+        @instrument("best_of_step")
+        async def abest_of_node(state: dict) -> dict:
+            prompt, _, max_tokens = _tell_call(state)
+            stories = await asyncio.gather(*(_achat(prompt, t, max_tokens) for t in temps))
+            cands = _screen(state, stories, temps)
+            judged = _to_judge(cands)
+            for c in judged:
+                if c["hits"]:
+                    _softened(c, await _achat(*_soften_call(c["state"], c["state"]["draft_story"], c["hits"])))
+            llm = _prejudged(judged, prejudge)
+            raws = await asyncio.gather(*(_ajudge_raw(_judge_call(c["state"], c["metrics"])) for c in llm))
+            for c, raw in zip(llm, raws):
+                c["state"].update(_judge_apply(c["state"], raw, c["metrics"]))
+            return _pick(cands, judged)
+        return abest_of_node
+
+    @instrument("best_of_step")
+    def best_of_node(state: dict) -> dict:
+        prompt, _, max_tokens = _tell_call(state)
+        with ThreadPoolExecutor(max_workers=n) as pool:
+            # copy_context per task: LLM calls made on pool threads still
+            # record into this node's telemetry run
+            run = lambda fn, *args: pool.submit(contextvars.copy_context().run, fn, *args)
+            stories = [f.result() for f in [run(_chat, prompt, t, max_tokens) for t in temps]]
+            cands = _screen(state, stories, temps)
+            judged = _to_judge(cands)
+            for c in judged:
+                if c["hits"]:
+                    _softened(c, _chat(*_soften_call(c["state"], c["state"]["draft_story"], c["hits"])))
+            llm = _prejudged(judged, prejudge)
+            futs = [run(_judge_raw, _judge_call(c["state"], c["metrics"])) for c in llm]
+            for c, f in zip(llm, futs):
+                c["state"].update(_judge_apply(c["state"], f.result(), c["metrics"]))
+        return _pick(cands, judged)
+    return best_of_node
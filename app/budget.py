@@ -0,0 +1,86 @@
+# app/budget.py
+import json, math, os
+from typing import Callable, Dict, Iterable, Optional
+
+# Prompt footprint. Nodes serialize structured inputs compactly, count prompt
+# tokens locally and keep each prompt under a per-node budget by dropping
+# optional inputs (least useful first). Story replies get a max_tokens derived
+# from the plan's word_limit rather than a flat 1000.
+
+def compact(obj) -> str:
+    # no indentation or spaces after separators: same content, ~30% fewer tokens
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+_ENCODER = None   # tiktoken encoding; False once we know it's unavailable
+
+def _encoder():
+    global _ENCODER
+    if _ENCODER is None:
+        try:
+            import tiktoken
+            _ENCODER = tiktoken.encoding_for_model("gpt-3.5-turbo")
+        except Exception:   # not installed, or the BPE file can't be fetched offline
+            _ENCODER = False
+    return _ENCODER
+
+def load_encoder() -> bool:
+    """
+    Load the tiktoken encoding now, at startup, instead of on the first prompt
+    (the first load may fetch the BPE file; set TIKTOKEN_CACHE_DIR to a cache
+    shipped with the deployment to avoid that). False means counts are estimates.
+    """
+    return _encoder() is not False
+
+# prose runs ~4 chars/token but compact JSON nearer 3: without tiktoken, count
+# high so budgets trim a little early and story max_tokens err long
+ESTIMATE_HEADROOM = 1.25
+
+def count_tokens(text: str) -> int:
+    """Prompt tokens for gpt-3.5-turbo (tiktoken, else ~4 chars/token plus ESTIMATE_HEADROOM)."""
+    enc = _encoder()
+    if enc is False:
+        return math.ceil(len(text) / 4 * ESTIMATE_HEADROOM)
+    return len(enc.encode(text))
+
+# Prompt-token ceilings, sized so typical prompts fit untouched and only
+# outliers (long plans, long must_include/hint lists) get trimmed.
+# The story itself is never trimmed; for judge/revise it's the bulk of the prompt.
+PROMPT_BUDGETS = {
+    "plan_step": 650,
+    "tell_step": 550,
+    "judge_step": 1500,
+}
+# dropped in this order until the prompt fits
+OPTIONAL_INPUTS = {
+    "plan_step": ("style_hints", "setting_hints"),
+    "tell_step": ("style_knobs", "calming_motifs"),
+    "judge_step": ("dialogue_lines", "word_count", "intended_use"),
+}
+BUDGETS_ON = os.getenv("STORYDAG_PROMPT_BUDGET", "on").lower() not in ("0", "off", "false", "no")
+
+def fit(node: str, render: Callable[[Dict], str], data: Dict, optional: Optional[Iterable[str]] = None) -> str:
+    """render(data), dropping node's optional keys from data until the prompt is within budget."""
+    prompt = render(data)
+    budget = PROMPT_BUDGETS.get(node)
+    if not BUDGETS_ON or not budget:
+        return prompt
+    for key in OPTIONAL_INPUTS.get(node, ()) if optional is None else optional:
+        if count_tokens(prompt) <= budget:
+            break
+        if key in data:
+            data = {k: v for k, v in data.items() if k != key}
+            prompt = render(data)
+    return prompt
+
+# gpt-3.5 spends ~1.3 tokens per word on simple English prose
+TOKENS_PER_WORD = 1.3
+MIN_STORY_TOKENS = 256
+MAX_STORY_TOKENS = 2000
+
+def story_max_tokens(word_limit: int, headroom: float = 1.15, story: str = "") -> int:
+    """max_tokens for a story reply: word_limit plus headroom, and never less than
+    `story` (the text being revised) so a rewrite isn't cut off mid-sentence."""
+    n = int(word_limit * TOKENS_PER_WORD * headroom) + 32
+    if story:
+        n = max(n, int(count_tokens(story) * headroom) + 32)
+    return max(MIN_STORY_TOKENS, min(MAX_STORY_TOKENS, n))
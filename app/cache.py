@@ -0,0 +1,209 @@
+# app/cache.py
+import asyncio, hashlib, json, os, sqlite3, threading, time
+from collections import OrderedDict
+from typing import Optional
+
+# Content-addressed cache for LLM responses.
+# key = sha256(model, prompt, temperature, max_tokens); value = response text.
+# Lookup goes memory LRU -> SQLite; a disk hit is promoted into memory.
+# Async callers use aget/aset, which run the disk tier on a worker thread.
+
+def cache_key(model: str, prompt: str, temperature: float, max_tokens: int) -> str:
+    blob = json.dumps([model, prompt, float(temperature), int(max_tokens)], ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class LRUCache:
+    """Bounded in-memory tier. ttl is in seconds (None = no expiry)."""
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()   # key -> (value, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires is not None and expires < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        expires = time.time() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteCache:
+    """Persistent tier. Evicts least-recently-used rows beyond max_entries."""
+
+    EVICT_EVERY = 100   # check size every N writes, not on each one
+
+    def __init__(self, path: str, max_entries: int = 100_000, ttl: Optional[float] = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed)")
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, created = row
+            if self.ttl and created + self.ttl < now:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            self._writes += 1
+            if self._writes % self.EVICT_EVERY == 0:
+                self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        if self.ttl:
+            self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        (n,) = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()
+        if n > self.max_entries:
+            self._db.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY accessed ASC LIMIT ?)",
+                (n - self.max_entries,),
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class ResponseCache:
+    """
+    Two-tier cache in front of the LLM. Any object with get(key)/set(key, value)
+    can be plugged in as either tier.
+
+    max_temperature: calls at or below this temperature are cached by default
+    (classify 0.2, extract 0.1, judge 0.0); a per-call cache=True/False overrides.
+    """
+
+    def __init__(self, memory=None, disk=None, max_temperature: float = 0.2):
+        self.memory = memory if memory is not None else LRUCache()
+        self.disk = disk
+        self.max_temperature = max_temperature
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self._lock = threading.Lock()
+
+    def cacheable(self, temperature: float, cache: Optional[bool] = None) -> bool:
+        if cache is not None:
+            return cache
+        return temperature <= self.max_temperature
+
+    def _count(self, value: Optional[str], from_disk: bool) -> Optional[str]:
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.disk_hits += from_disk
+        return value
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.memory.get(key)
+        if value is not None or self.disk is None:
+            return self._count(value, False)
+        value = self.disk.get(key)
+        if value is not None:
+            self.memory.set(key, value)
+        return self._count(value, value is not None)
+
+    async def aget(self, key: str) -> Optional[str]:
+        value = self.memory.get(key)
+        if value is not None or self.disk is None:
+            return self._count(value, False)
+        value = await asyncio.to_thread(self.disk.get, key)
+        if value is not None:
+            self.memory.set(key, value)
+        return self._count(value, value is not None)
+
+    def set(self, key: str, value: str) -> None:
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    async def aset(self, key: str, value: str) -> None:
+        self.memory.set(key, value)
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.set, key, value)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "memory_hits": self.hits - self.disk_hits,
+            "disk_hits": self.disk_hits,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "memory_entries": len(self.memory) if hasattr(self.memory, "__len__") else None,
+        }
+
+
+def _from_env() -> Optional[ResponseCache]:
+    # STORYDAG_CACHE=off disables; STORYDAG_CACHE_DB=path adds the SQLite tier;
+    # STORYDAG_CACHE_TTL=seconds applies to both tiers.
+    if os.getenv("STORYDAG_CACHE", "on").lower() in ("0", "off", "false", "no"):
+        return None
+    ttl = float(os.getenv("STORYDAG_CACHE_TTL", "0")) or None
+    db = os.getenv("STORYDAG_CACHE_DB")
+    return ResponseCache(
+        memory=LRUCache(max_entries=int(os.getenv("STORYDAG_CACHE_SIZE", "1024")), ttl=ttl),
+        disk=SQLiteCache(db, ttl=ttl) if db else None,
+    )
+
+_CACHE = _from_env()
+
+def get_cache() -> Optional[ResponseCache]:
+    return _CACHE
+
+def configure_cache(cache: Optional[ResponseCache]) -> None:
+    """Install a process-wide cache (None disables caching)."""
+    global _CACHE
+    _CACHE = cache
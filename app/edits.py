@@ -0,0 +1,155 @@
+# app/edits.py
+import json, re
+from typing import Dict, List, Tuple
+from .metrics import DQUOTE, TERMINATORS, WORD, _ascii_letters, _coerce_limit, _metrics, has_bedtime_tail, missing_tokens
+
+# Targeted revision: instead of asking the model to write the whole story again,
+# show it the story as numbered sentences and take back a short edit list
+#   {"edits": [{"op": "replace", "id": "s3", "text": "..."},
+#              {"op": "insert", "id": "s5", "text": "..."},    # after s5; "s0" = at the start
+#              {"op": "delete", "id": "s7"}]}
+# so output tokens (and latency) scale with the change, not the story.
+
+# a sentence runs to its terminator(s) plus any closing quote/bracket (like
+# repair.SENT_END, so dialogue isn't split from its quote mark), or to a line end
+SENTENCE = re.compile(r"\S[^.!?\n]*(?:[.!?]+[\"'”’)]*|(?=\n)|$)")
+OPS = ("replace", "insert", "delete")
+
+
+class EditError(ValueError):
+    """The model's edit list can't be applied as given (the caller rewrites instead)."""
+
+
+def parse_edits(raw: str) -> List[Dict]:
+    # strict JSON only: a reply cut off at max_tokens would apply half an edit
+    m = re.search(r"\{.*\}", raw or "", re.S)
+    try:
+        data = json.loads(m.group(0) if m else raw)
+    except (TypeError, ValueError):
+        raise EditError("reply is not a complete JSON object")
+    edits = data.get("edits") if isinstance(data, dict) else None
+    if not isinstance(edits, list):
+        raise EditError('reply has no "edits" list')
+    return edits
+
+
+def _counts(text: str) -> Tuple[int, int, int]:
+    return WORD.subn("", text)[1], _ascii_letters(text), sum(map(text.count, TERMINATORS))
+
+
+class EditableStory:
+    """
+    A story as addressable sentences s1..sN, with the whitespace between them
+    (paragraph breaks included) kept, so `text` round-trips exactly.
+
+    metrics() equals compute_metrics(text): words, letters and terminators are
+    kept per sentence and re-counted only for sentences an edit touched (no
+    word spans a sentence boundary); quotes and must_include terms can straddle
+    sentences, so those are single scans of the joined text.
+    """
+
+    def __init__(self, story: str):
+        self.lead = story[: len(story) - len(story.lstrip())]
+        self.ids: List[str] = []
+        self.texts: Dict[str, str] = {}
+        self.seps: Dict[str, str] = {}   # whitespace after each sentence
+        self._counts: Dict[str, Tuple[int, int, int]] = {}
+        matches = list(SENTENCE.finditer(story))
+        for i, m in enumerate(matches):
+            sid = f"s{i + 1}"
+            end = matches[i + 1].start() if i + 1 < len(matches) else len(story)
+            self.ids.append(sid)
+            self.texts[sid] = m.group(0)
+            self.seps[sid] = story[m.end():end]
+        self._next = len(matches) + 1
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def text(self) -> str:
+        return self.lead + "".join(self.texts[s] + self.seps[s] for s in self.ids)
+
+    def numbered(self) -> str:
+        """The story for a prompt: one "sN: ..." line per sentence, blank line between paragraphs."""
+        lines = []
+        for sid in self.ids:
+            lines.append(f"{sid}: {self.texts[sid]}")
+            if "\n" in self.seps[sid]:
+                lines.append("")
+        return "\n".join(lines).strip()
+
+    def apply(self, edits: List[Dict]) -> List[str]:
+        """Apply an edit list atomically (all or nothing); -> ids of new/changed sentences."""
+        plan = []
+        seen = set()
+        for e in edits:
+            if not isinstance(e, dict) or e.get("op") not in OPS:
+                raise EditError(f"unknown edit: {e!r}")
+            op, sid = e["op"], str(e.get("id", "")).strip()
+            if sid not in self.texts and not (op == "insert" and sid == "s0"):
+                raise EditError(f"unknown sentence id: {sid!r}")
+            text = " ".join(str(e.get("text") or "").split())
+            if op != "delete" and not text:
+                raise EditError(f"{op} {sid} has no text")
+            if op != "insert":
+                if sid in seen:
+                    raise EditError(f"{sid} edited twice")
+                seen.add(sid)
+            plan.append((op, sid, text))
+
+        touched = []
+        last = {}   # anchor -> sentence inserted after it most recently, so inserts keep their order
+        for op, sid, text in plan:
+            if op == "replace":
+                self.texts[sid] = text
+                self._counts.pop(sid, None)
+                touched.append(sid)
+            elif op == "insert":
+                new = f"s{self._next}"
+                self._next += 1
+                prev = last.get(sid, None if sid == "s0" else sid)
+                if prev is None:
+                    self.ids.insert(0, new)
+                    self.seps[new] = " "
+                else:
+                    # the new sentence ends the paragraph if the one before it did
+                    self.ids.insert(self.ids.index(prev) + 1, new)
+                    self.seps[new] = self.seps[prev] or " "
+                    self.seps[prev] = " "
+                last[sid] = new
+                self.texts[new] = text
+                touched.append(new)
+        for op, sid, _ in plan:
+            if op == "delete":
+                i = self.ids.index(sid)
+                if i and self.seps[sid].count("\n") > self.seps[self.ids[i - 1]].count("\n"):
+                    self.seps[self.ids[i - 1]] = self.seps[sid]   # keep the paragraph break
+                self.ids.pop(i)
+                del self.texts[sid], self.seps[sid]
+                self._counts.pop(sid, None)
+        for sid, nxt in zip(self.ids, self.ids[1:]):
+            if not self.seps[sid] and (sid in touched or nxt in touched):
+                self.seps[sid] = " "   # an edited sentence never runs into its neighbours
+        return [s for s in touched if s in self.texts]
+
+    def metrics(self, must_include: List[str], intended_use: str, word_limit) -> Dict:
+        word_limit = _coerce_limit(word_limit)
+        words = letters = terms = 0
+        for sid in self.ids:
+            c = self._counts.get(sid)
+            if c is None:
+                c = self._counts[sid] = _counts(self.texts[sid])
+            words += c[0]
+            letters += c[1]
+            terms += c[2]
+        # a trailing sentence without a terminator still counts as one
+        sents = terms
+        if self.ids:
+            last = self.texts[self.ids[-1]]
+            cut = max(last.rfind(c) for c in TERMINATORS)
+            sents += 1 if last[cut + 1:].strip() else 0
+        text = self.text
+        return _metrics(words, letters, sents, len(DQUOTE.findall(text)),
+                        missing_tokens(text, must_include or []), has_bedtime_tail(text),
+                        intended_use, word_limit)
@@ -0,0 +1,235 @@
+# app/ensemble.py
+import asyncio, contextvars, json, os, threading, time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional
+from .nodes import _judge_metrics, _judge_call, _judge_apply, _judge_raw, _ajudge_raw, _prejudge
+from .prompts import _SCORE_KEYS
+from .telemetry import instrument
+
+# Judge ensemble (the "A/B judge"): judge_step asks several judge
+# configurations at once and returns as soon as `quorum` of them agree on
+# pass or revise, cancelling the rest. Wall clock is the quorum-th fastest
+# judge, not the sum: with 3 judges and a quorum of 2 it's the second reply.
+#
+# Every judge's reply goes through the usual metric clamps (_judge_apply). The
+# report combines the judges that voted with the decision, taking each score's
+# minimum, so should_pass sees the same decision. Without a quorum (judges
+# that failed, or an even split) the votes cast decide and a tie revises.
+#
+#   build_graph(judges=3)     # or STORYDAG_JUDGES=3; STORYDAG_JUDGE_QUORUM overrides the majority
+
+PANEL = (
+    {"name": "rubric", "temperature": 0.0, "focus": ""},   # the single judge's call, cache included
+    {"name": "bedtime", "temperature": 0.3,
+     "focus": "Read it as a parent at bedtime: weigh calm tone, clarity and a gentle ending most."},
+    {"name": "listener", "temperature": 0.3,
+     "focus": "Read it as a six-year-old listener: weigh simple words, a clear arc and small delights most."},
+)
+DEFAULT_JUDGES = int(os.getenv("STORYDAG_JUDGES", "1"))
+
+def default_quorum(n: int) -> int:
+    q = os.getenv("STORYDAG_JUDGE_QUORUM")
+    return min(n, int(q)) if q else n // 2 + 1
+
+def _judge_prompt(state: dict, metrics: dict, judge: Dict):
+    prompt, _, max_tokens = _judge_call(state, metrics)
+    if judge["focus"]:
+        prompt += f"\nReviewer focus: {judge['focus']}\n"
+    return prompt, judge["temperature"], max_tokens
+
+
+class PanelStats:
+    """Process-wide per-judge latency and agreement with the ensemble's decision."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.rounds = 0
+        self.early_exits = 0
+        self.splits = 0
+        self.judges: Dict[str, Dict] = {}
+
+    def record(self, report: Dict) -> None:
+        ens = report["ensemble"]
+        with self._lock:
+            self.rounds += 1
+            self.early_exits += ens["cancelled"] > 0
+            self.splits += min(ens["votes"].values()) > 0
+            for row in ens["judges"]:
+                s = self.judges.setdefault(row["name"], {"runs": 0, "votes": 0, "agreed": 0, "cancelled": 0,
+                                                         "errors": 0, "latency_ms": 0.0})
+                s["runs"] += 1
+                if row["status"] == "done":
+                    s["votes"] += 1
+                    s["agreed"] += row["verdict"] == ens["verdict"]
+                    s["latency_ms"] += row["latency_ms"]
+                elif row["status"] == "cancelled":
+                    s["cancelled"] += 1
+                else:
+                    s["errors"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "rounds": self.rounds,
+                "early_exit_rate": round(self.early_exits / self.rounds, 4) if self.rounds else 0.0,
+                "split_rate": round(self.splits / self.rounds, 4) if self.rounds else 0.0,
+                "judges": {
+                    name: {
+                        "runs": s["runs"],
+                        "cancelled": s["cancelled"],
+                        "errors": s["errors"],
+                        "agreement": round(s["agreed"] / s["votes"], 4) if s["votes"] else 0.0,
+                        "avg_latency_ms": round(s["latency_ms"] / s["votes"], 1) if s["votes"] else 0.0,
+                    } for name, s in self.judges.items()
+                },
+            }
+
+_STATS = PanelStats()
+
+def get_panel_stats() -> PanelStats:
+    return _STATS
+
+
+class _Round:
+    # one ensemble decision: judges report in as they finish
+    def __init__(self, state: dict, metrics: dict, judges: List[Dict], quorum: int):
+        self.state, self.metrics, self.quorum = state, metrics, quorum
+        self.rows = {j["name"]: {"name": j["name"], "status": "cancelled"} for j in judges}
+        self.reports: List[Dict] = []
+        self.errors: List[BaseException] = []
+        self.votes = {"pass": 0, "revise": 0}
+        self.verdict: Optional[str] = None
+        self.t0 = time.perf_counter()
+
+    def done(self, judge: Dict, raw: Optional[str], latency_s: float, error: Optional[BaseException] = None) -> bool:
+        """Record one judge; True once a quorum has decided."""
+        row = self.rows[judge["name"]]
+        row["latency_ms"] = round(latency_s * 1000.0, 1)
+        if error is not None:
+            self.errors.append(error)
+            row.update(status="error", error=f"{type(error).__name__}: {error}")
+        else:
+            rep = _judge_apply(self.state, raw, self.metrics)["judge_report"]
+            self.reports.append(rep)
+            row.update(status="done", verdict=rep["verdict"])
+            self.votes[rep["verdict"]] += 1
+            if self.votes[rep["verdict"]] >= self.quorum:
+                self.verdict = rep["verdict"]
+        return self.verdict is not None
+
+    def result(self) -> dict:
+        if not self.reports:
+            raise self.errors[0]
+        elapsed = round((time.perf_counter() - self.t0) * 1000.0, 1)
+        for row in self.rows.values():
+            if row["status"] == "cancelled":
+                row["latency_ms"] = elapsed   # ran until the quorum cut it off
+        verdict = self.verdict or ("pass" if self.votes["pass"] > self.votes["revise"] else "revise")
+        side = [r for r in self.reports if r["verdict"] == verdict]
+        merged = {
+            "scores": {k: min(r["scores"].get(k, 0) for r in side) for k in _SCORE_KEYS},
+            "required_fixes": [f for r in side for f in r["required_fixes"]],
+            "keep_strengths": [f for r in side for f in r["keep_strengths"]],
+        }
+        out = _judge_apply(self.state, json.dumps(merged, ensure_ascii=False), self.metrics)
+        rep = out["judge_report"]
+        # the clamps re-add their fixes; each judge's copy is already in the list
+        rep["required_fixes"] = list(dict.fromkeys(rep["required_fixes"]))
+        rep["keep_strengths"] = list(dict.fromkeys(rep["keep_strengths"]))
+        voted = self.votes["pass"] + self.votes["revise"]
+        rep["source"] = "ensemble"
+        rep["ensemble"] = {
+            "verdict": verdict,
+            "quorum": self.quorum,
+            "reached": self.verdict is not None,
+            "votes": dict(self.votes),
+            "agreement": round(self.votes[verdict] / voted, 4),
+            "cancelled": sum(r["status"] == "cancelled" for r in self.rows.values()),
+            "latency_ms": elapsed,
+            "judges": list(self.rows.values()),
+        }
+        _STATS.record(rep)
+        return out
+
+
+def _timed(fn, *args):
+    t = time.perf_counter()
+    return fn(*args), time.perf_counter() - t
+
+def _judge_sync(state: dict, metrics: dict, judges: List[Dict], quorum: int) -> dict:
+    rnd = _Round(state, metrics, judges, quorum)
+    cancel = threading.Event()
+    pool = ThreadPoolExecutor(max_workers=len(judges))
+    try:
+        # copy_context per task: the judges' calls record into this node's telemetry run
+        futs = {pool.submit(contextvars.copy_context().run, _timed, _judge_raw,
+                            _judge_prompt(state, metrics, j), cancel): j for j in judges}
+        pending = set(futs)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            decided = False
+            for f in done:
+                try:
+                    raw, secs = f.result()
+                    decided = rnd.done(futs[f], raw, secs) or decided
+                except Exception as e:
+                    decided = rnd.done(futs[f], None, time.perf_counter() - rnd.t0, e) or decided
+            if decided:
+                break
+    finally:
+        # streamed judges stop at their next token; a JUDGE_EVIDENCE call runs out unwaited
+        cancel.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+    return rnd.result()
+
+async def _judge_async(state: dict, metrics: dict, judges: List[Dict], quorum: int) -> dict:
+    rnd = _Round(state, metrics, judges, quorum)
+
+    async def one(judge):
+        t = time.perf_counter()
+        return await _ajudge_raw(_judge_prompt(state, metrics, judge)), time.perf_counter() - t
+
+    tasks = {asyncio.create_task(one(j)): j for j in judges}
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            decided = False
+            for t in done:
+                if t.exception() is not None:
+                    decided = rnd.done(tasks[t], None, time.perf_counter() - rnd.t0, t.exception()) or decided
+                    continue
+                raw, secs = t.result()
+                try:
+                    decided = rnd.done(tasks[t], raw, secs) or decided
+                except Exception as e:   # an unparseable reply counts against that judge only
+                    decided = rnd.done(tasks[t], None, secs, e) or decided
+            if decided:
+                break
+    finally:
+        for t in pending:
+            t.cancel()   # closes the straggler's stream
+        await asyncio.gather(*pending, return_exceptions=True)
+    return rnd.result()
+
+def make_ensemble_judge_node(n: int, use_async: bool = False, prejudge: bool = True, quorum: Optional[int] = None):
+    """judge_step over the first n PANEL judges; quorum defaults to a majority."""
+    if not 1 < n <= len(PANEL):
+        raise ValueError(f"judges must be between 2 and {len(PANEL)}")
+    judges = list(PANEL[:n])
+    quorum = default_quorum(n) if quorum is None else quorum
+    if not 1 <= quorum <= n:
+        raise ValueError(f"quorum must be between 1 and {n}")
+
+    if use_async:
+        @instrument("judge_step")
+        async def aensemble_judge_node(state: dict) -> dict:
+            metrics = _judge_metrics(state)
+            return (prejudge and _prejudge(state, metrics)) or await _judge_async(state, metrics, judges, quorum)
+        return aensemble_judge_node
+
+    @instrument("judge_step")
+    def ensemble_judge_node(state: dict) -> dict:
+        metrics = _judge_metrics(state)
+        return (prejudge and _prejudge(state, metrics)) or _judge_sync(state, metrics, judges, quorum)
+    return ensemble_judge_node
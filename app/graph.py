@@ -1,56 +1,213 @@
 # app/graph.py
-from langgraph.graph import StateGraph, END
+import inspect, threading
 from .nodes import (
-    classify_node, extract_constraints_node, plan_node, storyteller_node,
-    judge_node, revise_node, finalize_node
+    classify_node, extract_constraints_node, join_constraints_node, plan_node,
+    storyteller_node, judge_node, revise_node, finalize_node,
+    aclassify_node, aextract_constraints_node, aplan_node, astoryteller_node,
+    ajudge_node, arevise_node, afinalize_node, tiered_judge_node, atiered_judge_node,
 )
+from .repair import repair_node, after_repair
+from .bestof import make_best_of_node
+from .state import StoryState, VALIDATE_MODES, DEFAULT_VALIDATE, validated
+from .plancache import plan_lookup_node, aplan_lookup_node, after_plan_lookup, remembering
+from .inventory import inventory_node, after_inventory
+from .ensemble import DEFAULT_JUDGES, make_ensemble_judge_node
 
-def build_graph():
-    g = StateGraph(dict)
-
-    g.add_node("classify_step", classify_node)
-    g.add_node("extract_step", extract_constraints_node)
-    g.add_node("plan_step", plan_node)
-    g.add_node("tell_step", storyteller_node)
-    g.add_node("judge_step", judge_node)
-    g.add_node("revise_step", revise_node)
-    g.add_node("finalize_step", finalize_node)
-
-    g.set_entry_point("classify_step")
-    g.add_edge("classify_step", "extract_step")
-    g.add_edge("extract_step", "plan_step")
-    g.add_edge("plan_step", "tell_step")
-    g.add_edge("tell_step", "judge_step")
-
-    # Single-pass policy:
-    # OK -> finalize; else -> one revise; then always finalize
-    def should_pass(state: dict):
-        rep = state.get("judge_report", {})
-        scores = rep.get("scores", {})
-        ok = (
-            scores.get("safety") == 5
-            and scores.get("faithfulness", 0) >= 4
-            and all(
-                scores.get(k, 0) >= 4
-                for k in [
-                    "instruction_adherence",
-                    "age_fit",
-                    "bedtime_tone",
-                    "clarity",
-                    "arc",
-                    "engagement",
-                ]
-            )
+SYNC_NODES = {
+    "classify_step": classify_node,
+    "extract_step": extract_constraints_node,
+    "join_step": join_constraints_node,
+    "plan_step": plan_node,
+    "tell_step": storyteller_node,
+    "judge_step": judge_node,
+    "revise_step": revise_node,
+    "finalize_step": finalize_node,
+}
+
+# Same topology, AsyncOpenAI-backed nodes; drive with graph.ainvoke(...)
+ASYNC_NODES = {
+    "classify_step": aclassify_node,
+    "extract_step": aextract_constraints_node,
+    "join_step": join_constraints_node,
+    "plan_step": aplan_node,
+    "tell_step": astoryteller_node,
+    "judge_step": ajudge_node,
+    "revise_step": arevise_node,
+    "finalize_step": afinalize_node,
+}
+
+# Single-pass policy:
+# OK -> finalize; else -> one revise; then always finalize
+def should_pass(state: dict):
+    rep = state.get("judge_report", {})
+    scores = rep.get("scores", {})
+    ok = (
+        scores.get("safety") == 5
+        and scores.get("faithfulness", 0) >= 4
+        and all(
+            scores.get(k, 0) >= 4
+            for k in [
+                "instruction_adherence",
+                "age_fit",
+                "bedtime_tone",
+                "clarity",
+                "arc",
+                "engagement",
+            ]
         )
-        return "finalize" if ok else "revise"
+    )
+    return "finalize" if ok else "revise"
+
+REVISE_POLICIES = ("single", "none")
+
+def build_graph(use_async: bool = False, revise_policy: str = "single", judge: bool = True,
+                repair: bool = True, best_of: int = 1, validate: str = DEFAULT_VALIDATE,
+                plan_cache: bool = False, prejudge: bool = True, inventory: bool = True,
+                judges: int = DEFAULT_JUDGES):
+    """
+    revise_policy: "single" -> failing drafts get one revise, then finalize;
+                   "none"   -> judge is advisory only, always finalize.
+    judge: False drops judge/revise entirely (tell -> finalize).
+    repair: failing drafts first go through local mechanical fixes
+            (trim / dialogue / goodnight tail); the LLM revise is skipped
+            when those were the only problems.
+    best_of: N > 1 replaces tell/judge with best_of_step: N drafts in parallel,
+             locally doomed ones dropped, survivors judged concurrently, best
+             kept (a passing pick skips revise). Drafts are not streamed.
+    validate: "off" | "warn" | "strict" pydantic checks on the keys each node
+              returns (STORYDAG_VALIDATE sets the default).
+    plan_cache: start with plan_lookup_step; a near-duplicate of an earlier
+                request whose re-extracted must_include matches reuses its
+                classification/constraints/plan and goes straight to story
+                writing (see app.plancache). Off by default.
+    prejudge: drafts the metrics already fail on something only an LLM revise
+              can fix go to revise without the LLM judge call.
+    inventory: inventory_step after join_step serves a pregenerated story
+               matching the classification and must_include straight to
+               finalize (a no-op miss unless an inventory is configured, see
+               app.inventory).
+    judges: N > 1 makes judge_step an ensemble of N judge configurations run
+            concurrently; it returns once a majority agrees and cancels the
+            rest (see app.ensemble; STORYDAG_JUDGES sets the default).
+            best_of keeps a single judge per draft.
+    """
+    # langgraph (and langchain under it) is ~1s of imports: load it when the
+    # first graph is built, so importing this module stays cheap
+    from langgraph.graph import StateGraph, START, END
+    if revise_policy not in REVISE_POLICIES:
+        raise ValueError(f"unknown revise_policy: {revise_policy!r}")
+    if validate not in VALIDATE_MODES:
+        raise ValueError(f"unknown validate mode: {validate!r}")
+    if best_of > 1 and not judge:
+        raise ValueError("best_of needs judge=True to choose between drafts")
+    nodes = dict(ASYNC_NODES if use_async else SYNC_NODES)
+    if judges > 1:
+        nodes["judge_step"] = make_ensemble_judge_node(judges, use_async, prejudge)
+    elif prejudge:
+        nodes["judge_step"] = atiered_judge_node if use_async else tiered_judge_node
+    if best_of > 1:
+        nodes.pop("tell_step")
+        nodes.pop("judge_step")
+        nodes["best_of_step"] = make_best_of_node(best_of, use_async, prejudge)
+    judged = "best_of_step" if best_of > 1 else "judge_step"
+    first_draft = "best_of_step" if best_of > 1 else "tell_step"
+    if plan_cache:
+        nodes["plan_lookup_step"] = aplan_lookup_node if use_async else plan_lookup_node
+        nodes["plan_step"] = remembering(nodes["plan_step"])
+    if inventory:
+        nodes["inventory_step"] = inventory_node
+    if not judge:
+        nodes.pop("judge_step")
+    if not judge or revise_policy == "none":
+        nodes.pop("revise_step")
+    use_repair = repair and "revise_step" in nodes
+    if use_repair:
+        nodes["repair_step"] = repair_node
 
-    g.add_conditional_edges("judge_step", should_pass, {
-        "finalize": "finalize_step",
-        "revise": "revise_step",
-    })
+    g = StateGraph(StoryState)
 
-    # No loop back to judge — finalize after one revise
-    g.add_edge("revise_step", "finalize_step")
+    for name, fn in nodes.items():
+        g.add_node(name, validated(name, fn, validate))
+
+    # Fan-out: classify and extract only need user_request, so run them
+    # concurrently and join before planning (red-flag softening happens there).
+    if plan_cache:
+        def route(state):
+            return first_draft if after_plan_lookup(state) == "hit" else ["classify_step", "extract_step"]
+        g.add_edge(START, "plan_lookup_step")
+        g.add_conditional_edges("plan_lookup_step", route, ["classify_step", "extract_step", first_draft])
+    else:
+        g.add_edge(START, "classify_step")
+        g.add_edge(START, "extract_step")
+    g.add_edge(["classify_step", "extract_step"], "join_step")
+    if inventory:
+        g.add_edge("join_step", "inventory_step")
+        g.add_conditional_edges("inventory_step", after_inventory, {
+            "hit": "finalize_step",
+            "miss": "plan_step",
+        })
+    else:
+        g.add_edge("join_step", "plan_step")
+    g.add_edge("plan_step", first_draft)
+
+    if not judge:
+        g.add_edge("tell_step", "finalize_step")
+    elif revise_policy == "none":
+        if best_of == 1:
+            g.add_edge("tell_step", "judge_step")
+        g.add_edge(judged, "finalize_step")
+    else:
+        if best_of == 1:
+            g.add_edge("tell_step", "judge_step")
+        g.add_conditional_edges(judged, should_pass, {
+            "finalize": "finalize_step",
+            "revise": "repair_step" if use_repair else "revise_step",
+        })
+        if use_repair:
+            g.add_conditional_edges("repair_step", after_repair, {
+                "finalize": "finalize_step",
+                "revise": "revise_step",
+            })
+        # No loop back to judge — finalize after one revise
+        g.add_edge("revise_step", "finalize_step")
 
     g.add_edge("finalize_step", END)
     return g.compile()
+
+
+# --- Process-wide compiled-graph registry
+# Compiling is pure overhead per request; compile each configuration once and
+# share it (compiled graphs are stateless, so sharing across threads is safe).
+_GRAPHS = {}
+_GRAPHS_LOCK = threading.Lock()
+
+# configurations compiled by warm_graphs() at startup
+DEFAULT_GRAPH_CONFIGS = (
+    {},
+    {"use_async": True},
+)
+
+def _graph_key(options: dict) -> tuple:
+    # normalize against build_graph's defaults so get_graph() == get_graph(use_async=False)
+    bound = inspect.signature(build_graph).bind(**options)
+    bound.apply_defaults()
+    return tuple(sorted(bound.arguments.items()))
+
+def get_graph(**options):
+    """Return the compiled graph for build_graph(**options), compiling at most once."""
+    key = _graph_key(options)
+    graph = _GRAPHS.get(key)
+    if graph is None:
+        with _GRAPHS_LOCK:
+            graph = _GRAPHS.get(key)
+            if graph is None:
+                graph = _GRAPHS[key] = build_graph(**options)
+    return graph
+
+def warm_graphs(configs=DEFAULT_GRAPH_CONFIGS):
+    for options in configs:
+        get_graph(**options)
+
+def clear_graphs():
+    with _GRAPHS_LOCK:
+        _GRAPHS.clear()
@@ -0,0 +1,298 @@
+# app/inventory.py
+import asyncio, json, os, sqlite3, threading, time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from .metrics import missing_tokens
+from .telemetry import instrument
+
+# Story inventory: judged, passing stories generated off-peak and served at
+# request time right after classify/extract, skipping plan/tell/judge/revise.
+#
+#   python main.py inventory fill --db inventory.db --window 1-6    # nightly job
+#   STORYDAG_INVENTORY_DB=inventory.db python main.py serve          # serve from it
+#
+# Stories are bucketed by classification (category/mood/intended_use) and the
+# request's must_include terms. A request is served a story from its
+# classification bucket that contains every must_include term (missing_tokens),
+# preferring its exact term set, then the least-served, least-recently-served
+# story (rotation). Stories older than max_age_s or served max_serves times are
+# never served again and are dropped by prune(). Every lookup is recorded as
+# demand, so the fill job can target the must_include sets people ask for.
+
+# the values CLASSIFIER_PROMPT offers ("custom" is left to on-demand generation)
+CATEGORIES = ("animal", "friendship", "fantasy-gentle", "adventure-soft", "science-cosy")
+MOODS = ("very-soothing", "soothing", "light-playful")
+USES = ("bedtime", "general")
+
+def bucket_of(classification: Dict) -> str:
+    return "/".join((classification.get("category", "custom"), classification.get("mood", "soothing"),
+                     classification.get("intended_use", "bedtime")))
+
+def must_key(must_include: List[str]) -> str:
+    return "|".join(sorted({str(t).strip().lower() for t in must_include or [] if str(t).strip()}))
+
+
+class Inventory:
+    """SQLite story inventory; safe to share across threads, several processes
+    can point at one file (WAL)."""
+
+    def __init__(self, path: str, max_age_s: float = 14 * 86400, max_serves: int = 3, scan: int = 64):
+        self.path = path
+        self.max_age_s = max_age_s
+        self.max_serves = max_serves
+        self.scan = scan   # candidates checked per lookup
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS stories ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, bucket TEXT NOT NULL, must TEXT NOT NULL,"
+            " user_request TEXT NOT NULL, story TEXT NOT NULL, report TEXT NOT NULL,"
+            " created REAL NOT NULL, served INTEGER NOT NULL DEFAULT 0, last_served REAL NOT NULL DEFAULT 0,"
+            " plan TEXT NOT NULL DEFAULT '{}')"
+        )
+        if "plan" not in {r[1] for r in self._db.execute("PRAGMA table_info(stories)")}:
+            # files filled before plans were kept; their stories serve with an empty plan
+            self._db.execute("ALTER TABLE stories ADD COLUMN plan TEXT NOT NULL DEFAULT '{}'")
+        self._db.execute("CREATE INDEX IF NOT EXISTS stories_bucket ON stories(bucket, served, last_served)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS demand ("
+            " bucket TEXT NOT NULL, must TEXT NOT NULL, user_request TEXT NOT NULL,"
+            " hits INTEGER NOT NULL DEFAULT 0, misses INTEGER NOT NULL DEFAULT 0, last_seen REAL NOT NULL,"
+            " PRIMARY KEY (bucket, must))"
+        )
+
+    def _fresh(self, now: float) -> float:
+        return now - self.max_age_s
+
+    def put(self, state: Dict) -> int:
+        """Store a finished run (final_story + judge_report + plan); returns the story id."""
+        with self._lock:
+            cur = self._db.execute(
+                "INSERT INTO stories (bucket, must, user_request, story, report, created, plan)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (bucket_of(state["classification"]), must_key(state["constraints"].get("must_include")),
+                 state["user_request"], state["final_story"],
+                 json.dumps(state.get("judge_report", {}), ensure_ascii=False), time.time(),
+                 json.dumps(state.get("plan", {}), ensure_ascii=False)),
+            )
+            return cur.lastrowid
+
+    def take(self, classification: Dict, constraints: Dict, user_request: str = "") -> Optional[Dict]:
+        """A servable story for this request (its serve count is bumped), or None."""
+        bucket, terms = bucket_of(classification), constraints.get("must_include") or []
+        must, now = must_key(terms), time.time()
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, story, report, created, served, plan FROM stories"
+                " WHERE bucket = ? AND created >= ? AND served < ?"
+                " ORDER BY must = ? DESC, served, last_served LIMIT ?",
+                (bucket, self._fresh(now), self.max_serves, must, self.scan),
+            ).fetchall()
+            hit = next((r for r in rows if not missing_tokens(r[1], terms)), None)
+            if hit is not None:
+                self._db.execute("UPDATE stories SET served = served + 1, last_served = ? WHERE id = ?", (now, hit[0]))
+            self._db.execute(
+                "INSERT INTO demand (bucket, must, user_request, hits, misses, last_seen) VALUES (?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (bucket, must) DO UPDATE SET user_request = excluded.user_request,"
+                " hits = hits + excluded.hits, misses = misses + excluded.misses, last_seen = excluded.last_seen",
+                (bucket, must, user_request, int(hit is not None), int(hit is None), now),
+            )
+        if hit is None:
+            return None
+        sid, story, report, created, served, plan = hit
+        return {"id": sid, "story": story, "judge_report": json.loads(report), "plan": json.loads(plan),
+                "age_s": round(now - created, 1), "served": served + 1}
+
+    def live(self) -> Dict[Tuple[str, str], int]:
+        """{(bucket, must): servable stories}."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT bucket, must, COUNT(*) FROM stories WHERE created >= ? AND served < ? GROUP BY bucket, must",
+                (self._fresh(time.time()), self.max_serves),
+            ).fetchall()
+        return {(b, m): n for b, m, n in rows}
+
+    def popular(self, n: int) -> List[Tuple[str, str, str]]:
+        """The n most requested (bucket, must, sample request) with must_include terms."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT bucket, must, user_request FROM demand WHERE must != ''"
+                " ORDER BY hits + misses DESC, last_seen DESC LIMIT ?", (n,),
+            ).fetchall()
+
+    def prune(self) -> int:
+        """Drop stale and used-up stories; returns how many."""
+        with self._lock:
+            cur = self._db.execute("DELETE FROM stories WHERE created < ? OR served >= ?",
+                                   (self._fresh(time.time()), self.max_serves))
+            return cur.rowcount
+
+    def stats(self) -> Dict:
+        now = time.time()
+        with self._lock:
+            live, buckets = self._db.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT bucket || '#' || must) FROM stories WHERE created >= ? AND served < ?",
+                (self._fresh(now), self.max_serves),
+            ).fetchone()
+            (total,) = self._db.execute("SELECT COUNT(*) FROM stories").fetchone()
+            hits, misses = self._db.execute("SELECT COALESCE(SUM(hits), 0), COALESCE(SUM(misses), 0) FROM demand").fetchone()
+        return {
+            "stories": total,
+            "servable": live,
+            "buckets": buckets,
+            "lookups": hits + misses,
+            "hits": hits,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def _from_env() -> Optional[Inventory]:
+    # off unless STORYDAG_INVENTORY_DB names a file; _MAX_AGE_DAYS / _MAX_SERVES tune it
+    path = os.getenv("STORYDAG_INVENTORY_DB")
+    if not path:
+        return None
+    return Inventory(
+        path,
+        max_age_s=float(os.getenv("STORYDAG_INVENTORY_MAX_AGE_DAYS", "14")) * 86400,
+        max_serves=int(os.getenv("STORYDAG_INVENTORY_MAX_SERVES", "3")),
+    )
+
+_INVENTORY = None
+_LOADED = False
+
+def get_inventory() -> Optional[Inventory]:
+    # opened on first use, so importing the graph never touches the file
+    global _INVENTORY, _LOADED
+    if not _LOADED:
+        _INVENTORY, _LOADED = _from_env(), True
+    return _INVENTORY
+
+def configure_inventory(inventory: Optional[Inventory]) -> None:
+    """Install a process-wide inventory (None disables serving from it)."""
+    global _INVENTORY, _LOADED
+    _INVENTORY, _LOADED = inventory, True
+
+
+# --- Graph pieces
+
+@instrument("inventory_step")
+def inventory_node(state: dict) -> dict:
+    inv = get_inventory()
+    hit = inv.take(state["classification"], state["constraints"], state["user_request"]) if inv is not None else None
+    if hit is None:
+        return {"inventory": {"hit": False}}
+    out = {
+        "draft_story": hit["story"],
+        "judge_report": hit["judge_report"],
+        "inventory": {"hit": True, "id": hit["id"], "age_s": hit["age_s"], "served": hit["served"]},
+    }
+    if hit["plan"]:
+        out["plan"] = hit["plan"]   # feedback and re-judge size the story from its word_limit
+    return out
+
+def after_inventory(state: dict):
+    if state.get("inventory", {}).get("hit"):
+        return "hit"
+    return "miss"
+
+
+# --- Off-peak fill
+
+_CATEGORY_WORDS = {"animal": "animal", "friendship": "friendship", "fantasy-gentle": "gentle fantasy",
+                   "adventure-soft": "soft adventure", "science-cosy": "cosy science"}
+_MOOD_WORDS = {"very-soothing": "very soothing", "soothing": "soothing", "light-playful": "light, playful"}
+# varied per copy, so a bucket's stories aren't the same prompt (and story) again
+_SETTINGS = ("in a quiet meadow", "by the sea", "in a snowy forest", "in a little town", "under the stars",
+             "in a garden", "on a farm", "in the clouds")
+
+def request_for(bucket: str, must: str = "", copy: int = 0) -> str:
+    category, mood, use = bucket.split("/")
+    about = f" about {' and '.join(must.split('|'))}" if must else ""
+    tail = ", not a bedtime story" if use == "general" else ""
+    return (f"A {_MOOD_WORDS.get(mood, mood)} {_CATEGORY_WORDS.get(category, category)} story{about} "
+            f"{_SETTINGS[copy % len(_SETTINGS)]}{tail}.")
+
+def fill_targets(inv: Inventory, per_bucket: int = 2, popular: int = 20, per_popular: int = 3) -> Dict:
+    """{(bucket, must): (target, sample request)}: every classification combo,
+    plus the most requested must_include sets from recorded demand."""
+    targets = {}
+    for c in CATEGORIES:
+        for m in MOODS:
+            for u in USES:
+                b = f"{c}/{m}/{u}"
+                targets[(b, "")] = (per_bucket, request_for(b))
+    for b, must, req in inv.popular(popular):
+        targets[(b, must)] = (per_popular, req)
+    return targets
+
+def in_window(window: Optional[Tuple[int, int]], now: Optional[float] = None) -> bool:
+    """window=(start_hour, end_hour) local time, end exclusive; (22, 6) wraps midnight. None = always."""
+    if window is None:
+        return True
+    start, end = window
+    h = datetime.fromtimestamp(time.time() if now is None else now).hour
+    return start <= h < end if start <= end else (h >= start or h < end)
+
+def _stocked(live: Dict, bucket: str, must: str) -> int:
+    # stories that can serve this target: same bucket, a superset of its terms
+    want = set(must.split("|")) - {""}
+    return sum(n for (b, m), n in live.items() if b == bucket and want <= set(m.split("|")))
+
+def _passing(state: Dict) -> bool:
+    return state.get("judge_report", {}).get("verdict") == "pass" and bool(state.get("final_story"))
+
+async def fill(inv: Inventory, targets: Optional[Dict] = None, concurrency: int = 4,
+               max_stories: Optional[int] = None, window: Optional[Tuple[int, int]] = None,
+               **graph_options) -> Dict:
+    """Generate stories for every bucket below its target; returns run stats.
+    New jobs stop starting once `window` closes or max_stories is reached; a
+    story is kept only if its final text passes the judge, under the bucket its
+    own classification/constraints give it."""
+    from .graph import get_graph
+    from .nodes import ajudge_node
+    from .state import merge_update
+    targets = fill_targets(inv) if targets is None else targets
+    live = inv.live()
+    jobs = []
+    for (bucket, must), (target, request) in targets.items():
+        for i in range(_stocked(live, bucket, must), target):
+            jobs.append(request if i == 0 else request_for(bucket, must, i))
+    if max_stories is not None:
+        jobs = jobs[:max_stories]
+    # the fill must not serve itself, and near-duplicate requests should get fresh plans
+    graph = get_graph(use_async=True, inventory=False, plan_cache=False, **graph_options)
+    sem = asyncio.Semaphore(concurrency)
+    stats = {"planned": len(jobs), "stored": 0, "rejected": 0, "errors": 0, "deferred": 0}
+    t0 = time.perf_counter()
+
+    async def one(request):
+        async with sem:
+            if not in_window(window):
+                stats["deferred"] += 1
+                return
+            try:
+                state = await graph.ainvoke({"user_request": request, "revise_count": 0})
+                if state.get("judge_report", {}).get("verdict") != "pass" and state.get("final_story"):
+                    # revised after a failing judge: judge what would be served
+                    state["draft_story"] = state["final_story"]
+                    state = merge_update(state, await ajudge_node(state))
+            except Exception:
+                stats["errors"] += 1
+                return
+            if _passing(state):
+                inv.put(state)
+                stats["stored"] += 1
+            else:
+                stats["rejected"] += 1
+
+    await asyncio.gather(*(one(r) for r in jobs))
+    stats["elapsed_s"] = round(time.perf_counter() - t0, 2)
+    return stats
+
+def fill_sync(inv: Inventory, **kwargs) -> Dict:
+    return asyncio.run(fill(inv, **kwargs))
@@ -0,0 +1,568 @@
+# app/llm.py
+import asyncio, functools, itertools, math, os, random, threading, time
+from types import SimpleNamespace
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Optional
+from .telemetry import current_node, record_call
+
+# Shared LLM client layer: every node's call goes through LLMClient, which adds
+#   - one pooled HTTP client per flavour (sync / async) with keep-alive,
+#   - a token-bucket limiter on requests/min and estimated tokens/min,
+#   - per-node timeouts,
+#   - retries with exponential backoff + full jitter (Retry-After wins),
+#   - hedging: for HEDGE_NODES, if a call hasn't answered (a stream: sent its
+#     first token) by that node's recent p95, a duplicate is sent and the first
+#     answer wins.
+# The SDK's own retries are off (max_retries=0) so there is one retry policy.
+# openai/httpx (~1s of imports) load with the first LLMClient, not with this module.
+
+@functools.lru_cache(maxsize=None)
+def retryable():
+    """Exception types worth retrying (imports openai on first use)."""
+    from openai import RateLimitError, APIConnectionError, APITimeoutError, InternalServerError
+    return (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+
+# seconds; a stalled socket fails the call instead of hanging the story
+TIMEOUTS = {
+    "classify_step": 20.0,
+    "extract_step": 20.0,
+    "plan_step": 30.0,
+    "tell_step": 60.0,
+    "judge_step": 45.0,
+    "revise_step": 60.0,
+    "feedback_step": 60.0,
+}
+DEFAULT_TIMEOUT = 60.0
+
+# short, deterministic calls where a duplicate is cheap relative to the tail it cuts
+HEDGE_NODES = ("classify_step", "extract_step", "judge_step")
+
+def estimate_tokens(prompt: str, max_tokens: int) -> int:
+    # ~4 chars per token, plus the worst case for the reply
+    return len(prompt) // 4 + int(max_tokens)
+
+def _first_token(node) -> str:
+    # streams hedge on time to first token, kept apart from whole-call latency
+    return f"{node}:first_token"
+
+def _estimated_usage(prompt: str, chars: int):
+    # a stream closed early never gets its usage chunk; approximate it
+    pt, ct = len(prompt) // 4, chars // 4
+    return SimpleNamespace(prompt_tokens=pt, completion_tokens=ct, total_tokens=pt + ct, estimated=True)
+
+def retry_after(err) -> Optional[float]:
+    """Seconds the server asked us to wait (retry-after-ms / retry-after), if any."""
+    headers = getattr(getattr(err, "response", None), "headers", None)
+    if headers is None:
+        return None
+    for name, scale in (("retry-after-ms", 1000.0), ("retry-after", 1.0)):
+        try:
+            return float(headers.get(name)) / scale
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+class TokenBucket:
+    """
+    `rate` units per minute, bursting up to `capacity`. reserve() debits right
+    away (the level may go negative) and returns how long the caller must wait,
+    so waiters are served in arrival order and sync/async callers share it.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate / 60.0
+        self.capacity = capacity or rate
+        self._level = self.capacity
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._level = min(self.capacity, self._level + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    def reserve(self, n: float, block: bool = True) -> Optional[float]:
+        """-> seconds to wait; with block=False, None (and no debit) unless n is available now."""
+        n = min(n, self.capacity)
+        with self._lock:
+            self._refill()
+            if not block and self._level < n:
+                return None
+            self._level -= n
+            return max(0.0, -self._level / self.rate)
+
+    def credit(self, n: float) -> None:
+        with self._lock:
+            self._level = min(self.capacity, self._level + n)
+
+
+class RateLimiter:
+    """Requests/min and tokens/min budgets; 0 or None disables a budget."""
+
+    def __init__(self, rpm: Optional[float] = None, tpm: Optional[float] = None):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+
+    def reserve(self, tokens: int, block: bool = True) -> Optional[float]:
+        if not block:
+            # all-or-nothing so a skipped hedge leaves both buckets untouched
+            if self.requests is not None and self.requests.reserve(1, block=False) is None:
+                return None
+            if self.tokens is not None and self.tokens.reserve(tokens, block=False) is None:
+                if self.requests is not None:
+                    self.requests.credit(1)
+                return None
+            return 0.0
+        waits = [0.0]
+        if self.requests is not None:
+            waits.append(self.requests.reserve(1))
+        if self.tokens is not None:
+            waits.append(self.tokens.reserve(tokens))
+        return max(waits)
+
+    def settle(self, estimated: int, usage) -> None:
+        # give back what the estimate over-charged once real usage is known
+        if self.tokens is not None and usage is not None:
+            used = getattr(usage, "total_tokens", 0) or 0
+            if used and used < estimated:
+                self.tokens.credit(estimated - used)
+
+    def refund(self, tokens: int) -> None:
+        # a failed attempt generated nothing: give its tokens back before the
+        # retry reserves them again (the request itself did go out, so it keeps
+        # its slot in the requests/min budget)
+        if self.tokens is not None:
+            self.tokens.credit(tokens)
+
+    def acquire(self, tokens: int) -> None:
+        delay = self.reserve(tokens)
+        if delay:
+            time.sleep(delay)
+
+    async def aacquire(self, tokens: int) -> None:
+        delay = self.reserve(tokens)
+        if delay:
+            await asyncio.sleep(delay)
+
+
+class LatencyWindow:
+    """Rolling window of recent call latencies per node, for hedge delays."""
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.size = size
+        self.min_samples = min_samples
+        self._data: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def add(self, node: str, latency_s: float) -> None:
+        with self._lock:
+            self._data.setdefault(node, deque(maxlen=self.size)).append(latency_s)
+
+    def p95(self, node: str) -> Optional[float]:
+        with self._lock:
+            xs = sorted(self._data.get(node, ()))
+        if len(xs) < self.min_samples:
+            return None
+        return xs[max(0, math.ceil(0.95 * len(xs)) - 1)]
+
+
+class LLMClient:
+    """Pooled, rate-limited, retrying, hedging front for the chat-completions API."""
+
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 rpm: Optional[float] = None, tpm: Optional[float] = None,
+                 max_connections: int = 100, max_keepalive: int = 20,
+                 max_retries: int = 4, base_delay: float = 0.5, max_delay: float = 20.0,
+                 timeouts: Optional[Dict[str, float]] = None,
+                 hedge_nodes=HEDGE_NODES, hedge_min_samples: int = 20):
+        import httpx
+        from openai import OpenAI, AsyncOpenAI
+        api_key = api_key or os.getenv("OPENAI_API_KEY")
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive,
+                              keepalive_expiry=30.0)
+        timeout = httpx.Timeout(DEFAULT_TIMEOUT, connect=5.0)
+        self.client = OpenAI(api_key=api_key, base_url=base_url, max_retries=0,
+                             http_client=httpx.Client(limits=limits, timeout=timeout))
+        self.aclient = AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0,
+                                   http_client=httpx.AsyncClient(limits=limits, timeout=timeout))
+        self.limiter = RateLimiter(rpm, tpm)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeouts = {**TIMEOUTS, **(timeouts or {})}
+        self.hedge_nodes = set(hedge_nodes or ())
+        self.latency = LatencyWindow(min_samples=hedge_min_samples)
+        self.stats = {"calls": 0, "retries": 0, "hedges": 0, "hedge_wins": 0}
+        self._pool = None   # threads for sync hedging, created on first hedge
+        self._lock = threading.Lock()
+
+    def _bump(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self.stats[key] += n
+
+    def _backoff(self, attempt: int, err) -> float:
+        delay = retry_after(err)
+        if delay is None:
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        return delay
+
+    def _request(self, model, prompt, temperature, max_tokens, node, response_format=None, **extra) -> Dict:
+        if response_format is not None:
+            extra["response_format"] = response_format
+        return dict(model=model, messages=[{"role": "user", "content": prompt}],
+                    temperature=temperature, max_tokens=max_tokens,
+                    timeout=self.timeouts.get(node, DEFAULT_TIMEOUT), **extra)
+
+    def _hedge_after(self, node) -> Optional[float]:
+        return self.latency.p95(node) if node in self.hedge_nodes else None
+
+    # --- plain completions
+
+    def _once(self, req: Dict, node, estimated: int):
+        t = time.perf_counter()
+        try:
+            res = self.client.chat.completions.create(**req)
+        except Exception:
+            self.limiter.refund(estimated)
+            raise
+        self.latency.add(node, time.perf_counter() - t)
+        self.limiter.settle(estimated, res.usage)
+        return res
+
+    def _hedged(self, req: Dict, node, estimated: int):
+        delay = self._hedge_after(node)
+        if delay is None:
+            return self._once(req, node, estimated), False
+        if self._pool is None:
+            with self._lock:
+                self._pool = self._pool or ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-hedge")
+        first = self._pool.submit(self._once, req, node, estimated)
+        done, _ = wait([first], timeout=delay)
+        # only hedge when the budget has room right now; never queue for a duplicate
+        if done or self.limiter.reserve(estimated, block=False) is None:
+            return first.result(), False
+        self._bump("hedges")
+        second = self._pool.submit(self._once, req, node, estimated)
+        pending, err = {first, second}, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                if f.exception() is None:
+                    # the loser can't be interrupted mid-request; it finishes and is dropped
+                    if f is second:
+                        self._bump("hedge_wins")
+                    return f.result(), f is second
+                err = f.exception()
+        raise err
+
+    def complete(self, model: str, prompt: str, temperature: float, max_tokens: int,
+                 response_format: Optional[Dict] = None) -> str:
+        node = current_node()
+        req = self._request(model, prompt, temperature, max_tokens, node, response_format)
+        estimated = estimate_tokens(prompt, max_tokens)
+        t = time.perf_counter()
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire(estimated)
+            try:
+                res, hedged = self._hedged(req, node, estimated)
+                break
+            except retryable() as e:
+                if attempt == self.max_retries:
+                    raise
+                self._bump("retries")
+                time.sleep(self._backoff(attempt, e))
+        self._bump("calls")
+        record_call(model, time.perf_counter() - t, res.usage, retries=attempt, hedged=hedged)
+        return res.choices[0].message.content
+
+    async def _aonce(self, req: Dict, node, estimated: int):
+        t = time.perf_counter()
+        try:
+            res = await self.aclient.chat.completions.create(**req)
+        except Exception:
+            self.limiter.refund(estimated)
+            raise
+        self.latency.add(node, time.perf_counter() - t)
+        self.limiter.settle(estimated, res.usage)
+        return res
+
+    async def _ahedged(self, req: Dict, node, estimated: int):
+        delay = self._hedge_after(node)
+        if delay is None:
+            return await self._aonce(req, node, estimated), False
+        first = asyncio.ensure_future(self._aonce(req, node, estimated))
+        tasks = [first]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done or self.limiter.reserve(estimated, block=False) is None:
+                return await first, False
+            self._bump("hedges")
+            second = asyncio.ensure_future(self._aonce(req, node, estimated))
+            tasks.append(second)
+            pending, err = set(tasks), None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for f in done:
+                    if f.exception() is None:
+                        if f is second:
+                            self._bump("hedge_wins")
+                        return f.result(), f is second
+                    err = f.exception()
+            raise err
+        finally:
+            for f in tasks:   # cancel the loser (and both, if we were cancelled)
+                f.cancel()
+
+    async def acomplete(self, model: str, prompt: str, temperature: float, max_tokens: int,
+                        response_format: Optional[Dict] = None) -> str:
+        node = current_node()
+        req = self._request(model, prompt, temperature, max_tokens, node, response_format)
+        estimated = estimate_tokens(prompt, max_tokens)
+        t = time.perf_counter()
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.aacquire(estimated)
+            try:
+                res, hedged = await self._ahedged(req, node, estimated)
+                break
+            except retryable() as e:
+                if attempt == self.max_retries:
+                    raise
+                self._bump("retries")
+                await asyncio.sleep(self._backoff(attempt, e))
+        self._bump("calls")
+        record_call(model, time.perf_counter() - t, res.usage, retries=attempt, hedged=hedged)
+        return res.choices[0].message.content
+
+    # --- streaming (retried until the first token; HEDGE_NODES race a second
+    # stream once the first token is later than that node's recent p95)
+
+    def _open(self, req: Dict, node, estimated: int):
+        # -> (stream, chunks read up to and including its first text)
+        t = time.perf_counter()
+        try:
+            stream = self.client.chat.completions.create(**req)
+        except Exception:
+            self.limiter.refund(estimated)
+            raise
+        head = []
+        try:
+            for chunk in iter(lambda: next(stream, None), None):
+                head.append(chunk)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    break
+        except BaseException:
+            stream.close()
+            self.limiter.refund(estimated)
+            raise
+        self.latency.add(_first_token(node), time.perf_counter() - t)
+        return stream, head
+
+    def _dropped(self, req: Dict, estimated: int) -> None:
+        # a hedge loser was hung up on: it used its prompt, not its reply
+        self.limiter.settle(estimated, _estimated_usage(req["messages"][0]["content"], 0))
+
+    def _drop(self, stream, req: Dict, estimated: int) -> None:
+        stream.close()
+        self._dropped(req, estimated)
+
+    def _hedged_open(self, req: Dict, node, estimated: int):
+        delay = self.latency.p95(_first_token(node)) if node in self.hedge_nodes else None
+        if delay is None:
+            return self._open(req, node, estimated), False
+        if self._pool is None:
+            with self._lock:
+                self._pool = self._pool or ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-hedge")
+        first = self._pool.submit(self._open, req, node, estimated)
+        done, _ = wait([first], timeout=delay)
+        if done or self.limiter.reserve(estimated, block=False) is None:
+            return first.result(), False
+        self._bump("hedges")
+        second = self._pool.submit(self._open, req, node, estimated)
+        pending, err = {first, second}, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                if f.exception() is None:
+                    loser = second if f is first else first
+                    # the loser's open can't be interrupted; close it when it lands
+                    loser.add_done_callback(lambda l: l.exception() is None and self._drop(l.result()[0], req, estimated))
+                    if f is second:
+                        self._bump("hedge_wins")
+                    return f.result(), f is second
+                err = f.exception()
+        raise err
+
+    def stream(self, model: str, prompt: str, temperature: float, max_tokens: int,
+               response_format: Optional[Dict] = None):
+        """Yields text deltas. Closing the generator early drops the connection."""
+        node = current_node()
+        req = self._request(model, prompt, temperature, max_tokens, node, response_format,
+                            stream=True, stream_options={"include_usage": True})
+        estimated = estimate_tokens(prompt, max_tokens)
+        t = time.perf_counter()
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire(estimated)
+            try:
+                (stream, head), hedged = self._hedged_open(req, node, estimated)
+                break
+            except retryable() as e:
+                if attempt == self.max_retries:
+                    raise
+                self._bump("retries")
+                time.sleep(self._backoff(attempt, e))
+        self._bump("calls")
+        first, usage, chars = None, None, 0
+        try:
+            for chunk in itertools.chain(head, stream):
+                usage = chunk.usage or usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if first is None:
+                        first = time.perf_counter() - t
+                    chars += len(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+        finally:
+            # also runs when the consumer stops early: drop the connection, keep the record
+            stream.close()
+            usage = usage or _estimated_usage(prompt, chars)
+            self.limiter.settle(estimated, usage)
+            record_call(model, time.perf_counter() - t, usage, retries=attempt, hedged=hedged,
+                        ttft_ms=round((first or 0.0) * 1000.0, 1))
+
+    async def _aopen(self, req: Dict, node, estimated: int):
+        t = time.perf_counter()
+        try:
+            stream = await self.aclient.chat.completions.create(**req)
+        except Exception:
+            self.limiter.refund(estimated)
+            raise
+        head = []
+        try:
+            while True:
+                try:
+                    chunk = await stream.__anext__()
+                except StopAsyncIteration:
+                    break
+                head.append(chunk)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    break
+        except BaseException:   # cancelled hedge losers too
+            await stream.close()
+            self.limiter.refund(estimated)
+            raise
+        self.latency.add(_first_token(node), time.perf_counter() - t)
+        return stream, head
+
+    async def _ahedged_open(self, req: Dict, node, estimated: int):
+        delay = self.latency.p95(_first_token(node)) if node in self.hedge_nodes else None
+        if delay is None:
+            return await self._aopen(req, node, estimated), False
+        first = asyncio.ensure_future(self._aopen(req, node, estimated))
+        tasks, winner = [first], None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done or self.limiter.reserve(estimated, block=False) is None:
+                winner = first
+                return await first, False
+            self._bump("hedges")
+            second = asyncio.ensure_future(self._aopen(req, node, estimated))
+            tasks.append(second)
+            pending, err = set(tasks), None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for f in done:
+                    if f.exception() is None:
+                        winner = f
+                        if f is second:
+                            self._bump("hedge_wins")
+                        return f.result(), f is second
+                    err = f.exception()
+            raise err
+        finally:
+            for f in tasks:
+                if f is winner:
+                    continue
+                if f.done() and not f.cancelled() and f.exception() is None:
+                    stream = f.result()[0]   # opened in the same tick as the winner
+                    await stream.close()
+                    self._dropped(req, estimated)
+                else:
+                    f.cancel()   # _aopen closes its stream
+
+    async def astream(self, model: str, prompt: str, temperature: float, max_tokens: int,
+                      response_format: Optional[Dict] = None):
+        node = current_node()
+        req = self._request(model, prompt, temperature, max_tokens, node, response_format,
+                            stream=True, stream_options={"include_usage": True})
+        estimated = estimate_tokens(prompt, max_tokens)
+        t = time.perf_counter()
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.aacquire(estimated)
+            try:
+                (stream, head), hedged = await self._ahedged_open(req, node, estimated)
+                break
+            except retryable() as e:
+                if attempt == self.max_retries:
+                    raise
+                self._bump("retries")
+                await asyncio.sleep(self._backoff(attempt, e))
+        self._bump("calls")
+        first, usage, chars = None, None, 0
+        try:
+            while True:
+                if head:
+                    chunk = head.pop(0)
+                else:
+                    try:
+                        chunk = await stream.__anext__()
+                    except StopAsyncIteration:
+                        break
+                usage = chunk.usage or usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if first is None:
+                        first = time.perf_counter() - t
+                    chars += len(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+        finally:
+            await stream.close()
+            usage = usage or _estimated_usage(prompt, chars)
+            self.limiter.settle(estimated, usage)
+            record_call(model, time.perf_counter() - t, usage, retries=attempt, hedged=hedged,
+                        ttft_ms=round((first or 0.0) * 1000.0, 1))
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+def _default_client() -> LLMClient:
+    # STORYDAG_RPM / STORYDAG_TPM: account limits (0 = unlimited);
+    # STORYDAG_HEDGE=off disables hedging
+    return LLMClient(
+        rpm=_env_float("STORYDAG_RPM", 3500),
+        tpm=_env_float("STORYDAG_TPM", 200_000),
+        max_retries=int(_env_float("STORYDAG_MAX_RETRIES", 4)),
+        hedge_nodes=() if os.getenv("STORYDAG_HEDGE", "").lower() == "off" else HEDGE_NODES,
+    )
+
+_CLIENT: Optional[LLMClient] = None
+_CLIENT_LOCK = threading.Lock()
+
+def get_client() -> LLMClient:
+    global _CLIENT
+    if _CLIENT is None:
+        with _CLIENT_LOCK:
+            if _CLIENT is None:
+                _CLIENT = _default_client()
+    return _CLIENT
+
+def configure_client(client: Optional[LLMClient] = None, **kwargs) -> LLMClient:
+    """Install `client`, or build one from LLMClient kwargs, e.g.
+    configure_client(base_url=srv.base_url, api_key="fake", rpm=0, tpm=0)."""
+    global _CLIENT
+    with _CLIENT_LOCK:
+        _CLIENT = client if client is not None else LLMClient(**kwargs)
+    return _CLIENT
@@ -1,40 +1,70 @@
 # app/metrics.py
-import re
-from typing import Dict, List
+import functools, re
+from typing import Dict, List, Optional, Sequence, Tuple
 
 DQUOTE = re.compile(r"\"[^\"]+\"|'[^']+'")
 SPLIT_SENT = re.compile(r'([.!?])')
+WORD = re.compile(r"\b[\w']+\b")
+ASCII_LETTERS = b"abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"
+TERMINATORS = ".!?"
 
 def split_sentences(text: str) -> List[str]:
     chunks = SPLIT_SENT.split(text)
     sents = ["".join(chunks[i:i+2]).strip() for i in range(0, len(chunks), 2)]
     return [s for s in sents if s]
 
+def text_counts(text: str) -> Tuple[int, int, int, int]:
+    """
+    (words, letters, sentences, dialogue_lines) for text, without splitting it
+    into sentences. Same results as the per-function helpers below:
+    - words never contain .!?, so per-sentence word counts sum to the total;
+    - split_sentences yields one non-empty chunk per terminator, plus one for
+      non-blank text after the last terminator.
+    Each count is a single C-level scan (regex / str.count / bytes.translate);
+    a Python loop over one combined token regex measured slower.
+    """
+    words = WORD.subn("", text)[1]   # count matches without building a list
+    letters = _ascii_letters(text)
+    terms = sum(map(text.count, TERMINATORS))
+    last = max(text.rfind(c) for c in TERMINATORS)
+    sentences = terms + (1 if text[last + 1:].strip() else 0)
+    return words, letters, sentences, len(DQUOTE.findall(text))
+
+def _ascii_letters(text: str) -> int:
+    # UTF-8 never encodes a non-ASCII char with ASCII bytes, so counting bytes is exact
+    b = text.encode("utf-8")
+    return len(b) - len(b.translate(None, ASCII_LETTERS))
+
 def word_count(text: str) -> int:
-    return len(re.findall(r"\b[\w']+\b", text))
+    return WORD.subn("", text)[1]
 
 def letter_count(text: str) -> int:
-    return len(re.findall(r"[A-Za-z]", text))
+    return _ascii_letters(text)
 
 def dialogue_lines(text: str) -> int:
     # crude heuristic: each quoted span counts as one line of dialogue
     return len(DQUOTE.findall(text))
 
-def avg_sentence_len(text: str) -> float:
-    sents = split_sentences(text)
-    if not sents:
-        return 0.0
-    return sum(word_count(s) for s in sents) / len(sents)
+def _avg_sentence_len(words: int, sentences: int) -> float:
+    return words / sentences if sentences else 0.0
 
-def coleman_liau_index(text: str) -> float:
+def _coleman_liau(words: int, letters: int, sentences: int) -> float:
     # CLI = 0.0588 * L - 0.296 * S - 15.8
     # L = letters per 100 words; S = sentences per 100 words
-    wc = max(word_count(text), 1)
-    sc = max(len(split_sentences(text)), 1)
-    L = letter_count(text) * 100.0 / wc
+    wc = max(words, 1)
+    sc = max(sentences, 1)
+    L = letters * 100.0 / wc
     S = sc * 100.0 / wc
     return 0.0588 * L - 0.296 * S - 15.8
 
+def avg_sentence_len(text: str) -> float:
+    words, _, sentences, _ = text_counts(text)
+    return _avg_sentence_len(words, sentences)
+
+def coleman_liau_index(text: str) -> float:
+    words, letters, sentences, _ = text_counts(text)
+    return _coleman_liau(words, letters, sentences)
+
 def has_bedtime_tail(text: str) -> bool:
     return text.strip().endswith(("Good night.", "Goodnight.", "Sleep well.", "Sweet dreams."))
 
@@ -47,12 +77,7 @@ def missing_tokens(text: str, tokens: List[str]) -> List[str]:
             miss.append(t)
     return miss
 
-def compute_metrics(
-    story: str,
-    must_include: List[str],
-    intended_use: str,
-    word_limit: int
-) -> Dict:
+def _coerce_limit(word_limit) -> int:
     # coerce word_limit defensively
     try:
         if not isinstance(word_limit, int):
@@ -67,12 +92,23 @@ def compute_metrics(
                 word_limit = 500
     except:
         word_limit = 500
-    wc = word_count(story)
-    avg_len = avg_sentence_len(story)
-    cli = coleman_liau_index(story)
-    dlg = dialogue_lines(story)
-    miss = missing_tokens(story, must_include or [])
-    tail_ok = (intended_use != "bedtime") or has_bedtime_tail(story)
+    return word_limit
+
+def compute_metrics(
+    story: str,
+    must_include: List[str],
+    intended_use: str,
+    word_limit: int
+) -> Dict:
+    word_limit = _coerce_limit(word_limit)
+    wc, letters, sents, dlg = text_counts(story)
+    return _metrics(wc, letters, sents, dlg, missing_tokens(story, must_include or []),
+                    has_bedtime_tail(story), intended_use, word_limit)
+
+def _metrics(wc, letters, sents, dlg, miss, tail, intended_use, word_limit) -> Dict:
+    avg_len = _avg_sentence_len(wc, sents)
+    cli = _coleman_liau(wc, letters, sents)
+    tail_ok = (intended_use != "bedtime") or tail
     return {
         "word_count": wc,
         "over_word_limit": wc > word_limit,
@@ -85,3 +121,221 @@ def compute_metrics(
         "intended_use": intended_use,
         "word_limit": word_limit,
     }
+
+
+class MetricsAccumulator:
+    """
+    compute_metrics for text that arrives in chunks (a streamed draft), without
+    rescanning: each chunk is counted once. snapshot() equals compute_metrics on
+    the text so far. How the running counts stay exact:
+    - words never contain whitespace, so text up to the last whitespace is
+      counted and only the unfinished word is carried over;
+    - a quoted span is final once it closes; an opening quote with no closer
+      yet is parked and re-tried only when a chunk brings that quote char;
+    - letters, terminators and must_include terms are only needed by
+      snapshot(), so they are counted there, over the text since the last
+      snapshot (plus the overlap a term could straddle).
+    feed() keeps just word_count and dialogue current, the two the stream
+    guard checks per token.
+    """
+
+    def __init__(self, must_include: List[str], intended_use: str, word_limit):
+        self.intended_use = intended_use
+        self.word_limit = _coerce_limit(word_limit)
+        self._terms = [t for t in (str(t).strip().lower() for t in must_include or []) if t]
+        self._missing = set(self._terms)
+        self._overlap = max((len(t) for t in self._terms), default=1) - 1
+        self._parts: List[str] = []
+        self._low_tail = ""      # last _overlap chars, lowercased
+        self._word_tail = ""     # text after the last whitespace, not yet counted
+        self.words = 0
+        self.letters = 0         # letters/terminators/missing: up to _counted only
+        self._counted = 0
+        self._terms_seen = 0     # sentence terminators
+        self._open_sentence = False   # non-blank text after the last terminator
+        self.dialogue = 0        # closed quoted spans
+        self._dq_buf = ""        # text from the first unresolved quote on
+        self._dq_wait = None     # quote char the unclosed span at _dq_buf[0] needs
+
+    def feed(self, chunk: str) -> None:
+        if not chunk:
+            return
+        self._parts.append(chunk)
+        if chunk[-1].isspace():
+            self.words += word_count(self._word_tail + chunk)
+            self._word_tail = ""
+        else:
+            parts = chunk.rsplit(None, 1)
+            if len(parts) == 2 or chunk[0].isspace():
+                self.words += word_count(self._word_tail + (parts[0] if len(parts) == 2 else ""))
+                self._word_tail = parts[-1]
+            else:
+                self._word_tail += chunk
+        if self._dq_wait is None:
+            if '"' in chunk or "'" in chunk:
+                self._scan_dialogue(chunk)
+        else:
+            self._dq_buf += chunk
+            if self._dq_wait in chunk:
+                self._scan_dialogue("")
+
+    def _catch_up(self, text: str) -> None:
+        new = text[self._counted:]
+        if not new:
+            return
+        self._counted = len(text)
+        self.letters += _ascii_letters(new)
+        terms = new.count(".") + new.count("!") + new.count("?")
+        if terms:
+            self._terms_seen += terms
+            last = max(new.rfind("."), new.rfind("!"), new.rfind("?"))
+            self._open_sentence = bool(new[last + 1:].strip())
+        elif not self._open_sentence and new.strip():
+            self._open_sentence = True
+        if self._missing:
+            window = self._low_tail + new.lower()
+            self._missing -= {t for t in self._missing if t in window}
+            self._low_tail = window[-self._overlap:] if self._overlap else ""
+
+    @property
+    def text(self) -> str:
+        if len(self._parts) > 1:
+            self._parts = ["".join(self._parts)]
+        return self._parts[0] if self._parts else ""
+
+    def _scan_dialogue(self, chunk: str) -> None:
+        text, pos = self._dq_buf + chunk, 0
+        while True:
+            q = min((i for i in (text.find('"', pos), text.find("'", pos)) if i >= 0), default=-1)
+            if q < 0:
+                self._dq_buf, self._dq_wait = "", None
+                return
+            m = DQUOTE.match(text, q)
+            if m is not None:
+                self.dialogue += 1
+                pos = m.end()
+            elif q + 1 < len(text) and text[q + 1] == text[q]:
+                pos = q + 1      # empty quotes never match, whatever follows
+            else:
+                self._dq_buf, self._dq_wait = text[q:], text[q]   # may still close
+                return
+
+    @property
+    def word_count(self) -> int:
+        return self.words + word_count(self._word_tail)
+
+    def snapshot(self) -> Dict:
+        """compute_metrics(text so far); an unclosed quote counts as open/unmatched."""
+        text = self.text
+        self._catch_up(text)
+        # the regex would give up on a span that never closed and rescan after it
+        dlg = self.dialogue + (len(DQUOTE.findall(self._dq_buf, 1)) if self._dq_wait else 0)
+        miss = [t for t in self._terms if t in self._missing]
+        sents = self._terms_seen + (1 if self._open_sentence else 0)
+        return _metrics(self.word_count, self.letters, sents, dlg, miss, has_bedtime_tail(text),
+                        self.intended_use, self.word_limit)
+
+
+BATCH_FIELDS = ("word_count", "letters", "sentences", "dialogue_lines", "avg_sentence_len", "coleman_liau_index")
+BATCH_BLOCK = 4096   # stories per joined buffer; bounds the numpy temporaries
+
+# byte classes for the vectorized counts (UTF-8; non-ASCII chars classed per block)
+_WORD, _APOS, _LETTER, _TERM = 1, 2, 4, 8
+_DQUOTE_JOINED = re.compile(r"\"[^\"\x00]+\"|'[^'\x00]+'")   # DQUOTE that stops at a story boundary
+_NON_ASCII = re.compile(r"[^\x00-\x7f]")
+
+@functools.lru_cache(maxsize=None)
+def _byte_classes():
+    import numpy as np
+    cls = np.zeros(256, np.uint8)
+    for i in range(128):
+        c = chr(i)
+        cls[i] = ((_WORD if c.isalnum() or c == "_" else 0) | (_APOS if c == "'" else 0)
+                  | (_LETTER if c.isalpha() else 0) | (_TERM if c in TERMINATORS else 0))
+    return cls
+
+def batch_counts(stories: Sequence[str]):
+    """
+    text_counts for each story as an (n, 4) int64 array, counted over the
+    stories joined into one NUL-separated buffer:
+    - letters and terminators are byte-class sums per story (np.add.reduceat);
+    - a WORD match is a maximal run of [\\w'] holding a \\w char (the \\b's trim
+      the quotes), so with apostrophes dropped the words are the starts of
+      word-char runs;
+    - dialogue is one DQUOTE scan of the buffer that can't cross a NUL, and the
+      open-sentence tail is a per-story rfind/strip.
+    """
+    import numpy as np
+    n = len(stories)
+    text = "\x00".join(stories) + "\x00"   # every story ends at a NUL, empty ones too
+    if n == 0 or text.count("\x00") != n:
+        return np.array([text_counts(s) for s in stories], dtype=np.int64).reshape(-1, 4)
+    b = np.frombuffer(text.encode("utf-8"), np.uint8)
+    cls = _byte_classes()[b]
+    if not text.isascii():
+        # class each non-ASCII char by its lead byte and copy that to its continuation bytes
+        lead = np.flatnonzero(b >= 0xC0)
+        cls[lead] = [_WORD if c.isalnum() else 0 for c in _NON_ASCII.findall(text)]
+        size = 2 + (b[lead] >= 0xE0) + (b[lead] >= 0xF0)
+        for k in (1, 2, 3):
+            sel = lead[size > k]
+            cls[sel + k] = cls[sel]
+    seps = np.flatnonzero(b == 0)
+    seg = np.r_[0, seps[:-1] + 1]
+    letters = np.add.reduceat((cls & _LETTER) != 0, seg, dtype=np.int64)
+    terms = np.add.reduceat((cls & _TERM) != 0, seg, dtype=np.int64)
+
+    apos = np.flatnonzero(cls & _APOS)
+    word = (cls[(cls & _APOS) == 0] & _WORD) != 0
+    starts = word.copy()
+    starts[1:] &= ~word[:-1]
+    words = np.add.reduceat(starts, np.r_[0, (seps - np.searchsorted(apos, seps))[:-1] + 1], dtype=np.int64)
+
+    ends = np.cumsum([len(s) + 1 for s in stories]) - 1   # char offset of each story's NUL
+    spans = np.fromiter((m.start() for m in _DQUOTE_JOINED.finditer(text)), np.int64)
+    dialogue = np.bincount(np.searchsorted(ends, spans), minlength=n)
+    tails = np.fromiter((bool(s[max(map(s.rfind, TERMINATORS)) + 1:].strip()) for s in stories), np.int64, n)
+    return np.stack([words, letters, terms + tails, dialogue], axis=1)
+
+def compute_metrics_batch(
+    stories: Sequence[str],
+    word_limit: Optional[int] = None,
+    processes: Optional[int] = None,
+    chunksize: int = BATCH_BLOCK,
+) -> Dict:
+    """
+    Columnar metrics for a corpus: returns {field: numpy array} for BATCH_FIELDS
+    (plus "over_word_limit" when word_limit is given), index-aligned with stories.
+    Values match compute_metrics (rounded to 2 places like it).
+
+    Counts come from batch_counts over blocks of `chunksize` stories;
+    processes > 1 spreads the blocks over a process pool. The formulas are
+    applied vectorized.
+    """
+    import numpy as np   # only batch users pay for numpy
+
+    blocks = [stories[i:i + chunksize] for i in range(0, len(stories), chunksize)]
+    if processes and processes > 1 and len(blocks) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=processes) as ex:
+            parts = list(ex.map(batch_counts, blocks))
+    else:
+        parts = [batch_counts(b) for b in blocks]
+
+    arr = np.concatenate(parts) if parts else np.zeros((0, 4), dtype=np.int64)
+    wc, letters, sents, dlg = arr[:, 0], arr[:, 1], arr[:, 2], arr[:, 3]
+    wc1 = np.maximum(wc, 1)
+    sc1 = np.maximum(sents, 1)
+    cli = 0.0588 * (letters * 100.0 / wc1) - 0.296 * (sc1 * 100.0 / wc1) - 15.8
+    avg = np.where(sents > 0, wc / sc1, 0.0)
+    out = {
+        "word_count": wc,
+        "letters": letters,
+        "sentences": sents,
+        "dialogue_lines": dlg,
+        "avg_sentence_len": np.round(avg, 2),
+        "coleman_liau_index": np.round(cli, 2),
+    }
+    if word_limit is not None:
+        out["over_word_limit"] = wc > word_limit
+    return out
@@ -1,122 +1,451 @@
 # app/nodes.py
-import os, json
-from openai import OpenAI
+import functools, json, os
 from .prompts import (
     CLASSIFIER_PROMPT, EXTRACT_PROMPT, PLANNER_PROMPT, STORYTELLER_PROMPT,
-    JUDGE_PROMPT, REVISER_PROMPT, FEEDBACK_REVISER_PROMPT
+    JUDGE_PROMPT, JUDGE_REPLY_FORMAT, JUDGE_EVIDENCE_FORMAT, REVISER_PROMPT, FEEDBACK_REVISER_PROMPT,
+    REVISER_EDIT_PROMPT, FEEDBACK_EDIT_PROMPT, EDIT_REPLY_FORMAT
 )
-from .utils import extract_json, with_goodnight, force_list, coerce_int
-from .safety import unsafe
-from .metrics import compute_metrics
+from .utils import extract_json, with_goodnight, force_list, coerce_int, JSONStream
+from .safety import get_scanner
+from .metrics import compute_metrics, MetricsAccumulator
+from .cache import get_cache, cache_key
+from .telemetry import instrument, record_call
+from .llm import get_client
+from .repair import FIX_TRIM, FIX_DIALOGUE, FIX_TAIL, FIX_FINISH, MECHANICAL_FIXES, local_faults, unfixable
+from .budget import compact, fit, story_max_tokens
+from .edits import EditableStory, EditError, parse_edits
 
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 MODEL = "gpt-3.5-turbo"  # do not change
 
-def _chat(prompt: str, temperature=0.6, max_tokens=700) -> str:
-    res = client.chat.completions.create(
-        model=MODEL,
-        messages=[{"role": "user", "content": prompt}],
-        temperature=temperature,
-        max_tokens=max_tokens
-    )
-    return res.choices[0].message.content.strip()
+# classify/extract/plan/judge replies are JSON: ask for JSON mode so the model
+# can't wrap or truncate them into prose (the parser still repairs cut-offs)
+JSON_MODE = {"type": "json_object"}
 
-def classify_node(state: dict) -> dict:
-    raw = _chat(CLASSIFIER_PROMPT.format(user_request=state["user_request"]), temperature=0.2, max_tokens=300)
+# The judge is streamed and cut off once these keys are complete; the evidence
+# block after them is ~half the reply and nothing downstream reads it.
+# STORYDAG_JUDGE_EVIDENCE=1 keeps the full report (one non-streamed call).
+JUDGE_KEYS = ("scores", "required_fixes", "keep_strengths", "verdict")
+JUDGE_EVIDENCE = os.getenv("STORYDAG_JUDGE_EVIDENCE", "") == "1"
+# the reply without evidence is ~150 tokens; the limiter reserves max_tokens
+JUDGE_MAX_TOKENS = 900 if JUDGE_EVIDENCE else 400
+
+@functools.lru_cache(maxsize=None)
+def _schema(model: str) -> str:
+    # pydantic and the models cost ~150ms to import: pay it on the first call
+    from . import schemas
+    return schemas.schema_hint(getattr(schemas, model))
+
+# The storyteller's draft is measured as it streams; one that runs well past
+# the word limit or piles up dialogue is cut off there instead of paying for the
+# rest, and goes to revise to be finished properly (see _aborted_report).
+# STORYDAG_EARLY_ABORT=off keeps the unstreamed single call when nobody listens.
+EARLY_ABORT = os.getenv("STORYDAG_EARLY_ABORT", "on").lower() not in ("0", "off", "false", "no")
+ABORT_WORD_SLACK = 1.15   # x word_limit; a slight overshoot is left to repair's trim
+ABORT_DIALOGUE = 5        # quoted lines (the limit is 2; collapse_dialogue fixes a few)
+
+# Revise and feedback send the story as numbered sentences and apply the
+# model's edit list locally (app/edits.py), so a one-line fix costs a one-line
+# reply. A reply that doesn't parse or apply, or edits that leave a fault code
+# can't repair (a lost must_include term), fall back to the whole-story
+# rewrite; so do cut-off drafts (they need finishing) and very short stories.
+# STORYDAG_EDIT_REVISE=off always rewrites.
+EDIT_REVISE = os.getenv("STORYDAG_EDIT_REVISE", "on").lower() not in ("0", "off", "false", "no")
+EDIT_MIN_SENTENCES = 6
+EDIT_MAX_TOKENS = 500   # a few sentences' worth; a cut-off edit list is rejected
+
+def _with_schema(prompt: str, model: str) -> str:
+    return f"{prompt}\nJSON schema: {_schema(model)}\n"
+
+def _cache_lookup(prompt: str, temperature, max_tokens, cache):
+    # -> (key, cached_text); key is None when this call must not be cached
+    rc = get_cache()
+    if rc is None or not rc.cacheable(temperature, cache):
+        return None, None
+    key = cache_key(MODEL, prompt, temperature, max_tokens)
+    return key, rc.get(key)
+
+async def _acache_lookup(prompt: str, temperature, max_tokens, cache):
+    # the SQLite tier runs on a worker thread, off the event loop
+    rc = get_cache()
+    if rc is None or not rc.cacheable(temperature, cache):
+        return None, None
+    key = cache_key(MODEL, prompt, temperature, max_tokens)
+    return key, await rc.aget(key)
+
+def _chat(prompt: str, temperature=0.6, max_tokens=700, cache=None, json_mode=False) -> str:
+    # cache: None -> cache iff temperature is low enough; True/False forces it
+    key, hit = _cache_lookup(prompt, temperature, max_tokens, cache)
+    if hit is not None:
+        record_call(MODEL, 0.0, cached=True)
+        return hit
+    out = get_client().complete(MODEL, prompt, temperature, max_tokens,
+                                JSON_MODE if json_mode else None).strip()
+    if key is not None:
+        get_cache().set(key, out)
+    return out
+
+async def _achat(prompt: str, temperature=0.6, max_tokens=700, cache=None, json_mode=False) -> str:
+    key, hit = await _acache_lookup(prompt, temperature, max_tokens, cache)
+    if hit is not None:
+        record_call(MODEL, 0.0, cached=True)
+        return hit
+    out = (await get_client().acomplete(MODEL, prompt, temperature, max_tokens,
+                                        JSON_MODE if json_mode else None)).strip()
+    if key is not None:
+        await get_cache().aset(key, out)
+    return out
+
+def _chat_stream(prompt: str, temperature=0.6, max_tokens=700, json_mode=False):
+    # yields text deltas as they arrive; streamed calls bypass the cache
+    return get_client().stream(MODEL, prompt, temperature, max_tokens, JSON_MODE if json_mode else None)
+
+def _achat_stream(prompt: str, temperature=0.6, max_tokens=700, json_mode=False):
+    return get_client().astream(MODEL, prompt, temperature, max_tokens, JSON_MODE if json_mode else None)
+
+def _complete(parser: JSONStream, keys) -> bool:
+    return parser.done or all(k in parser.members for k in keys)
+
+def _json_until(prompt: str, temperature, max_tokens, keys, cancel=None) -> str:
+    # JSON-mode call that stops generating once every key in `keys` is complete
+    # (or `cancel`, a threading.Event, is set); returns the (repaired) JSON
+    # text. Cached like _chat.
+    key, hit = _cache_lookup(prompt, temperature, max_tokens, None)
+    if hit is not None:
+        record_call(MODEL, 0.0, cached=True)
+        return hit
+    parser = JSONStream()
+    gen = _chat_stream(prompt, temperature, max_tokens, json_mode=True)
+    try:
+        for delta in gen:
+            parser.feed(delta)
+            if _complete(parser, keys):
+                break
+            if cancel is not None and cancel.is_set():
+                return parser.text   # abandoned: don't cache a partial reply
+    finally:
+        gen.close()
+    data = parser.value()
+    if data is None:
+        return parser.text
+    out = json.dumps(data, ensure_ascii=False)
+    # a reply cut off before every key arrived is used once, never cached
+    if key is not None and _complete(parser, keys):
+        get_cache().set(key, out)
+    return out
+
+async def _ajson_until(prompt: str, temperature, max_tokens, keys) -> str:
+    key, hit = await _acache_lookup(prompt, temperature, max_tokens, None)
+    if hit is not None:
+        record_call(MODEL, 0.0, cached=True)
+        return hit
+    parser = JSONStream()
+    gen = _achat_stream(prompt, temperature, max_tokens, json_mode=True)
+    try:
+        async for delta in gen:
+            parser.feed(delta)
+            if _complete(parser, keys):
+                break
+    finally:
+        await gen.aclose()
+    data = parser.value()
+    if data is None:
+        return parser.text
+    out = json.dumps(data, ensure_ascii=False)
+    if key is not None and _complete(parser, keys):
+        await get_cache().aset(key, out)
+    return out
+
+def _judge_raw(call, cancel=None) -> str:
+    if JUDGE_EVIDENCE:
+        return _chat(*call, json_mode=True)
+    return _json_until(*call, JUDGE_KEYS, cancel=cancel)
+
+async def _ajudge_raw(call) -> str:
+    if JUDGE_EVIDENCE:
+        return await _achat(*call, json_mode=True)
+    return await _ajson_until(*call, JUDGE_KEYS)
+
+# Streaming: callers pass config={"configurable": {"on_token": fn}} to the graph;
+# fn(node_name, delta) is called for every token of story-writing calls.
+def _token_sink(config):
+    return ((config or {}).get("configurable") or {}).get("on_token")
+
+# stop(delta) -> True aborts the generation (the partial text is returned).
+def _chat_to_sink(call, on_token, node: str, stop=None) -> str:
+    if on_token is None and stop is None:
+        return _chat(*call)
+    parts = []
+    gen = _chat_stream(*call)
+    try:
+        for delta in gen:
+            parts.append(delta)
+            if on_token is not None:
+                on_token(node, delta)
+            if stop is not None and stop(delta):
+                break
+    finally:
+        gen.close()
+    return "".join(parts).strip()
+
+async def _achat_to_sink(call, on_token, node: str, stop=None) -> str:
+    if on_token is None and stop is None:
+        return await _achat(*call)
+    parts = []
+    gen = _achat_stream(*call)
+    try:
+        async for delta in gen:
+            parts.append(delta)
+            if on_token is not None:
+                on_token(node, delta)
+            if stop is not None and stop(delta):
+                break
+    finally:
+        await gen.aclose()
+    return "".join(parts).strip()
+
+class _SafetyGate:
+    # stop= callback for a streamed draft: trips on the first confirmed unsafe term
+    def __init__(self):
+        self.scan = get_scanner().stream()
+        self.hits = []
+        self.aborted = False
+
+    def __call__(self, delta: str) -> bool:
+        self.hits += self.scan.feed(delta)
+        self.aborted = bool(self.hits)
+        return self.aborted
+
+    def finish(self) -> list:
+        if not self.aborted:
+            self.hits += self.scan.close()
+        return self.hits
+
+class _ShapeGate:
+    # stop= callback for a streamed draft: trips once it is clearly off-spec
+    def __init__(self, state: dict):
+        self.acc = MetricsAccumulator(state["constraints"]["must_include"],
+                                      state["classification"].get("intended_use","bedtime"), _word_limit(state))
+        self.reason = None
+
+    def __call__(self, delta: str) -> bool:
+        self.acc.feed(delta)
+        if self.acc.word_count > self.acc.word_limit * ABORT_WORD_SLACK:
+            self.reason = "over_word_limit"
+        elif self.acc.dialogue >= ABORT_DIALOGUE:
+            self.reason = "dialogue_over_2"
+        return self.reason is not None
+
+    def abort(self):
+        # -> {"reason", "metrics"} for the cut-off draft, or None
+        return {"reason": self.reason, "metrics": self.acc.snapshot()} if self.reason else None
+
+def _shape_gate(state: dict):
+    return _ShapeGate(state) if EARLY_ABORT else None
+
+def _gates(*gates):
+    # every gate sees every delta; stop when any of them trips
+    gates = [g for g in gates if g is not None]
+    return lambda delta: any([g(delta) for g in gates])
+
+# Each node is split into a *_call(state) that builds the (prompt, temperature,
+# max_tokens) for the LLM and a *_apply(state, raw) that parses the reply, so the
+# sync and async variants below share everything except the network call.
+
+def _classify_call(state: dict):
+    return _with_schema(CLASSIFIER_PROMPT.format(user_request=state["user_request"]), "Classification"), 0.2, 300
+
+def _classify_apply(state: dict, raw: str) -> dict:
     data = extract_json(raw)
     # default intended_use if missing
     if "intended_use" not in data:
         # heuristics: if 'not a bedtime' present, general; else bedtime
         iu = "general" if "not a bedtime" in state["user_request"].lower() else "bedtime"
         data["intended_use"] = iu
-    state["classification"] = data
-    return state
+    return {"classification": data}
+
+@instrument("classify_step")
+def classify_node(state: dict) -> dict:
+    # runs in parallel with extract_constraints_node: return only our key
+    return _classify_apply(state, _chat(*_classify_call(state), json_mode=True))
+
+@instrument("classify_step")
+async def aclassify_node(state: dict) -> dict:
+    return _classify_apply(state, await _achat(*_classify_call(state), json_mode=True))
 
 # NEW: constraint extractor
-def extract_constraints_node(state: dict) -> dict:
-    raw = _chat(EXTRACT_PROMPT.format(user_request=state["user_request"]), temperature=0.1, max_tokens=300)
+def _extract_call(state: dict):
+    return _with_schema(EXTRACT_PROMPT.format(user_request=state["user_request"]), "Constraints"), 0.1, 300
+
+def _extract_apply(state: dict, raw: str) -> dict:
     cons = extract_json(raw)
     # Ensure lists
     cons["must_include"] = force_list(cons.get("must_include"))
     cons["setting_hints"] = force_list(cons.get("setting_hints"))
     cons["style_hints"] = force_list(cons.get("style_hints"))
-    # If classifier flagged red flags, we can add "soften" style hint
-    if state["classification"].get("red_flags"):
-        cons["style_hints"].append("soften any intense content")
     # If user didn't specify, carry obvious tokens
     if not cons["must_include"]:
         # naive keyword fallback
         cons["must_include"] = []
-    state["constraints"] = cons
-    return state
+    return {"constraints": cons}
 
-def plan_node(state: dict) -> dict:
+@instrument("extract_step")
+def extract_constraints_node(state: dict) -> dict:
+    # runs in parallel with classify_node, so it must not read state["classification"]
+    return _extract_apply(state, _chat(*_extract_call(state), json_mode=True))
+
+@instrument("extract_step")
+async def aextract_constraints_node(state: dict) -> dict:
+    return _extract_apply(state, await _achat(*_extract_call(state), json_mode=True))
+
+@instrument("join_step")
+def join_constraints_node(state: dict) -> dict:
+    # fan-in after classify/extract: apply classifier-dependent constraint tweaks
+    cons = dict(state["constraints"])
+    # If classifier flagged red flags, we can add "soften" style hint
+    if state["classification"].get("red_flags"):
+        cons["style_hints"] = cons["style_hints"] + ["soften any intense content"]
+    return {"constraints": cons}
+
+def _plan_call(state: dict):
     cls = state["classification"]
     cons = state["constraints"]
     mood = cls.get("mood", "soothing")
     if cls.get("red_flags"):
         mood = "very-soothing"
-    raw = _chat(PLANNER_PROMPT.format(
+    render = lambda c: _with_schema(PLANNER_PROMPT.format(
         category=cls.get("category","custom"),
         mood=mood,
         intended_use=cls.get("intended_use","bedtime"),
-        must_include=cons["must_include"],
-        setting_hints=cons["setting_hints"],
-        style_hints=cons["style_hints"]
-    ), temperature=0.4, max_tokens=700)
+        must_include=c["must_include"],
+        setting_hints=c.get("setting_hints", []),
+        style_hints=c.get("style_hints", [])
+    ), "Plan")
+    return fit("plan_step", render, cons), 0.4, 700
+
+def _plan_apply(state: dict, raw: str) -> dict:
     beats = extract_json(raw)
 
     # --- normalize word_limit to int
     wl = beats.get("word_limit", 500)
     beats["word_limit"] = coerce_int(wl, default=500)
 
-    state["plan"] = beats
-    return state
+    return {"plan": beats}
 
-def storyteller_node(state: dict) -> dict:
-    beats_json = json.dumps(state["plan"], ensure_ascii=False, indent=2)
+@instrument("plan_step")
+def plan_node(state: dict) -> dict:
+    return _plan_apply(state, _chat(*_plan_call(state), json_mode=True))
+
+@instrument("plan_step")
+async def aplan_node(state: dict) -> dict:
+    return _plan_apply(state, await _achat(*_plan_call(state), json_mode=True))
+
+def _hit_terms(hits) -> str:
+    return ", ".join(sorted({f"{h.term.lower()} ({h.category})" for h in hits}))
+
+def _word_limit(state: dict) -> int:
+    # an inventory story stocked before plans were kept arrives without one
+    return coerce_int((state.get("plan") or {}).get("word_limit", 500), default=500)
+
+def _tell_call(state: dict, avoid=None):
     cls = state["classification"]
     cons = state["constraints"]
-    story = _chat(STORYTELLER_PROMPT.format(
-        beats_json=beats_json,
+    render = lambda plan: STORYTELLER_PROMPT.format(
+        beats_json=compact(plan),
         intended_use=cls.get("intended_use","bedtime"),
         must_include=cons["must_include"],
         word_limit=state["plan"]["word_limit"]
-    ), temperature=0.8, max_tokens=1000)
-    if unsafe(story):
-        story = _chat(
-            REVISER_PROMPT.format(
-                fixes="['Remove any frightening element. Soften imagery.']",
-                strengths="[]",
-                intended_use=cls.get("intended_use","bedtime"),
-                must_include=cons["must_include"],
-                story=story
-            ),
-            temperature=0.5, max_tokens=900
-        )
-    state["draft_story"] = story.strip()
-    return state
+    )
+    prompt = fit("tell_step", render, state["plan"])
+    if avoid:
+        prompt += f"\nNever use these words: {_hit_terms(avoid)}.\n"
+    return prompt, 0.8, story_max_tokens(_word_limit(state))
 
-def judge_node(state: dict) -> dict:
-    cls = state["classification"]
-    cons = state["constraints"]
-    intended = cls.get("intended_use","bedtime")
-    limit = coerce_int(state["plan"].get("word_limit", 500), default=500)
-    metrics = compute_metrics(
+def _soften_call(state: dict, story: str, hits=()):
+    fixes = ["Remove any frightening element. Soften imagery."]
+    if hits:
+        fixes.append(f"Replace these words with gentle ones: {_hit_terms(hits)}.")
+    prompt = REVISER_PROMPT.format(
+        fixes=json.dumps(fixes, ensure_ascii=False),
+        strengths="[]",
+        intended_use=state["classification"].get("intended_use","bedtime"),
+        must_include=state["constraints"]["must_include"],
+        story=story
+    )
+    return prompt, 0.5, story_max_tokens(_word_limit(state), story=story)
+
+def _tell_apply(state: dict, story: str, hits=(), abort=None) -> dict:
+    # safety_hits: what tripped the safety scan (if anything) before softening;
+    # stream_abort: why the draft was cut off early, with its partial metrics
+    out = {"draft_story": story.strip(), "safety_hits": [h.as_dict() for h in hits]}
+    if abort is not None:
+        out["stream_abort"] = abort
+    return out
+
+# When streaming, the draft is scanned inline: on the first unsafe term the
+# generation is cut off and retold with those words banned, instead of paying
+# for the rest of a draft that would be rewritten anyway. Rewrites are streamed
+# under their own node names so listeners know the draft was replaced.
+@instrument("tell_step")
+def storyteller_node(state: dict, config=None) -> dict:
+    on_token = _token_sink(config)
+    shape = None
+    if on_token is None and not EARLY_ABORT:
+        story = _chat(*_tell_call(state))
+        hits = first_hits = get_scanner().scan(story)
+    else:
+        gate, shape = _SafetyGate(), _shape_gate(state)
+        story = _chat_to_sink(_tell_call(state), on_token, "tell_step", stop=_gates(gate, shape))
+        hits = first_hits = gate.finish()
+        if gate.aborted:
+            shape = _shape_gate(state)
+            story = _chat_to_sink(_tell_call(state, avoid=hits), on_token, "retell_step", stop=_gates(shape))
+            hits = get_scanner().scan(story)
+    if hits:
+        story = _chat_to_sink(_soften_call(state, story, hits), on_token, "soften_step")
+    return _tell_apply(state, story, first_hits, shape.abort() if shape else None)
+
+@instrument("tell_step")
+async def astoryteller_node(state: dict, config=None) -> dict:
+    on_token = _token_sink(config)
+    shape = None
+    if on_token is None and not EARLY_ABORT:
+        story = await _achat(*_tell_call(state))
+        hits = first_hits = get_scanner().scan(story)
+    else:
+        gate, shape = _SafetyGate(), _shape_gate(state)
+        story = await _achat_to_sink(_tell_call(state), on_token, "tell_step", stop=_gates(gate, shape))
+        hits = first_hits = gate.finish()
+        if gate.aborted:
+            shape = _shape_gate(state)
+            story = await _achat_to_sink(_tell_call(state, avoid=hits), on_token, "retell_step", stop=_gates(shape))
+            hits = get_scanner().scan(story)
+    if hits:
+        story = await _achat_to_sink(_soften_call(state, story, hits), on_token, "soften_step")
+    return _tell_apply(state, story, first_hits, shape.abort() if shape else None)
+
+def _judge_metrics(state: dict) -> dict:
+    intended = state["classification"].get("intended_use","bedtime")
+    limit = _word_limit(state)
+    return compute_metrics(
         story=state["draft_story"],
-        must_include=cons["must_include"],
+        must_include=state["constraints"]["must_include"],
         intended_use=intended,
         word_limit=limit
     )
 
-    raw = _chat(JUDGE_PROMPT.format(
+def _judge_call(state: dict, metrics: dict):
+    render = lambda m: JUDGE_PROMPT.format(
         story=state["draft_story"],
-        intended_use=intended,
-        must_include=cons["must_include"],
-        metrics=json.dumps(metrics, ensure_ascii=False, indent=2)
-    ), temperature=0.0, max_tokens=900)
+        intended_use=state["classification"].get("intended_use","bedtime"),
+        must_include=state["constraints"]["must_include"],
+        metrics=compact(m),
+        reply_format=JUDGE_EVIDENCE_FORMAT if JUDGE_EVIDENCE else JUDGE_REPLY_FORMAT,
+    )
+    return fit("judge_step", render, metrics), 0.0, JUDGE_MAX_TOKENS
 
+def _judge_apply(state: dict, raw: str, metrics: dict) -> dict:
+    intended = state["classification"].get("intended_use","bedtime")
     data = extract_json(raw)
     # normalize arrays
     data["keep_strengths"] = force_list(data.get("keep_strengths"))
@@ -150,9 +479,9 @@ def judge_node(state: dict) -> dict:
     if metrics["over_word_limit"] or metrics["dialogue_over_2"]:
         s["instruction_adherence"] = min(s["instruction_adherence"], 3)
         if metrics["over_word_limit"]:
-            data["required_fixes"].append("Trim to word limit.")
+            data["required_fixes"].append(FIX_TRIM)
         if metrics["dialogue_over_2"]:
-            data["required_fixes"].append("Keep dialogue to at most 2 short lines.")
+            data["required_fixes"].append(FIX_DIALOGUE)
 
     if metrics["coleman_liau_index"] > 4.0 or metrics["avg_sentence_len"] > 15:
         s["age_fit"] = min(s["age_fit"], 3)
@@ -160,7 +489,7 @@ def judge_node(state: dict) -> dict:
 
     if intended == "bedtime" and not metrics["bedtime_tail_ok"]:
         s["bedtime_tone"] = min(s["bedtime_tone"], 3)
-        data["required_fixes"].append("End with a cozy goodnight image/line.")
+        data["required_fixes"].append(FIX_TAIL)
 
     # verdict rule
     pass_ok = (
@@ -172,54 +501,204 @@ def judge_node(state: dict) -> dict:
 
     # attach metrics for transparency (optional)
     data["metrics"] = metrics
+    data["source"] = "llm"
+
+    return {"judge_report": data}
 
-    state["judge_report"] = data
-    return state
-
-
-def revise_node(state: dict) -> dict:
-    fixes = json.dumps(state["judge_report"].get("required_fixes", []), ensure_ascii=False)
-    strengths = json.dumps(state["judge_report"].get("keep_strengths", []), ensure_ascii=False)
-    revised = _chat(
-        REVISER_PROMPT.format(
-            fixes=fixes,
-            strengths=strengths,
-            intended_use=state["classification"].get("intended_use","bedtime"),
-            must_include=state["constraints"]["must_include"],
-            story=state["draft_story"],
-        ),
-        temperature=0.5,
-        max_tokens=1000,
+@instrument("judge_step")
+def judge_node(state: dict) -> dict:
+    metrics = _judge_metrics(state)
+    return _judge_apply(state, _judge_raw(_judge_call(state, metrics)), metrics)
+
+@instrument("judge_step")
+async def ajudge_node(state: dict) -> dict:
+    metrics = _judge_metrics(state)
+    return _judge_apply(state, await _ajudge_raw(_judge_call(state, metrics)), metrics)
+
+# Tiered judge (the graph's judge_step): a draft the metrics already fail on
+# something code can't repair (missing must_include, age fit), or one the
+# storyteller cut off mid-stream, is revised no matter what the LLM judge says,
+# so skip that call and hand revise a report built from the metric clamps
+# alone. Drafts that are clean, or whose only faults are mechanical (repair may
+# fix them and skip revise), get the LLM judge.
+def _aborted_report(state: dict, metrics: dict, abort: dict) -> dict:
+    # a draft cut off mid-stream can't pass and trimming can't finish it: drop
+    # the mechanical fixes and ask revise for a complete story within limits
+    out = _judge_apply(state, "{}", metrics)
+    rep = out["judge_report"]
+    rep["required_fixes"] = [f for f in rep["required_fixes"] if f not in MECHANICAL_FIXES]
+    rep["required_fixes"].append(FIX_FINISH.format(limit=metrics["word_limit"]))
+    rep.update(source="stream_abort", faults=[abort["reason"]])
+    return out
+
+def _prejudge(state: dict, metrics: dict):
+    if state.get("stream_abort"):
+        return _aborted_report(state, metrics, state["stream_abort"])
+    faults = local_faults(metrics)
+    if not unfixable(faults):
+        return None
+    out = _judge_apply(state, "{}", metrics)
+    out["judge_report"].update(source="prejudge", faults=faults)
+    return out
+
+@instrument("judge_step")
+def tiered_judge_node(state: dict) -> dict:
+    metrics = _judge_metrics(state)
+    return _prejudge(state, metrics) or _judge_apply(state, _judge_raw(_judge_call(state, metrics)), metrics)
+
+@instrument("judge_step")
+async def atiered_judge_node(state: dict) -> dict:
+    metrics = _judge_metrics(state)
+    return _prejudge(state, metrics) or _judge_apply(state, await _ajudge_raw(_judge_call(state, metrics)), metrics)
+
+
+def _revise_inputs(state: dict):
+    rep = state.get("judge_report", {})
+    return (json.dumps(rep.get("required_fixes", []), ensure_ascii=False),
+            json.dumps(rep.get("keep_strengths", []), ensure_ascii=False))
+
+def _revise_call(state: dict):
+    fixes, strengths = _revise_inputs(state)
+    prompt = REVISER_PROMPT.format(
+        fixes=fixes,
+        strengths=strengths,
+        intended_use=state["classification"].get("intended_use","bedtime"),
+        must_include=state["constraints"]["must_include"],
+        story=state["draft_story"],
     )
-    before = state["draft_story"]
-    state["draft_story"] = revised.strip()
-    # debug/telemetry only
-    state["revise_count"] = int(state.get("revise_count", 0)) + 1
-    # if no change, we still finalize next (graph is acyclic now)
-    return state
+    return prompt, 0.5, story_max_tokens(_word_limit(state), story=state["draft_story"])
 
+def _revise_edit_call(state: dict, ed: EditableStory):
+    fixes, strengths = _revise_inputs(state)
+    prompt = REVISER_EDIT_PROMPT.format(
+        fixes=fixes,
+        strengths=strengths,
+        intended_use=state["classification"].get("intended_use","bedtime"),
+        must_include=state["constraints"]["must_include"],
+        story=ed.numbered(),
+        reply_format=EDIT_REPLY_FORMAT,
+    )
+    return prompt, 0.5, EDIT_MAX_TOKENS
 
-def finalize_node(state: dict) -> dict:
+def _editable(state: dict, story: str):
+    if not EDIT_REVISE or state.get("stream_abort"):
+        return None
+    ed = EditableStory(story)
+    return ed if len(ed) >= EDIT_MIN_SENTENCES else None
+
+def _apply_edits(state: dict, ed: EditableStory, raw: str, on_token, node: str):
+    # -> (revised story or None to rewrite instead, state["revision"])
+    args = (state["constraints"]["must_include"], state["classification"].get("intended_use","bedtime"), _word_limit(state))
+    before = local_faults(ed.metrics(*args))
+    try:
+        edits = parse_edits(raw)
+        if not edits:
+            raise EditError("empty edit list")
+        touched = ed.apply(edits)
+    except EditError as e:
+        return None, {"mode": "rewrite", "fallback": str(e)}
+    # only the touched sentences are re-counted
+    after = ed.metrics(*args)
+    broken = [f for f in unfixable(local_faults(after)) if f not in before]
+    if broken or not after["word_count"]:
+        return None, {"mode": "rewrite", "fallback": f"edits broke {broken or ['the story']}"}
+    story = ed.text.strip()
+    if on_token is not None:
+        on_token(node, story)   # listeners get the revised text, not the edit list
+    return story, {"mode": "edits", "edits": len(edits), "touched": len(touched), "sentences": len(ed)}
+
+def _revise_apply(state: dict, revised: str, revision=None) -> dict:
+    # revise_count is debug/telemetry only; if no change, we still finalize
+    # next (graph is acyclic now)
+    return {"draft_story": revised.strip(), "revise_count": int(state.get("revise_count", 0)) + 1,
+            "revision": revision or {"mode": "rewrite"}}
+
+@instrument("revise_step")
+def revise_node(state: dict, config=None) -> dict:
+    on_token, story, revision = _token_sink(config), None, None
+    ed = _editable(state, state["draft_story"])
+    if ed is not None:
+        raw = _chat(*_revise_edit_call(state, ed), json_mode=True)
+        story, revision = _apply_edits(state, ed, raw, on_token, "revise_step")
+    if story is None:
+        story = _chat_to_sink(_revise_call(state), on_token, "revise_step")
+    return _revise_apply(state, story, revision)
+
+@instrument("revise_step")
+async def arevise_node(state: dict, config=None) -> dict:
+    on_token, story, revision = _token_sink(config), None, None
+    ed = _editable(state, state["draft_story"])
+    if ed is not None:
+        raw = await _achat(*_revise_edit_call(state, ed), json_mode=True)
+        story, revision = _apply_edits(state, ed, raw, on_token, "revise_step")
+    if story is None:
+        story = await _achat_to_sink(_revise_call(state), on_token, "revise_step")
+    return _revise_apply(state, story, revision)
+
+
+def _finalize(state: dict) -> dict:
     # Only append a goodnight tail for bedtime
     if state["classification"].get("intended_use","bedtime") == "bedtime":
-        state["final_story"] = with_goodnight(state["draft_story"])
-    else:
-        state["final_story"] = state["draft_story"].strip()
-    return state
+        return {"final_story": with_goodnight(state["draft_story"])}
+    return {"final_story": state["draft_story"].strip()}
 
-def feedback_revise(state: dict, feedback: str) -> dict:
-    cls = state["classification"]
-    cons = state["constraints"]
-    fixes = json.dumps(state.get("judge_report", {}).get("required_fixes", []), ensure_ascii=False)
-    strengths = json.dumps(state.get("judge_report", {}).get("keep_strengths", []), ensure_ascii=False)
-    revised = _chat(FEEDBACK_REVISER_PROMPT.format(
+@instrument("finalize_step")
+def finalize_node(state: dict) -> dict:
+    return _finalize(state)
+
+@instrument("finalize_step")
+async def afinalize_node(state: dict) -> dict:
+    # no LLM call; async only so the async graph has a uniform node set
+    return _finalize(state)
+
+def _feedback_story(state: dict) -> str:
+    return state.get("final_story") or state.get("draft_story","")
+
+def _feedback_call(state: dict, feedback: str):
+    fixes, strengths = _revise_inputs(state)
+    story = _feedback_story(state)
+    prompt = FEEDBACK_REVISER_PROMPT.format(
         feedback=feedback,
         fixes=fixes,
         strengths=strengths,
-        intended_use=cls.get("intended_use","bedtime"),
-        must_include=cons["must_include"],
-        story=state.get("final_story") or state.get("draft_story","")
-    ), temperature=0.5, max_tokens=1000)
-    state["draft_story"] = revised.strip()
-    state["revise_count"] = int(state.get("revise_count", 0)) + 1
-    return state
+        intended_use=state["classification"].get("intended_use","bedtime"),
+        must_include=state["constraints"]["must_include"],
+        story=story
+    )
+    # feedback may ask for a longer story: allow more headroom than a revise
+    return prompt, 0.5, story_max_tokens(_word_limit(state), headroom=1.5, story=story)
+
+def _feedback_edit_call(state: dict, feedback: str, ed: EditableStory):
+    fixes, strengths = _revise_inputs(state)
+    prompt = FEEDBACK_EDIT_PROMPT.format(
+        feedback=feedback,
+        fixes=fixes,
+        strengths=strengths,
+        intended_use=state["classification"].get("intended_use","bedtime"),
+        must_include=state["constraints"]["must_include"],
+        story=ed.numbered(),
+        reply_format=EDIT_REPLY_FORMAT,
+    )
+    return prompt, 0.5, EDIT_MAX_TOKENS
+
+@instrument("feedback_step")
+def feedback_revise(state: dict, feedback: str, on_token=None) -> dict:
+    story, revision = None, None
+    ed = _editable(state, _feedback_story(state))
+    if ed is not None:
+        raw = _chat(*_feedback_edit_call(state, feedback, ed), json_mode=True)
+        story, revision = _apply_edits(state, ed, raw, on_token, "feedback_step")
+    if story is None:
+        story = _chat_to_sink(_feedback_call(state, feedback), on_token, "feedback_step")
+    return _revise_apply(state, story, revision)
+
+@instrument("feedback_step")
+async def afeedback_revise(state: dict, feedback: str, on_token=None) -> dict:
+    story, revision = None, None
+    ed = _editable(state, _feedback_story(state))
+    if ed is not None:
+        raw = await _achat(*_feedback_edit_call(state, feedback, ed), json_mode=True)
+        story, revision = _apply_edits(state, ed, raw, on_token, "feedback_step")
+    if story is None:
+        story = await _achat_to_sink(_feedback_call(state, feedback), on_token, "feedback_step")
+    return _revise_apply(state, story, revision)
@@ -0,0 +1,234 @@
+# app/plancache.py
+import copy, functools, inspect, os, re, threading, time
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Optional, Tuple
+from .nodes import _chat, _achat, _extract_call, _extract_apply
+from .telemetry import instrument
+
+# Request-level plan cache: near-duplicate requests ("a story about a shy
+# firefly" / "shy firefly who learns to glow") reuse an earlier request's
+# classification, constraints and plan and go straight to tell_step, skipping
+# the classify and plan calls. Candidates come from an inverted index over
+# normalized token sets; purely local, no embeddings service.
+#
+# Overlap alone is not enough: "a fox named Milo" and "a fox named Luna" share
+# most tokens but want different stories. So a hit needs one request's tokens
+# to contain the other's (only added or dropped detail, never a swapped noun or
+# name), none of those extra tokens may be one of the cached must_include
+# terms, and plan_lookup_step re-runs extract on the new request and requires
+# the same must_include before it serves the cached plan.
+
+STOPWORDS = frozenset("""
+a an the and or of to in on at for with about into from by as is are was were be
+that this these those who whom which what when where while it its his her their
+them they he she we you your our my me i some any very so just please
+story stories tale tales write tell make give create want would like could can
+""".split())
+# must agree exactly, however similar the rest is: they flip intended_use or
+# negate a constraint ("not a bedtime story", "no dragons")
+GUARD_TOKENS = frozenset({"not", "no", "without", "never", "bedtime"})
+
+_TOKEN = re.compile(r"[a-z0-9']+")
+
+def _stem(w: str) -> str:
+    # plural/3rd-person endings only; enough to line up near-duplicates
+    if len(w) > 4 and w.endswith("ies"):
+        return w[:-3] + "y"
+    if len(w) > 3 and w.endswith("s") and not w.endswith("ss"):
+        return w[:-1]
+    return w
+
+def normalize(request: str) -> FrozenSet[str]:
+    return frozenset(_stem(w) for w in _TOKEN.findall(request.lower()) if w not in STOPWORDS)
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+def must_terms(must_include) -> FrozenSet[str]:
+    # must_include as normalized phrases: ["Shy fireflies"] == ["shy firefly"]
+    return frozenset(" ".join(_stem(w) for w in _TOKEN.findall(str(t).lower())) for t in must_include or ())
+
+def same_must(a, b) -> bool:
+    return must_terms(a) == must_terms(b)
+
+
+class PlanCache:
+    """
+    LRU of {normalized request -> classification/constraints/plan}.
+    A hit needs one token set to contain the other, no cached must_include
+    token among the ones that differ, and Jaccard similarity >= threshold;
+    ttl in seconds (None = no expiry).
+    """
+
+    def __init__(self, threshold: float = 0.5, max_entries: int = 1024, ttl: Optional[float] = None):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: "OrderedDict[FrozenSet[str], Dict]" = OrderedDict()
+        self._index: Dict[str, set] = {}   # token -> keys containing it
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.rejected = 0
+        self._sim_sum = 0.0
+
+    def _drop(self, key) -> None:
+        self._data.pop(key, None)
+        for tok in key:
+            keys = self._index.get(tok)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._index[tok]
+
+    def get(self, request: str) -> Optional[Tuple[Dict, float]]:
+        """-> (entry copy, similarity) for the most similar live entry above threshold."""
+        q = normalize(request)
+        now = time.time()
+        with self._lock:
+            self.lookups += 1
+            best, best_sim, guard = None, 0.0, q & GUARD_TOKENS
+            if q:
+                cands = set().union(*(self._index.get(t, ()) for t in q))
+            else:
+                cands = [q] if q in self._data else []
+            for key in cands:
+                entry = self._data[key]
+                if self.ttl and entry["created"] + self.ttl < now:
+                    self._drop(key)
+                    continue
+                if key & GUARD_TOKENS != guard:
+                    continue
+                if not (q <= key or key <= q) or (q ^ key) & entry["must_tokens"]:
+                    continue
+                sim = jaccard(q, key)
+                if sim > best_sim:
+                    best, best_sim = key, sim
+            if best is None or best_sim < self.threshold:
+                return None
+            self._data.move_to_end(best)
+            self.hits += 1
+            self._sim_sum += best_sim
+            entry = self._data[best]
+            entry["hits"] += 1
+            return copy.deepcopy({k: entry[k] for k in ("classification", "constraints", "plan")}), best_sim
+
+    def reject(self, similarity: float) -> None:
+        """Take back a hit from get() that the caller's own check turned down."""
+        with self._lock:
+            self.hits -= 1
+            self.rejected += 1
+            self._sim_sum -= similarity
+
+    def put(self, request: str, classification: Dict, constraints: Dict, plan: Dict) -> None:
+        key = normalize(request)
+        with self._lock:
+            self._drop(key)
+            self._data[key] = {
+                "request": request,
+                "classification": copy.deepcopy(classification),
+                "constraints": copy.deepcopy(constraints),
+                "plan": copy.deepcopy(plan),
+                "must_tokens": normalize(" ".join(map(str, constraints.get("must_include") or ()))),
+                "created": time.time(),
+                "hits": 0,
+            }
+            for tok in key:
+                self._index.setdefault(tok, set()).add(key)
+            while len(self._data) > self.max_entries:
+                self._drop(next(iter(self._data)))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._index.clear()
+
+    def stats(self) -> dict:
+        return {
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+            "rejected": self.rejected,
+            "avg_hit_similarity": round(self._sim_sum / self.hits, 4) if self.hits else 0.0,
+            "entries": len(self._data),
+        }
+
+    def __len__(self):
+        return len(self._data)
+
+
+def _from_env() -> Optional[PlanCache]:
+    # STORYDAG_PLAN_CACHE=off disables; _THRESHOLD / _SIZE / _TTL tune it
+    if os.getenv("STORYDAG_PLAN_CACHE", "on").lower() in ("0", "off", "false", "no"):
+        return None
+    return PlanCache(
+        threshold=float(os.getenv("STORYDAG_PLAN_CACHE_THRESHOLD", "0.5")),
+        max_entries=int(os.getenv("STORYDAG_PLAN_CACHE_SIZE", "1024")),
+        ttl=float(os.getenv("STORYDAG_PLAN_CACHE_TTL", "0")) or None,
+    )
+
+_PLAN_CACHE = _from_env()
+
+def get_plan_cache() -> Optional[PlanCache]:
+    return _PLAN_CACHE
+
+def configure_plan_cache(cache: Optional[PlanCache]) -> None:
+    """Install a process-wide plan cache (None disables it)."""
+    global _PLAN_CACHE
+    _PLAN_CACHE = cache
+
+
+# --- Graph pieces
+
+def _lookup(state: dict):
+    pc = get_plan_cache()
+    return pc, (pc.get(state["user_request"]) if pc is not None else None)
+
+def _checked(pc: PlanCache, hit, fresh: dict) -> dict:
+    # the new request's own extract must ask for the same must_include; on a
+    # mismatch the miss path extracts again (a response-cache hit when it's on)
+    entry, sim = hit
+    if not same_must(entry["constraints"].get("must_include"), fresh["constraints"]["must_include"]):
+        pc.reject(sim)
+        return {"plan_cache": {"hit": False, "rejected": "must_include"}}
+    return {**entry, "plan_cache": {"hit": True, "similarity": round(sim, 4)}}
+
+@instrument("plan_lookup_step")
+def plan_lookup_node(state: dict) -> dict:
+    pc, hit = _lookup(state)
+    if hit is None:
+        return {"plan_cache": {"hit": False}}
+    return _checked(pc, hit, _extract_apply(state, _chat(*_extract_call(state), json_mode=True)))
+
+@instrument("plan_lookup_step")
+async def aplan_lookup_node(state: dict) -> dict:
+    pc, hit = _lookup(state)
+    if hit is None:
+        return {"plan_cache": {"hit": False}}
+    return _checked(pc, hit, _extract_apply(state, await _achat(*_extract_call(state), json_mode=True)))
+
+def after_plan_lookup(state: dict):
+    if state.get("plan_cache", {}).get("hit"):
+        return "hit"
+    return "miss"
+
+def remembering(plan_fn):
+    """Wrap plan_step so every fresh plan is stored for later near-duplicates."""
+    def _put(state, out):
+        pc = get_plan_cache()
+        if pc is not None and out.get("plan"):
+            pc.put(state["user_request"], state["classification"], state["constraints"], out["plan"])
+        return out
+
+    if inspect.iscoroutinefunction(plan_fn):
+        @functools.wraps(plan_fn)
+        async def awrapper(state, *args, **kwargs):
+            return _put(state, await plan_fn(state, *args, **kwargs))
+        return awrapper
+
+    @functools.wraps(plan_fn)
+    def wrapper(state, *args, **kwargs):
+        return _put(state, plan_fn(state, *args, **kwargs))
+    return wrapper
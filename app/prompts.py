@@ -83,31 +83,7 @@ Hard guidance:
 - Only give a 5 if you can cite at least one concrete evidence phrase from the story for that criterion.
 
 Return JSON:
-{{
-  "scores": {{
-    "faithfulness": 0-5,
-    "instruction_adherence": 0-5,
-    "age_fit": 0-5,
-    "safety": 0-5,
-    "bedtime_tone": 0-5,
-    "clarity": 0-5,
-    "arc": 0-5,
-    "engagement": 0-5
-  }},
-  "required_fixes": ["..."],
-  "keep_strengths": ["..."],
-  "verdict": "pass" | "revise",
-  "evidence": {{
-    "faithfulness": ["quoted-or-paraphrased evidence"],
-    "instruction_adherence": ["..."],
-    "age_fit": ["..."],
-    "safety": ["..."],
-    "bedtime_tone": ["..."],
-    "clarity": ["..."],
-    "arc": ["..."],
-    "engagement": ["..."]
-  }}
-}}
+{reply_format}
 
 OBJECTIVE METRICS (must be respected):
 {metrics}
@@ -123,6 +99,18 @@ Story:
 """
 
 
+# reply shapes for JUDGE_PROMPT's {reply_format}, one line each: the indented
+# multi-line example cost ~150 prompt tokens per judge call
+_SCORE_KEYS = ("faithfulness", "instruction_adherence", "age_fit", "safety",
+               "bedtime_tone", "clarity", "arc", "engagement")
+JUDGE_REPLY_FORMAT = (
+    '{"scores":{' + ",".join(f'"{k}":0-5' for k in _SCORE_KEYS) + '},'
+    '"required_fixes":["..."],"keep_strengths":["..."],"verdict":"pass"|"revise"}'
+)
+JUDGE_EVIDENCE_FORMAT = (
+    JUDGE_REPLY_FORMAT[:-1]
+    + ',"evidence":{' + ",".join(f'"{k}":["quoted-or-paraphrased evidence"]' for k in _SCORE_KEYS) + '}}'
+)
 
 REVISER_PROMPT = """You are a careful reviser for a children's story.
 Apply ONLY these fixes:
@@ -171,3 +159,65 @@ Original story:
 {story}
 ---
 """
+
+# Edit-list variants of the two revisers (app/edits.py): the story comes as
+# numbered sentences and only the changed sentences come back.
+EDIT_REPLY_FORMAT = (
+    '{"edits":[{"op":"replace","id":"s3","text":"..."},'
+    '{"op":"insert","id":"s5","text":"..."},{"op":"delete","id":"s7"}]}'
+)
+_EDIT_RULES = """Reply with an edit list; sentences you don't name stay exactly as they are.
+- replace: new text for sentence id
+- insert: new sentence(s) right after sentence id ("s0" = before the first)
+- delete: remove sentence id
+Touch as few sentences as the change needs.
+
+Return JSON:
+{reply_format}"""
+
+REVISER_EDIT_PROMPT = """You are a careful reviser for a children's story.
+Apply ONLY these fixes:
+{fixes}
+
+Preserve these strengths:
+{strengths}
+
+Hard rules:
+- Ages 5–10, short sentences, simple words.
+- Respect intended use: {intended_use}.
+- Keep each of: {must_include}.
+- No frightening elements.
+
+""" + _EDIT_RULES + """
+
+Story (numbered sentences):
+---
+{story}
+---
+"""
+
+FEEDBACK_EDIT_PROMPT = """You are a careful reviser for a children's story.
+Apply the user's feedback faithfully, while preserving safety and age-appropriateness.
+
+User feedback:
+{feedback}
+
+Also apply these judge fixes if relevant:
+{fixes}
+
+Preserve these strengths:
+{strengths}
+
+Hard rules:
+- Ages 5–10, short sentences, simple words.
+- Respect intended use: {intended_use}.
+- Keep each of: {must_include}.
+- End suitably (cozy if bedtime; otherwise positive and gentle).
+
+""" + _EDIT_RULES + """
+
+Story (numbered sentences):
+---
+{story}
+---
+"""
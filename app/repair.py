@@ -0,0 +1,159 @@
+# app/repair.py
+import re
+from typing import Dict, List, Tuple
+from .metrics import DQUOTE, word_count, has_bedtime_tail, compute_metrics
+from .utils import with_goodnight
+from .telemetry import instrument
+
+# Judge fixes that code can apply without an LLM (judge_node emits exactly these).
+FIX_TRIM = "Trim to word limit."
+FIX_DIALOGUE = "Keep dialogue to at most 2 short lines."
+FIX_TAIL = "End with a cozy goodnight image/line."
+MECHANICAL_FIXES = (FIX_TRIM, FIX_DIALOGUE, FIX_TAIL)
+# for a draft the storyteller cut off mid-stream (needs the LLM reviser)
+FIX_FINISH = ("The draft was cut off: rewrite it as a complete story of at most {limit} words, "
+              "with at most 2 short lines of dialogue and a gentle ending.")
+
+# score each mechanical fix is clamped on in judge_node
+FIX_SCORE = {
+    FIX_TRIM: "instruction_adherence",
+    FIX_DIALOGUE: "instruction_adherence",
+    FIX_TAIL: "bedtime_tone",
+}
+
+MAX_DIALOGUE = 2
+TAIL_WORDS = word_count(with_goodnight(""))   # words with_goodnight may add
+
+# end of a sentence, including a closing quote so a cut never splits dialogue
+SENT_END = re.compile(r"[.!?]+[\"'”’]?")
+
+def failing_scores(scores: Dict) -> List[str]:
+    # same rule as graph.should_pass
+    bad = [] if scores.get("safety") == 5 else ["safety"]
+    if scores.get("faithfulness", 0) < 4:
+        bad.append("faithfulness")
+    for k in ["instruction_adherence", "age_fit", "bedtime_tone", "clarity", "arc", "engagement"]:
+        if scores.get(k, 0) < 4:
+            bad.append(k)
+    return bad
+
+def local_faults(metrics: Dict) -> List[str]:
+    # the metric checks nodes._judge_apply clamps a score below 4 for: any of
+    # these means the judge cannot pass the draft
+    faults = []
+    if metrics["missing_must_include"]:
+        faults.append("missing_must_include")
+    if metrics["over_word_limit"]:
+        faults.append(FIX_TRIM)
+    if metrics["dialogue_over_2"]:
+        faults.append(FIX_DIALOGUE)
+    if metrics["coleman_liau_index"] > 4.0 or metrics["avg_sentence_len"] > 15:
+        faults.append("age_fit")
+    if metrics["intended_use"] == "bedtime" and not metrics["bedtime_tail_ok"]:
+        faults.append(FIX_TAIL)
+    return faults
+
+def unfixable(faults: List[str]) -> List[str]:
+    # faults repair_story can't clear: they always end in an LLM revise
+    return [f for f in faults if f not in MECHANICAL_FIXES]
+
+def trim_to_limit(story: str, limit: int) -> str:
+    """Cut after the last whole sentence that keeps the story within limit words."""
+    if word_count(story) <= limit:
+        return story
+    ends = [m.end() for m in SENT_END.finditer(story)]
+    lo, hi, best = 0, len(ends) - 1, None
+    while lo <= hi:   # word count of a prefix grows with its end, so bisect
+        mid = (lo + hi) // 2
+        if word_count(story[:ends[mid]]) <= limit:
+            best, lo = ends[mid], mid + 1
+        else:
+            hi = mid - 1
+    return story[:best].rstrip() if best else story
+
+def _unquote(story: str, m) -> str:
+    # a quote mark between two letters is an apostrophe (the metric pairs
+    # "didn't ... owl's" as a span too): keep it, typographic so it no longer counts
+    span = m.group(0)
+    marks = []
+    for i in (m.start(), m.end() - 1):
+        inside = 0 < i < len(story) - 1 and story[i - 1].isalnum() and story[i + 1].isalnum()
+        marks.append("’" if inside else "")
+    return marks[0] + span[1:-1] + marks[1]
+
+def collapse_dialogue(story: str, max_lines: int = MAX_DIALOGUE) -> str:
+    """Turn quoted spans beyond the first max_lines dialogue lines into narration.
+    Spans are the ones metrics.dialogue_lines counts, "..." and '...' alike."""
+    if len(DQUOTE.findall(story)) <= max_lines:
+        return story
+    seen = 0
+    def unquote(m):
+        nonlocal seen
+        seen += 1
+        return m.group(0) if seen <= max_lines else _unquote(story, m)
+    return DQUOTE.sub(unquote, story)
+
+def repair_story(story: str, fixes: List[str], word_limit: int, intended_use: str) -> Tuple[str, List[str]]:
+    """Apply the mechanical subset of fixes; returns (story, fixes applied)."""
+    applied = []
+    bedtime = intended_use == "bedtime"
+    if FIX_DIALOGUE in fixes:
+        new = collapse_dialogue(story)
+        if new != story:
+            story = new
+            applied.append(FIX_DIALOGUE)
+    if FIX_TRIM in fixes:
+        # leave room for the goodnight line if we'll have to add it
+        reserve = TAIL_WORDS if bedtime else 0
+        new = trim_to_limit(story, word_limit - reserve)
+        if new != story:
+            story = new
+            applied.append(FIX_TRIM)
+    if bedtime and (FIX_TAIL in fixes or FIX_TRIM in applied) and not has_bedtime_tail(story):
+        story = with_goodnight(story)
+        if FIX_TAIL in fixes:
+            applied.append(FIX_TAIL)
+    return story, applied
+
+@instrument("repair_step")
+def repair_node(state: dict) -> dict:
+    """
+    Runs when the judge asks for a revise. Fixes the mechanical violations
+    locally, re-measures, and marks the LLM revise as skippable when nothing
+    else was wrong: every required fix was mechanical, all of them now pass
+    the metrics, and the only failing scores are those the metrics clamped.
+    """
+    report = state["judge_report"]
+    fixes = report.get("required_fixes", [])
+    mech = [f for f in fixes if f in MECHANICAL_FIXES]
+    if not mech:
+        return {"repair": {"applied": [], "skip_revise": False}}
+
+    cons = state["constraints"]
+    intended = state["classification"].get("intended_use", "bedtime")
+    limit = report.get("metrics", {}).get("word_limit") or (state.get("plan") or {}).get("word_limit", 500)
+    story, applied = repair_story(state["draft_story"], mech, limit, intended)
+    metrics = compute_metrics(story, cons["must_include"], intended, limit)
+
+    still_broken = {
+        FIX_TRIM: metrics["over_word_limit"],
+        FIX_DIALOGUE: metrics["dialogue_over_2"],
+        FIX_TAIL: intended == "bedtime" and not metrics["bedtime_tail_ok"],
+    }
+    unresolved = [f for f in mech if still_broken[f]]
+    remaining = [f for f in fixes if f not in MECHANICAL_FIXES] + unresolved
+    clamped = {FIX_SCORE[f] for f in mech}
+    skip = not remaining and set(failing_scores(report.get("scores", {}))) <= clamped
+
+    out = {"repair": {"applied": applied, "skip_revise": skip}}
+    if applied:
+        # the LLM reviser (if still needed) only sees what code couldn't fix
+        out["draft_story"] = story
+        out["judge_report"] = {**report, "metrics": metrics, "required_fixes": remaining}
+    if skip:
+        # the draft goes to finalize as repaired: the report says so
+        out["judge_report"] = {**out.get("judge_report", report), "verdict": "pass", "source": "repair"}
+    return out
+
+def after_repair(state: dict) -> str:
+    return "finalize" if state.get("repair", {}).get("skip_revise") else "revise"
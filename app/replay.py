@@ -0,0 +1,315 @@
+# app/replay.py
+import hashlib, json, os, random, re, sys, threading, time, uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from .cache import cache_key
+
+# Offline stand-in for the OpenAI chat-completions API.
+#
+#   with FakeChatServer(FixtureStore("fixtures.jsonl"), latency_ms=300) as srv:
+#       configure_client(base_url=srv.base_url, api_key="fake")   # app.llm
+#       get_graph().invoke(...)
+#
+# Requests are answered from a fixture store keyed like the response cache
+# (model, prompt, temperature, max_tokens). On a miss the server either makes up
+# a deterministic reply (fallback="synthetic"), fails (fallback="error"), or, in
+# record mode (fallback="upstream"), forwards to the real API and saves the pair.
+
+SCORES = ["faithfulness", "instruction_adherence", "age_fit", "safety", "bedtime_tone", "clarity", "arc", "engagement"]
+
+
+class FixtureStore:
+    """Prompt/response pairs in a JSONL file, loaded into memory."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._data: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        rec = json.loads(line)
+                        self._data[rec["key"]] = rec
+
+    @staticmethod
+    def key(body: Dict) -> str:
+        prompt = "\n".join(m.get("content", "") for m in body.get("messages", []))
+        return cache_key(body.get("model", ""), prompt, body.get("temperature", 1.0), body.get("max_tokens") or 0)
+
+    def get(self, body: Dict) -> Optional[Dict]:
+        return self._data.get(self.key(body))
+
+    def put(self, body: Dict, content: str, usage: Optional[Dict] = None) -> None:
+        rec = {
+            "key": self.key(body),
+            "model": body.get("model"),
+            "temperature": body.get("temperature"),
+            "max_tokens": body.get("max_tokens"),
+            "prompt": body.get("messages", [{}])[-1].get("content", ""),
+            "response": content,
+            "usage": usage,
+        }
+        with self._lock:
+            self._data[rec["key"]] = rec
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+
+    def __len__(self):
+        return len(self._data)
+
+
+# --- synthetic replies (deterministic per prompt)
+
+def _seed(prompt: str) -> int:
+    return int(hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8], 16)
+
+def _request_of(prompt: str) -> str:
+    m = re.search(r"Input: (.*)", prompt)
+    return m.group(1).strip() if m else ""
+
+def synthetic_reply(prompt: str) -> str:
+    """A plausible reply for each pipeline prompt, so the DAG runs end to end.
+    About a third of drafts get a low judge score so revise paths are exercised."""
+    rng = random.Random(_seed(prompt))
+    if "story request classifier" in prompt:
+        return json.dumps({"category": rng.choice(["animal", "friendship", "fantasy-gentle"]),
+                           "mood": rng.choice(["very-soothing", "soothing"]),
+                           "intended_use": "general" if "not a bedtime" in _request_of(prompt).lower() else "bedtime",
+                           "red_flags": []})
+    if "Extract constraints" in prompt:
+        words = [w for w in re.findall(r"[a-z]{4,}", _request_of(prompt).lower())
+                 if w not in ("story", "about", "with", "that", "learns", "who", "make")]
+        return json.dumps({"must_include": words[:2], "setting_hints": ["meadow"], "style_hints": []})
+    if "story planner" in prompt:
+        return json.dumps({"setting": "a quiet meadow", "characters": ["Pip", "Moss"],
+                           "gentle_problem": "Pip feels shy", "act1": "Pip hides.", "act2": "Moss helps.",
+                           "act3": "They glow together.", "calming_motifs": ["stars", "soft wind", "warm nest"],
+                           "moral": "Friends help us shine.",
+                           "style_knobs": {"cadence": "lullaby", "repetition": "light", "dialogue": "sprinkle"},
+                           "word_limit": rng.choice([350, 400, 450])})
+    if "children's story judge" in prompt:
+        scores = {k: 5 for k in SCORES}
+        fixes = []
+        if rng.random() < 0.33:
+            scores["clarity"] = 3
+            fixes = ["Make the middle part easier to follow."]
+        return json.dumps({"scores": scores, "required_fixes": fixes, "keep_strengths": ["warm imagery"],
+                           "verdict": "revise" if fixes else "pass",
+                           "evidence": {k: ["soft light"] for k in SCORES}})
+    if "Reply with an edit list" in prompt:
+        # a couple of sentence edits; now and then one the caller must reject
+        ids = re.findall(r"^(s\d+): ", prompt, re.M)
+        if not ids:
+            return json.dumps({"edits": []})
+        edits = [{"op": "replace", "id": rng.choice(ids), "text": "Moss smiled, and the meadow felt calm and safe."},
+                 {"op": "insert", "id": ids[len(ids) // 2], "text": "A friendly owl hooted softly from a branch."}]
+        if rng.random() < 0.1:
+            edits.append({"op": "delete", "id": f"s{len(ids) + 99}"})
+        return json.dumps({"edits": edits})
+    if "careful reviser" in prompt:
+        # a rewrite keeps the story's length, like the real reviser is told to
+        m = re.search(r"Original story:\n---\n(.*)\n---", prompt, re.S)
+        if m and m.group(1).strip():
+            sents = re.findall(r"[^.!?]+[.!?]+\"?", m.group(1))
+            sents.insert(len(sents) // 2, " A friendly owl hooted softly from a branch.")
+            return "".join(sents).strip()
+    m = re.search(r"Include each of(?: these exactly-once-or-naturally)?: (\[.*?\])", prompt)
+    must = re.findall(r"'([^']+)'", m.group(1)) if m else []
+    lines = [
+        "Pip was a small firefly in a quiet meadow.",
+        "Each night Pip hid under a wide green leaf.",
+        "The stars came out one by one.",
+        "A kind frog named Moss hopped close.",
+        "Pip took a slow breath and tried.",
+        "A soft light came, warm like a candle.",
+        "The wind hummed a gentle song.",
+        "Moss smiled and the meadow felt safe.",
+        "Together they glowed until the moon was high.",
+    ]
+    body = [rng.choice(lines) for _ in range(rng.randint(14, 26))]
+    body.insert(len(body) // 2, '"Will you glow with me?" asked Moss.')
+    if must:
+        body.insert(1, "The " + " and the ".join(must) + " were there too.")
+    return " ".join(body) + "\n\nSweet dreams."
+
+def _usage(prompt: str, content: str) -> Dict:
+    pt, ct = max(1, len(prompt) // 4), max(1, len(content) // 4)
+    return {"prompt_tokens": pt, "completion_tokens": ct, "total_tokens": pt + ct}
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024   # the default backlog of 5 drops SYNs under concurrency (1s retransmits)
+
+    def handle_error(self, request, client_address):
+        # clients hang up on purpose (hedge losers, streams cut off early)
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class FakeChatServer:
+    """
+    Local HTTP server speaking POST /v1/chat/completions (plain and stream=True).
+
+    latency_ms / jitter_ms: delay before the first byte; per_token_ms: extra delay
+    per output token (~4 chars), spread across stream chunks when streaming.
+    failure_rate: share of requests answered with failure_status (429 by default,
+    with a short Retry-After so SDK retries kick in).
+    """
+
+    def __init__(self, store: Optional[FixtureStore] = None, fallback: str = "synthetic",
+                 latency_ms: float = 0.0, jitter_ms: float = 0.0, per_token_ms: float = 0.0,
+                 failure_rate: float = 0.0, failure_status: int = 429,
+                 upstream=None, seed: Optional[int] = None, host: str = "127.0.0.1", port: int = 0):
+        if fallback not in ("synthetic", "error", "upstream"):
+            raise ValueError(f"unknown fallback: {fallback!r}")
+        if fallback == "upstream" and upstream is None:
+            raise ValueError("fallback='upstream' needs an OpenAI client to record from")
+        self.store = store if store is not None else FixtureStore()
+        self.fallback = fallback
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.per_token_ms = per_token_ms
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.upstream = upstream
+        self.stats = {"requests": 0, "fixture_hits": 0, "synthetic": 0, "recorded": 0, "failures": 0}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._httpd = _Server((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeChatServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # --- request handling
+
+    def _bump(self, key: str) -> None:
+        with self._lock:
+            self.stats[key] += 1
+
+    def _roll(self):
+        with self._lock:
+            fail = self._rng.random() < self.failure_rate
+            delay = max(0.0, self.latency_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000.0
+        return fail, delay
+
+    def _answer(self, body: Dict):
+        """-> (content, usage) or None when there is nothing to serve."""
+        rec = self.store.get(body)
+        if rec is not None:
+            self._bump("fixture_hits")
+            return rec["response"], rec.get("usage")
+        prompt = "\n".join(m.get("content", "") for m in body.get("messages", []))
+        if self.fallback == "synthetic":
+            self._bump("synthetic")
+            content = synthetic_reply(prompt)
+            return content, _usage(prompt, content)
+        if self.fallback == "upstream":
+            kwargs = {k: body[k] for k in ("model", "messages", "temperature", "max_tokens", "response_format") if k in body}
+            res = self.upstream.chat.completions.create(**kwargs)
+            content = res.choices[0].message.content
+            usage = res.usage.model_dump() if res.usage else None
+            self.store.put(body, content, usage)
+            self._bump("recorded")
+            return content, usage
+        return None
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"   # keep-alive, like the real API
+
+            def log_message(self, *args):
+                pass
+
+            def _json(self, status: int, obj: Dict, headers: Optional[Dict] = None):
+                data = json.dumps(obj).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                try:
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    self.close_connection = True   # client gave up (timeout / cancelled hedge)
+
+            def _chunk(self, data: bytes):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    return self._json(404, {"error": {"message": f"unknown path {self.path}"}})
+                server._bump("requests")
+                fail, delay = server._roll()
+                time.sleep(delay)
+                if fail:
+                    server._bump("failures")
+                    return self._json(server.failure_status,
+                                      {"error": {"message": "injected failure", "type": "fake_server"}},
+                                      {"retry-after-ms": "50", "retry-after": "0"})
+                answer = server._answer(body)
+                if answer is None:
+                    return self._json(404, {"error": {"message": "no fixture for this request", "type": "fake_server"}})
+                content, usage = answer
+                usage = usage or _usage(json.dumps(body.get("messages")), content)
+                model = body.get("model", "fake")
+                rid = "chatcmpl-" + uuid.uuid4().hex[:12]
+                created = int(time.time())
+                if not body.get("stream"):
+                    time.sleep(server.per_token_ms * usage["completion_tokens"] / 1000.0)
+                    return self._json(200, {
+                        "id": rid, "object": "chat.completion", "created": created, "model": model,
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                                     "finish_reason": "stop"}],
+                        "usage": usage,
+                    })
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                def event(choices, **extra):
+                    obj = {"id": rid, "object": "chat.completion.chunk", "created": created,
+                           "model": model, "choices": choices, **extra}
+                    self._chunk(b"data: " + json.dumps(obj).encode("utf-8") + b"\n\n")
+                try:
+                    pieces = re.findall(r"\S+\s*|\s+", content)
+                    step = server.per_token_ms * usage["completion_tokens"] / 1000.0 / max(len(pieces), 1)
+                    for piece in pieces:
+                        if step:
+                            time.sleep(step)
+                        event([{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+                    event([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+                    if (body.get("stream_options") or {}).get("include_usage"):
+                        event([], usage=usage)
+                    self._chunk(b"data: [DONE]\n\n")
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    self.close_connection = True   # client stopped reading (early abort)
+
+        return Handler
@@ -1,10 +1,135 @@
-import re
+import json, os, re
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
 DISALLOWED = [
     r"\bgun\b", r"\bweapon\b", r"\bkill\b", r"\bblood\b", r"\bbomb\b",
     r"\bwar\b", r"\bsuicide\b", r"\bself[- ]?harm\b", r"\bdrug\b",
     r"\balcohol\b", r"\bnightmare(s)?\b", r"\bghost(s)?\b"
 ]
 
+# Same terms as DISALLOWED, grouped so hits can say *why* a story tripped.
+DEFAULT_TERMS = {
+    "violence": [r"\bgun\b", r"\bweapon\b", r"\bkill\b", r"\bblood\b", r"\bbomb\b", r"\bwar\b"],
+    "self_harm": [r"\bsuicide\b", r"\bself[- ]?harm\b"],
+    "substances": [r"\bdrug\b", r"\balcohol\b"],
+    "fear": [r"\bnightmare(s)?\b", r"\bghost(s)?\b"],
+}
+
+class Hit(NamedTuple):
+    start: int
+    end: int
+    term: str        # matched text as it appears in the story
+    category: str
+
+    def as_dict(self) -> dict:
+        return self._asdict()
+
+
+class SafetyScanner:
+    """
+    All terms compiled into one case-insensitive alternation, one named group per
+    category, so a story is scanned once regardless of how many terms there are.
+    Spans refer to the original text (no lowercased copy).
+    """
+
+    def __init__(self, terms: Optional[Dict[str, List[str]]] = None):
+        self.terms = {cat: list(pats) for cat, pats in (terms or DEFAULT_TERMS).items()}
+        self._compile()
+
+    def _compile(self):
+        groups, self._group_cat = [], {}
+        for i, (cat, pats) in enumerate(self.terms.items()):
+            if not pats:
+                continue
+            self._group_cat[f"c{i}"] = cat
+            groups.append(f"(?P<c{i}>" + "|".join(f"(?:{p})" for p in pats) + ")")
+        self._rx = re.compile("|".join(groups) or r"(?!x)x", re.IGNORECASE)
+
+    @classmethod
+    def load(cls, path: str, extend_defaults: bool = True) -> "SafetyScanner":
+        """JSON file: {"category": ["regex", ...], ...}."""
+        with open(path, encoding="utf-8") as f:
+            extra = json.load(f)
+        scanner = cls(DEFAULT_TERMS if extend_defaults else {})
+        for cat, pats in extra.items():
+            scanner.extend(cat, pats)
+        return scanner
+
+    def extend(self, category: str, patterns: Iterable[str]) -> None:
+        self.terms.setdefault(category, []).extend(patterns)
+        self._compile()
+
+    def _hit(self, m, offset: int = 0) -> Hit:
+        return Hit(m.start() + offset, m.end() + offset, m.group(0), self._group_cat[m.lastgroup])
+
+    def scan(self, text: str) -> List[Hit]:
+        return [self._hit(m) for m in self._rx.finditer(text)]
+
+    def first(self, text: str) -> Optional[Hit]:
+        m = self._rx.search(text)
+        return self._hit(m) if m else None
+
+    def stream(self, lookback: int = 64) -> "StreamScanner":
+        return StreamScanner(self, lookback)
+
+
+class StreamScanner:
+    """
+    Incremental scan over token chunks. feed() returns hits confirmed so far;
+    a match touching the end of the buffer is held back until more text (or
+    close()) shows it can't grow, e.g. "ghost" -> "ghostly". Only the last
+    `lookback` chars are kept, which must exceed the longest term.
+    """
+
+    def __init__(self, scanner: SafetyScanner, lookback: int = 64):
+        self.scanner = scanner
+        self.lookback = lookback
+        self.hits: List[Hit] = []
+        self._buf = ""
+        self._offset = 0   # stream position of self._buf[0]
+        self._pos = 0      # next scan position within self._buf
+
+    def feed(self, chunk: str) -> List[Hit]:
+        buf = self._buf + chunk
+        new, pos, held = [], self._pos, None
+        for m in self.scanner._rx.finditer(buf, pos):
+            if m.end() >= len(buf):
+                held = m.start()
+                break
+            new.append(self.scanner._hit(m, self._offset))
+            pos = m.end()
+        # anything older than lookback that didn't match can't start a match now
+        pos = max(pos, len(buf) - self.lookback)
+        if held is not None:
+            pos = min(pos, held)
+        cut = max(0, pos - 1)   # keep one char of context for \b
+        self._buf, self._offset, self._pos = buf[cut:], self._offset + cut, pos - cut
+        self.hits.extend(new)
+        return new
+
+    def close(self) -> List[Hit]:
+        new = [self.scanner._hit(m, self._offset) for m in self.scanner._rx.finditer(self._buf, self._pos)]
+        self._buf, self._pos = "", 0
+        self.hits.extend(new)
+        return new
+
+
+def _default_scanner() -> SafetyScanner:
+    # STORYDAG_SAFETY_TERMS=path.json adds categories/terms on top of the defaults
+    path = os.getenv("STORYDAG_SAFETY_TERMS")
+    return SafetyScanner.load(path) if path else SafetyScanner()
+
+_SCANNER = _default_scanner()
+
+def get_scanner() -> SafetyScanner:
+    return _SCANNER
+
+def configure_scanner(scanner: SafetyScanner) -> None:
+    global _SCANNER
+    _SCANNER = scanner
+
+def scan(text: str) -> List[Hit]:
+    return _SCANNER.scan(text)
+
 def unsafe(text: str) -> bool:
-    low = text.lower()
-    return any(re.search(p, low) for p in DISALLOWED)
+    return _SCANNER.first(text) is not None
@@ -1,11 +1,18 @@
+import json
 from pydantic import BaseModel, Field, ValidationError
 from typing import List, Dict, Optional
 
 class Classification(BaseModel):
     category: str = Field(description='animal|friendship|fantasy-gentle|adventure-soft|science-cosy|custom')
     mood: str = Field(description='very-soothing|soothing|light-playful')
+    intended_use: str = Field("bedtime", description='bedtime|general')
     red_flags: List[str] = Field(default_factory=list)
 
+class Constraints(BaseModel):
+    must_include: List[str] = Field(default_factory=list)
+    setting_hints: List[str] = Field(default_factory=list)
+    style_hints: List[str] = Field(default_factory=list)
+
 class Plan(BaseModel):
     setting: str
     characters: List[str]
@@ -19,6 +26,8 @@ class Plan(BaseModel):
     word_limit: int = 500
 
 class Scores(BaseModel):
+    faithfulness: int
+    instruction_adherence: int
     age_fit: int
     safety: int
     bedtime_tone: int
@@ -31,6 +40,7 @@ class JudgeReport(BaseModel):
     required_fixes: List[str]
     keep_strengths: List[str]
     verdict: str  # pass|revise
+    evidence: Dict[str, List[str]] = Field(default_factory=dict)
 
 class PipelineState(BaseModel):
     user_request: str
@@ -39,3 +49,14 @@ class PipelineState(BaseModel):
     draft_story: Optional[str] = None
     judge_report: Optional[JudgeReport] = None
     final_story: Optional[str] = None
+
+def _strip_titles(node):
+    if isinstance(node, dict):
+        return {k: _strip_titles(v) for k, v in node.items() if k != "title"}
+    if isinstance(node, list):
+        return [_strip_titles(v) for v in node]
+    return node
+
+def schema_hint(model) -> str:
+    # compact JSON schema for prompts in JSON mode (titles are just noise/tokens)
+    return json.dumps(_strip_titles(model.model_json_schema()), separators=(",", ":"))
@@ -0,0 +1,280 @@
+# app/server.py
+import asyncio, json, math, os, time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+from .budget import load_encoder
+from .graph import warm_graphs
+from .sessions import SessionStore, arun_session, aresume_feedback, asaver
+from .streaming import astream_story
+from .telemetry import PrometheusExporter, get_exporter, set_exporter, summarize
+
+# HTTP front end. Stories run on the async graph in this process's event loop;
+# admission control bounds how many run at once (`concurrency`), how many may
+# wait for a slot (`queue_size`) and how many one client may have in flight
+# (`per_client`). Past those limits the request is refused up front with 429 and
+# a Retry-After estimate, instead of piling up behind the others.
+#
+#   python main.py serve --port 8000             # --fake-llm for a local stub
+#
+#   POST /stories                {"user_request": "..."} -> story, report, session_id
+#   POST /stories/stream         same, as server-sent events (token/node/done)
+#   POST /stories/{id}/feedback  {"feedback": "..."}     -> revised story
+#   GET  /stories/{id}           latest checkpointed state
+#   GET  /healthz, /metrics      admission state; Prometheus text
+#
+# Clients are told apart by the X-Client-Id header, else by remote address.
+
+class Overloaded(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Admission:
+    """Bounded admission queue in front of `concurrency` worker slots."""
+
+    def __init__(self, concurrency: int = 32, queue_size: int = 64, per_client: int = 4):
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.per_client = per_client
+        self._slots = asyncio.Semaphore(concurrency)
+        self._clients: Dict[str, int] = {}
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = {"queue_full": 0, "client_limit": 0}
+        self._service_s = 10.0   # EWMA of slot hold time, seeds Retry-After
+
+    def retry_after(self) -> int:
+        # time for the queue ahead of a new request to drain through the slots
+        backlog = self.waiting + 1
+        return max(1, min(60, math.ceil(self._service_s * backlog / self.concurrency)))
+
+    def _admit(self, client: str) -> None:
+        # no await between the checks and the counter updates: they're atomic
+        if self.per_client and self._clients.get(client, 0) >= self.per_client:
+            self.rejected["client_limit"] += 1
+            raise Overloaded("too many requests in flight for this client", self.retry_after())
+        if self.active + self.waiting >= self.concurrency + self.queue_size:
+            self.rejected["queue_full"] += 1
+            raise Overloaded("server busy", self.retry_after())
+        self._clients[client] = self._clients.get(client, 0) + 1
+        self.waiting += 1
+        self.admitted += 1
+
+    def _leave(self, client: str) -> None:
+        n = self._clients.get(client, 1) - 1
+        if n:
+            self._clients[client] = n
+        else:
+            self._clients.pop(client, None)
+
+    @asynccontextmanager
+    async def slot(self, client: str):
+        """Admit (or raise Overloaded right away), then wait for a worker slot."""
+        self._admit(client)
+        try:
+            await self._slots.acquire()
+        except BaseException:
+            self.waiting -= 1
+            self._leave(client)
+            raise
+        self.waiting -= 1
+        self.active += 1
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._slots.release()
+            self._leave(client)
+            self._service_s = 0.8 * self._service_s + 0.2 * (time.perf_counter() - t)
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "concurrency": self.concurrency,
+            "queue_size": self.queue_size,
+            "per_client": self.per_client,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "avg_service_s": round(self._service_s, 3),
+        }
+
+
+class StoryRequest(BaseModel):
+    user_request: str
+    best_of: int = 1
+
+class FeedbackRequest(BaseModel):
+    feedback: str
+    rejudge: bool = True
+
+
+def _client_id(request: Request) -> str:
+    return request.headers.get("x-client-id") or (request.client.host if request.client else "anonymous")
+
+def _overloaded(e: Overloaded) -> JSONResponse:
+    return JSONResponse({"error": e.reason, "retry_after": e.retry_after}, status_code=429,
+                        headers={"Retry-After": str(e.retry_after)})
+
+def _result(sid: str, state: dict) -> dict:
+    return {
+        "session_id": sid,
+        "final_story": state.get("final_story"),
+        "judge_report": state.get("judge_report"),
+        "telemetry": summarize(state.get("telemetry")).get("total"),
+    }
+
+def _sse(event: dict) -> str:
+    kind = event["type"]
+    if kind == "done":
+        event = {"type": "done", **_result(event["session_id"], event["state"])}
+    return f"event: {kind}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+class _ReleasingStream(StreamingResponse):
+    # runs `release` however the response ends: finished, client gone, or the
+    # body generator never started (its own finally can't cover that)
+    def __init__(self, content, release, **kwargs):
+        super().__init__(content, **kwargs)
+        self._release = release
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self._release()
+
+def _graph_options(body: StoryRequest) -> dict:
+    if body.best_of < 1 or body.best_of > 6:
+        raise HTTPException(422, "best_of must be between 1 and 6")
+    return {"best_of": body.best_of} if body.best_of > 1 else {}
+
+
+def create_app(
+    store: Optional[SessionStore] = None,
+    concurrency: Optional[int] = None,
+    queue_size: Optional[int] = None,
+    per_client: Optional[int] = None,
+) -> FastAPI:
+    """Limits default to STORYDAG_SERVER_CONCURRENCY / _QUEUE / _PER_CLIENT;
+    sessions go to STORYDAG_SESSION_DB (in memory unless set; workers that
+    share feedback sessions need a shared file)."""
+    store = store or SessionStore(os.getenv("STORYDAG_SESSION_DB", ":memory:"))
+    exporter = get_exporter()
+    if not isinstance(exporter, PrometheusExporter):
+        exporter = PrometheusExporter()
+        set_exporter(exporter)
+    admission: Optional[Admission] = None
+
+    @asynccontextmanager
+    async def lifespan(app):
+        nonlocal admission
+        # the semaphore belongs to the serving loop, so build it there
+        admission = Admission(
+            concurrency if concurrency is not None else int(os.getenv("STORYDAG_SERVER_CONCURRENCY", "32")),
+            queue_size if queue_size is not None else int(os.getenv("STORYDAG_SERVER_QUEUE", "64")),
+            per_client if per_client is not None else int(os.getenv("STORYDAG_SERVER_PER_CLIENT", "4")),
+        )
+        app.state.admission = admission
+        warm_graphs()
+        load_encoder()   # not on the first request
+        yield
+
+    app = FastAPI(title="StoryDAG", lifespan=lifespan)
+    app.state.store = store
+
+    @app.post("/stories")
+    async def create_story(body: StoryRequest, request: Request):
+        options = _graph_options(body)
+        try:
+            async with admission.slot(_client_id(request)):
+                sid, state = await arun_session(store, body.user_request, **options)
+        except Overloaded as e:
+            return _overloaded(e)
+        return _result(sid, state)
+
+    @app.post("/stories/stream")
+    async def stream_story(body: StoryRequest, request: Request):
+        options = _graph_options(body)
+        slot = admission.slot(_client_id(request))
+        try:
+            # admit before the response starts, so a refusal is still a 429
+            await slot.__aenter__()
+        except Overloaded as e:
+            return _overloaded(e)
+        held = True
+
+        async def release():
+            nonlocal held
+            if held:
+                held = False
+                await slot.__aexit__(None, None, None)
+
+        async def events():
+            try:
+                sid = await asyncio.to_thread(store.create, body.user_request)
+                yield _sse({"type": "session", "session_id": sid})
+                async for ev in astream_story(body.user_request, on_update=asaver(store, sid), **options):
+                    if ev["type"] == "done":
+                        ev = {**ev, "session_id": sid}
+                    yield _sse(ev)
+            except Exception as e:
+                yield _sse({"type": "error", "error": str(e)})
+            finally:
+                await release()   # free the slot as soon as the story is done
+
+        return _ReleasingStream(events(), release, media_type="text/event-stream",
+                                headers={"Cache-Control": "no-cache"})
+
+    @app.post("/stories/{sid}/feedback")
+    async def feedback(sid: str, body: FeedbackRequest, request: Request):
+        # only a missing session is a 404; a KeyError from the run itself is a 500
+        try:
+            await asyncio.to_thread(store.load, sid)
+        except KeyError:
+            raise HTTPException(404, f"unknown session: {sid}")
+        try:
+            async with admission.slot(_client_id(request)):
+                state = await aresume_feedback(store, sid, body.feedback, rejudge=body.rejudge)
+        except Overloaded as e:
+            return _overloaded(e)
+        return _result(sid, state)
+
+    @app.get("/stories/{sid}")
+    async def get_story(sid: str):
+        try:
+            state = await asyncio.to_thread(store.load, sid)
+        except KeyError:
+            raise HTTPException(404, f"unknown session: {sid}")
+        return {"session_id": sid, "state": state, "history": await asyncio.to_thread(store.history, sid)}
+
+    @app.get("/healthz")
+    async def healthz():
+        return {"status": "ok", **admission.stats()}
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    async def metrics():
+        s = admission.stats()
+        lines = [
+            "# HELP storydag_server_active Stories running",
+            "# TYPE storydag_server_active gauge",
+            f"storydag_server_active {s['active']}",
+            "# HELP storydag_server_waiting Admitted stories waiting for a slot",
+            "# TYPE storydag_server_waiting gauge",
+            f"storydag_server_waiting {s['waiting']}",
+            "# HELP storydag_server_admitted_total Requests admitted",
+            "# TYPE storydag_server_admitted_total counter",
+            f"storydag_server_admitted_total {s['admitted']}",
+            "# HELP storydag_server_rejected_total Requests refused with 429",
+            "# TYPE storydag_server_rejected_total counter",
+        ]
+        lines += [f'storydag_server_rejected_total{{reason="{k}"}} {v}' for k, v in s["rejected"].items()]
+        return "\n".join(lines) + "\n" + exporter.render()
+
+    return app
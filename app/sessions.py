@@ -0,0 +1,280 @@
+# app/sessions.py
+import asyncio, json, re, sqlite3, threading, time, uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional, Tuple
+from .graph import get_graph
+from .nodes import (
+    feedback_revise, finalize_node, judge_node,
+    afeedback_revise, afinalize_node, ajudge_node,
+)
+from .state import merge_update
+
+# Persistent sessions, so the feedback turn can run on any worker minutes later.
+#
+#   sid, state = run_session(store, "a shy firefly")          # checkpoint per node
+#   ...
+#   state = resume_feedback(store, sid, "make it shorter")   # no classify/plan rerun
+#
+# Layout (SQLite): the inputs that are written once per story (user_request,
+# classification, constraints, plan) live in sessions.base; every node update
+# is a row in checkpoints holding only the other keys it changed, with story
+# text stored as a word-level diff against the previous version. Telemetry is
+# not persisted.
+
+BASE_KEYS = ("user_request", "classification", "constraints", "plan")
+TEXT_KEYS = ("draft_story", "final_story")
+SKIP_KEYS = ("telemetry",)
+
+_TOKENS = re.compile(r"\S+\s*|\s+")
+
+def text_delta(old: str, new: str) -> List:
+    """Edit ops turning old into new: n>0 keep n tokens, n<0 drop -n, str insert."""
+    a, b = _TOKENS.findall(old), _TOKENS.findall(new)
+    ops = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        if tag == "equal":
+            ops.append(i2 - i1)
+            continue
+        if tag in ("delete", "replace"):
+            ops.append(i1 - i2)
+        if tag in ("insert", "replace"):
+            ops.append("".join(b[j1:j2]))
+    return ops
+
+def apply_delta(old: str, ops: List) -> str:
+    a, out, i = _TOKENS.findall(old), [], 0
+    for op in ops:
+        if isinstance(op, str):
+            out.append(op)
+        elif op > 0:
+            out.extend(a[i:i + op])
+            i += op
+        else:
+            i -= op
+    return "".join(out)
+
+def _text_base(state: Dict, key: str) -> str:
+    # final_story is usually draft_story plus a tail, so diff it against that
+    return state.get(key) or state.get("draft_story") or ""
+
+
+class SessionStore:
+    """SQLite checkpoint store keyed by session id. Safe to share across threads;
+    several processes can point at one file (WAL)."""
+
+    def __init__(self, path: str, cache_size: int = 256):
+        self.path = path
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._latest = OrderedDict()   # sid -> (seq, state): skip replays on the hot worker
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " id TEXT PRIMARY KEY, base TEXT NOT NULL,"
+            " created REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            " session TEXT NOT NULL, seq INTEGER NOT NULL, node TEXT NOT NULL,"
+            " delta TEXT NOT NULL, created REAL NOT NULL, PRIMARY KEY (session, seq))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS sessions_updated ON sessions(updated)")
+
+    @contextmanager
+    def _write(self):
+        # BEGIN IMMEDIATE takes the file's write lock before the first read, so
+        # another process can't slip a checkpoint in between (sqlite3's timeout
+        # waits for the lock); self._lock only covers this process's threads
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+
+    def _remember(self, sid: str, seq: int, state: Dict) -> None:
+        self._latest[sid] = (seq, state)
+        self._latest.move_to_end(sid)
+        while len(self._latest) > self.cache_size:
+            self._latest.popitem(last=False)
+
+    def create(self, user_request: str, session_id: Optional[str] = None) -> str:
+        sid = session_id or uuid.uuid4().hex
+        now = time.time()
+        state = {"user_request": user_request, "revise_count": 0}
+        with self._lock:
+            with self._write():
+                self._db.execute(
+                    "INSERT INTO sessions (id, base, created, updated) VALUES (?, ?, ?, ?)",
+                    (sid, json.dumps({"user_request": user_request}, ensure_ascii=False), now, now),
+                )
+                self._db.execute(
+                    "INSERT INTO checkpoints (session, seq, node, delta, created) VALUES (?, 0, ?, ?, ?)",
+                    (sid, "__start__", json.dumps({"keys": {"revise_count": 0}}), now),
+                )
+            self._remember(sid, 0, state)
+        return sid
+
+    def _replay(self, sid: str, upto: Optional[int] = None) -> Tuple[int, Dict]:
+        row = self._db.execute("SELECT base FROM sessions WHERE id = ?", (sid,)).fetchone()
+        if row is None:
+            raise KeyError(f"unknown session: {sid}")
+        state, seq = json.loads(row[0]), -1
+        q = "SELECT seq, delta FROM checkpoints WHERE session = ?"
+        args = [sid]
+        if upto is not None:
+            q += " AND seq <= ?"
+            args.append(upto)
+        for seq, delta in self._db.execute(q + " ORDER BY seq", args):
+            d = json.loads(delta)
+            state.update(d.get("keys", {}))
+            for k, ops in d.get("text", {}).items():
+                state[k] = apply_delta(_text_base(state, k), ops)
+        return seq, state
+
+    def load(self, sid: str, seq: Optional[int] = None) -> Dict:
+        """Latest state (or as of checkpoint `seq`; base keys are always the latest)."""
+        with self._lock:
+            if seq is None:
+                (last,) = self._db.execute("SELECT MAX(seq) FROM checkpoints WHERE session = ?", (sid,)).fetchone()
+                hit = self._latest.get(sid)
+                if hit is not None and hit[0] == last:
+                    return dict(hit[1])
+            at, state = self._replay(sid, seq)
+            if seq is None:
+                self._remember(sid, at, state)
+            return dict(state)
+
+    def save(self, sid: str, node: str, update: Dict) -> int:
+        """Checkpoint one node's update; returns its seq."""
+        now = time.time()
+        with self._lock:
+            with self._write():
+                (last,) = self._db.execute("SELECT MAX(seq) FROM checkpoints WHERE session = ?", (sid,)).fetchone()
+                if last is None:
+                    raise KeyError(f"unknown session: {sid}")
+                hit = self._latest.get(sid)
+                # another worker may have written since we cached it
+                prev = hit[1] if hit is not None and hit[0] == last else self._replay(sid)[1]
+                base, keys, text = {}, {}, {}
+                for k, v in update.items():
+                    if k in SKIP_KEYS:
+                        continue
+                    if k in BASE_KEYS:
+                        base[k] = v
+                    elif k in TEXT_KEYS and isinstance(v, str):
+                        text[k] = text_delta(_text_base(prev, k), v)
+                    else:
+                        keys[k] = v
+                state = {**prev, **{k: v for k, v in update.items() if k not in SKIP_KEYS}}
+                if base:
+                    stored = {k: state[k] for k in BASE_KEYS if k in state}
+                    self._db.execute("UPDATE sessions SET base = ?, updated = ? WHERE id = ?",
+                                     (json.dumps(stored, ensure_ascii=False), now, sid))
+                else:
+                    self._db.execute("UPDATE sessions SET updated = ? WHERE id = ?", (now, sid))
+                delta = {}
+                if keys:
+                    delta["keys"] = keys
+                if text:
+                    delta["text"] = text
+                self._db.execute(
+                    "INSERT INTO checkpoints (session, seq, node, delta, created) VALUES (?, ?, ?, ?, ?)",
+                    (sid, last + 1, node, json.dumps(delta, ensure_ascii=False, separators=(",", ":")), now),
+                )
+            self._remember(sid, last + 1, state)
+            return last + 1
+
+    def history(self, sid: str) -> List[Dict]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT seq, node, created, length(delta) FROM checkpoints WHERE session = ? ORDER BY seq", (sid,)
+            ).fetchall()
+        return [{"seq": s, "node": n, "created": c, "bytes": b} for s, n, c, b in rows]
+
+    def delete(self, sid: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM checkpoints WHERE session = ?", (sid,))
+            self._db.execute("DELETE FROM sessions WHERE id = ?", (sid,))
+            self._latest.pop(sid, None)
+
+    def prune(self, max_age_s: float) -> int:
+        """Drop sessions idle for longer than max_age_s; returns how many."""
+        cutoff = time.time() - max_age_s
+        with self._lock:
+            ids = [r[0] for r in self._db.execute("SELECT id FROM sessions WHERE updated < ?", (cutoff,))]
+            for sid in ids:
+                self._db.execute("DELETE FROM checkpoints WHERE session = ?", (sid,))
+                self._db.execute("DELETE FROM sessions WHERE id = ?", (sid,))
+                self._latest.pop(sid, None)
+        return len(ids)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+# --- Runners
+
+def saver(store: SessionStore, sid: str):
+    """on_update(node, update) callback for stream_story."""
+    return lambda node, update: store.save(sid, node, update)
+
+def asaver(store: SessionStore, sid: str):
+    """on_update for astream_story: SQLite writes go to a worker thread, off the event loop."""
+    async def save(node, update):
+        await asyncio.to_thread(store.save, sid, node, update)
+    return save
+
+def run_session(store: SessionStore, user_request: str, session_id: Optional[str] = None, **graph_options):
+    """First pass with a checkpoint after every node; returns (session_id, state)."""
+    sid = store.create(user_request, session_id)
+    state = {"user_request": user_request, "revise_count": 0}
+    for update in get_graph(**graph_options).stream(state, stream_mode="updates"):
+        for node, delta in update.items():
+            state = merge_update(state, delta)
+            store.save(sid, node, delta)
+    return sid, state
+
+async def arun_session(store: SessionStore, user_request: str, session_id: Optional[str] = None, **graph_options):
+    # SQLite calls run in a worker thread so a slow disk never stalls the loop
+    sid = await asyncio.to_thread(store.create, user_request, session_id)
+    state = {"user_request": user_request, "revise_count": 0}
+    async for update in get_graph(use_async=True, **graph_options).astream(state, stream_mode="updates"):
+        for node, delta in update.items():
+            state = merge_update(state, delta)
+            await asyncio.to_thread(store.save, sid, node, delta)
+    return sid, state
+
+def _step(store, sid, state, node, update):
+    store.save(sid, node, update)
+    return merge_update(state, update)
+
+async def _astep(store, sid, state, node, update):
+    await asyncio.to_thread(store.save, sid, node, update)
+    return merge_update(state, update)
+
+def resume_feedback(store: SessionStore, sid: str, feedback: str, on_token=None, rejudge: bool = True) -> Dict:
+    """feedback -> finalize (-> judge the final story) from the stored checkpoint."""
+    state = store.load(sid)
+    state = _step(store, sid, state, "feedback_step", feedback_revise(state, feedback, on_token=on_token))
+    state = _step(store, sid, state, "finalize_step", finalize_node(state))
+    if rejudge:
+        state["draft_story"] = state["final_story"]
+        state = _step(store, sid, state, "judge_step",
+                      {"draft_story": state["final_story"], **judge_node(state)})
+    return state
+
+async def aresume_feedback(store: SessionStore, sid: str, feedback: str, on_token=None, rejudge: bool = True) -> Dict:
+    state = await asyncio.to_thread(store.load, sid)
+    state = await _astep(store, sid, state, "feedback_step", await afeedback_revise(state, feedback, on_token=on_token))
+    state = await _astep(store, sid, state, "finalize_step", await afinalize_node(state))
+    if rejudge:
+        state["draft_story"] = state["final_story"]
+        state = await _astep(store, sid, state, "judge_step",
+                             {"draft_story": state["final_story"], **await ajudge_node(state)})
+    return state
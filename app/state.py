@@ -0,0 +1,93 @@
+# app/state.py
+import functools, inspect, logging, os
+from typing import Annotated, Dict, List, TypedDict
+
+log = logging.getLogger(__name__)
+
+# Graph state. Nodes return only the keys they changed; LangGraph keeps one
+# channel per key, so there is no whole-state copy per step and parallel
+# branches (classify || extract) can't clobber each other's keys. Keys without
+# a reducer are last-write-wins; two branches writing one in the same step is
+# an error, which is what we want.
+
+def merge_telemetry(left: Dict, right: Dict) -> Dict:
+    # {node: [run, ...]}; a node's update carries only its new run(s)
+    out = dict(left or {})
+    for node, runs in (right or {}).items():
+        out[node] = out.get(node, []) + list(runs)
+    return out
+
+class StoryState(TypedDict, total=False):
+    user_request: str
+    revise_count: int
+    classification: Dict
+    constraints: Dict
+    plan: Dict
+    plan_cache: Dict
+    inventory: Dict
+    draft_story: str
+    safety_hits: List[Dict]
+    stream_abort: Dict
+    judge_report: Dict
+    repair: Dict
+    revision: Dict
+    candidates: List[Dict]
+    final_story: str
+    telemetry: Annotated[Dict, merge_telemetry]
+
+REDUCERS = {"telemetry": merge_telemetry}
+
+def merge_update(state: Dict, update: Dict) -> Dict:
+    """Apply a node's partial update outside the graph (CLI feedback turn, streaming)."""
+    out = dict(state or {})
+    for k, v in (update or {}).items():
+        out[k] = REDUCERS[k](out.get(k), v) if k in REDUCERS else v
+    return out
+
+
+# --- Validation at node boundaries
+# Off by default: the hot path never pays for pydantic. "warn" logs and "strict"
+# raises when a node returns a key that doesn't fit its schema; only the keys a
+# node actually returned are checked.
+VALIDATE_MODES = ("off", "warn", "strict")
+DEFAULT_VALIDATE = os.getenv("STORYDAG_VALIDATE", "off")
+
+# key -> model name in app.schemas (imported only once validation is on)
+SCHEMAS = {
+    "classification": "Classification",
+    "constraints": "Constraints",
+    "plan": "Plan",
+    "judge_report": "JudgeReport",
+}
+
+def validate_update(node: str, update: Dict, mode: str) -> None:
+    from pydantic import ValidationError
+    from . import schemas
+    for key, model in SCHEMAS.items():
+        if key not in update:
+            continue
+        try:
+            getattr(schemas, model).model_validate(update[key])
+        except ValidationError as e:
+            if mode == "strict":
+                raise ValueError(f"{node} returned an invalid {key}: {e}") from e
+            log.warning("%s returned an invalid %s: %s", node, key, e)
+
+def validated(node: str, fn, mode: str):
+    """Wrap a graph node so its updates are checked (signature kept for `config`)."""
+    if mode == "off":
+        return fn
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def awrapper(state, *args, **kwargs):
+            out = await fn(state, *args, **kwargs)
+            validate_update(node, out, mode)
+            return out
+        return awrapper
+
+    @functools.wraps(fn)
+    def wrapper(state, *args, **kwargs):
+        out = fn(state, *args, **kwargs)
+        validate_update(node, out, mode)
+        return out
+    return wrapper
@@ -0,0 +1,109 @@
+# app/streaming.py
+import asyncio, inspect, queue, threading
+from .graph import get_graph
+from .state import merge_update
+
+# Event stream for one story run. Events are plain dicts:
+#   {"type": "token", "node": "tell_step", "text": "..."}   story text as it is generated
+#   {"type": "node",  "node": "plan_step", "update": {...}}  a graph step finished
+#   {"type": "done",  "state": {...}}                         final merged state
+# A "soften_step"/"revise_step" token stream means the draft is being rewritten.
+# on_update(node, update), if given, sees each node update as it lands, e.g.
+# app.sessions.saver(store, sid) to checkpoint while streaming (astream_story
+# also takes a coroutine function such as app.sessions.asaver and awaits it).
+
+_END = object()
+
+class _Closed(Exception):
+    # raised into the graph from on_token once the consumer has stopped reading
+    pass
+
+def _initial_state(user_request: str) -> dict:
+    return {"user_request": user_request, "revise_count": 0}
+
+def stream_story(user_request: str, on_update=None, **graph_options):
+    """Generator over story events; the graph runs on a worker thread.
+    Closing the generator early stops the run: the next token raises in the
+    worker (dropping that LLM stream) and no further node starts."""
+    graph = get_graph(**graph_options)
+    q = queue.Queue()
+    closed = threading.Event()
+
+    def on_token(node, text):
+        if closed.is_set():
+            raise _Closed()
+        q.put({"type": "token", "node": node, "text": text})
+
+    def run():
+        state = _initial_state(user_request)
+        try:
+            config = {"configurable": {"on_token": on_token}}
+            for update in graph.stream(state, config=config, stream_mode="updates"):
+                if closed.is_set():
+                    return
+                for node, delta in update.items():
+                    state = merge_update(state, delta)
+                    if on_update is not None:
+                        on_update(node, delta)
+                    q.put({"type": "node", "node": node, "update": delta})
+            q.put({"type": "done", "state": state})
+        except _Closed:
+            pass
+        except BaseException as e:
+            if not closed.is_set():
+                q.put(e)
+        finally:
+            q.put(_END)
+
+    threading.Thread(target=run, daemon=True).start()
+    try:
+        while True:
+            item = q.get()
+            if item is _END:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        closed.set()
+
+async def astream_story(user_request: str, on_update=None, **graph_options):
+    """Async iterator over story events, driven by the async graph."""
+    graph = get_graph(use_async=True, **graph_options)
+    loop = asyncio.get_running_loop()
+    q = asyncio.Queue()
+
+    def emit(event):
+        # sync helper nodes may run in the executor; hop back onto our loop
+        loop.call_soon_threadsafe(q.put_nowait, event)
+
+    async def run():
+        state = _initial_state(user_request)
+        try:
+            config = {"configurable": {"on_token": lambda node, text: emit({"type": "token", "node": node, "text": text})}}
+            async for update in graph.astream(state, config=config, stream_mode="updates"):
+                for node, delta in update.items():
+                    state = merge_update(state, delta)
+                    if on_update is not None:
+                        done = on_update(node, delta)
+                        if inspect.isawaitable(done):
+                            await done
+                    emit({"type": "node", "node": node, "update": delta})
+            emit({"type": "done", "state": state})
+        except BaseException as e:
+            emit(e)
+        finally:
+            emit(_END)
+
+    task = asyncio.create_task(run())
+    try:
+        while True:
+            item = await q.get()
+            if item is _END:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        if not task.done():
+            task.cancel()
@@ -0,0 +1,230 @@
+# app/telemetry.py
+import contextvars, functools, inspect, threading, time
+from typing import Dict, List, Optional
+
+# Per-node timing and per-LLM-call usage.
+#
+# Nodes decorated with @instrument("judge_step") time themselves and append a run
+# record to state["telemetry"][node_name]; every _chat/_achat call made while the
+# node runs is attached to that record via a context variable:
+#
+#   state["telemetry"] = {
+#     "judge_step": [{"latency_ms": 812.4, "prompt_tokens": 903, "completion_tokens": 412,
+#                     "cost_usd": 0.00107, "calls": [{...}, ...]}],
+#     ...
+#   }
+#
+# Keys are node names and values are lists of runs. A node's update carries only
+# {node_name: [its run]}; state.merge_telemetry appends it to what's there.
+
+# USD per 1M tokens (input, output)
+PRICES = {
+    "gpt-3.5-turbo": (0.50, 1.50),
+}
+
+_CURRENT = contextvars.ContextVar("storydag_node_run", default=None)
+
+def call_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    p_in, p_out = PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * p_in + completion_tokens * p_out) / 1_000_000
+
+def record_call(model: str, latency_s: float, usage=None, retries: int = 0, cached: bool = False, **extra) -> None:
+    """Called by the LLM layer after each call; no-op outside an instrumented node."""
+    run = _CURRENT.get()
+    if run is None:
+        return
+    pt = getattr(usage, "prompt_tokens", 0) or 0
+    ct = getattr(usage, "completion_tokens", 0) or 0
+    call = {
+        "model": model,
+        "latency_ms": round(latency_s * 1000.0, 1),
+        "prompt_tokens": pt,
+        "completion_tokens": ct,
+        "retries": retries,
+        "cached": cached,
+        "cost_usd": round(call_cost(model, pt, ct), 6),
+    }
+    call.update(extra)
+    run["calls"].append(call)
+
+def current_node() -> Optional[str]:
+    """Name of the instrumented node running in this context, if any."""
+    run = _CURRENT.get()
+    return run["node"] if run is not None else None
+
+def _new_run(name: str) -> Dict:
+    return {"node": name, "started_at": time.time(), "calls": []}
+
+def _close_run(run: Dict, elapsed_s: float, error: Optional[BaseException] = None) -> Dict:
+    calls = run["calls"]
+    run["latency_ms"] = round(elapsed_s * 1000.0, 1)
+    run["prompt_tokens"] = sum(c["prompt_tokens"] for c in calls)
+    run["completion_tokens"] = sum(c["completion_tokens"] for c in calls)
+    run["retries"] = sum(c["retries"] for c in calls)
+    run["cost_usd"] = round(sum(c["cost_usd"] for c in calls), 6)
+    if error is not None:
+        run["error"] = type(error).__name__
+    return run
+
+def _attach(out: dict, name: str, run: Dict) -> dict:
+    out["telemetry"] = {name: [run]}
+    return out
+
+def instrument(name: str):
+    """Decorator for graph nodes (sync or async). Preserves the signature so
+    LangGraph still passes `config` to nodes that accept it."""
+    def deco(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def awrapper(state, *args, **kwargs):
+                run = _new_run(name)
+                token = _CURRENT.set(run)
+                t = time.perf_counter()
+                try:
+                    out = await fn(state, *args, **kwargs)
+                except BaseException as e:
+                    _export(name, _close_run(run, time.perf_counter() - t, e))
+                    raise
+                finally:
+                    _CURRENT.reset(token)
+                _export(name, _close_run(run, time.perf_counter() - t))
+                return _attach(out, name, run)
+            return awrapper
+
+        @functools.wraps(fn)
+        def wrapper(state, *args, **kwargs):
+            run = _new_run(name)
+            token = _CURRENT.set(run)
+            t = time.perf_counter()
+            try:
+                out = fn(state, *args, **kwargs)
+            except BaseException as e:
+                _export(name, _close_run(run, time.perf_counter() - t, e))
+                raise
+            finally:
+                _CURRENT.reset(token)
+            _export(name, _close_run(run, time.perf_counter() - t))
+            return _attach(out, name, run)
+        return wrapper
+    return deco
+
+def summarize(telemetry: Optional[Dict]) -> Dict:
+    """Collapse state["telemetry"] into per-node totals plus an overall line."""
+    out, total = {}, {"latency_ms": 0.0, "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0, "llm_calls": 0}
+    for node, runs in (telemetry or {}).items():
+        row = {
+            "runs": len(runs),
+            "latency_ms": round(sum(r.get("latency_ms", 0.0) for r in runs), 1),
+            "prompt_tokens": sum(r.get("prompt_tokens", 0) for r in runs),
+            "completion_tokens": sum(r.get("completion_tokens", 0) for r in runs),
+            "cost_usd": round(sum(r.get("cost_usd", 0.0) for r in runs), 6),
+            "llm_calls": sum(len(r.get("calls", [])) for r in runs),
+        }
+        out[node] = row
+        for k in total:
+            total[k] += row[k]
+    total["latency_ms"] = round(total["latency_ms"], 1)
+    total["cost_usd"] = round(total["cost_usd"], 6)
+    out["total"] = total
+    return out
+
+
+# --- Exporters
+# An exporter is any object with export(node_name, run_record). Install one with
+# set_exporter(); it sees every node run as it finishes (including failed runs).
+
+_EXPORTER = None
+
+def set_exporter(exporter) -> None:
+    global _EXPORTER
+    _EXPORTER = exporter
+
+def get_exporter():
+    return _EXPORTER
+
+def _export(name: str, run: Dict) -> None:
+    if _EXPORTER is not None:
+        try:
+            _EXPORTER.export(name, run)
+        except Exception:
+            pass   # telemetry must never break a story
+
+
+class SpanExporter:
+    """OpenTelemetry-style spans: one span per node run, one child span per LLM call.
+
+    With `tracer` (an opentelemetry.trace.Tracer) spans are emitted through OTel;
+    otherwise they are kept as plain dicts in self.spans (bounded by max_spans).
+    """
+
+    def __init__(self, tracer=None, max_spans: int = 10_000):
+        self.tracer = tracer
+        self.max_spans = max_spans
+        self.spans: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def export(self, name: str, run: Dict) -> None:
+        start = run["started_at"]
+        end = start + run["latency_ms"] / 1000.0
+        attrs = {k: run[k] for k in ("prompt_tokens", "completion_tokens", "retries", "cost_usd") if k in run}
+        if "error" in run:
+            attrs["error"] = run["error"]
+        if self.tracer is not None:
+            self._emit_otel(name, start, end, attrs, run["calls"])
+            return
+        span = {"name": name, "start": start, "end": end, "attributes": attrs,
+                "children": [{"name": "llm.chat", "attributes": dict(c)} for c in run["calls"]]}
+        with self._lock:
+            self.spans.append(span)
+            if len(self.spans) > self.max_spans:
+                del self.spans[: len(self.spans) - self.max_spans]
+
+    def _emit_otel(self, name, start, end, attrs, calls):
+        ns = lambda t: int(t * 1e9)
+        span = self.tracer.start_span(name, start_time=ns(start), attributes=attrs)
+        for c in calls:
+            span.add_event("llm.chat", attributes={k: v for k, v in c.items() if v is not None})
+        span.end(end_time=ns(end))
+
+
+class PrometheusExporter:
+    """Aggregates node runs and renders Prometheus text exposition format."""
+
+    def __init__(self, prefix: str = "storydag"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._rows: Dict[str, Dict[str, float]] = {}
+
+    def export(self, name: str, run: Dict) -> None:
+        with self._lock:
+            row = self._rows.setdefault(name, {
+                "runs": 0, "errors": 0, "latency_seconds": 0.0, "llm_calls": 0,
+                "prompt_tokens": 0, "completion_tokens": 0, "retries": 0, "cost_usd": 0.0,
+            })
+            row["runs"] += 1
+            row["errors"] += "error" in run
+            row["latency_seconds"] += run["latency_ms"] / 1000.0
+            row["llm_calls"] += len(run["calls"])
+            for k in ("prompt_tokens", "completion_tokens", "retries", "cost_usd"):
+                row[k] += run.get(k, 0)
+
+    def render(self) -> str:
+        p = self.prefix
+        metrics = [
+            ("node_runs_total", "runs", "Node executions"),
+            ("node_errors_total", "errors", "Node executions that raised"),
+            ("node_latency_seconds_sum", "latency_seconds", "Total node wall time"),
+            ("llm_calls_total", "llm_calls", "LLM calls made by the node"),
+            ("llm_prompt_tokens_total", "prompt_tokens", "Prompt tokens"),
+            ("llm_completion_tokens_total", "completion_tokens", "Completion tokens"),
+            ("llm_retries_total", "retries", "LLM call retries"),
+            ("llm_cost_usd_total", "cost_usd", "Estimated LLM spend"),
+        ]
+        lines = []
+        with self._lock:
+            for metric, key, help_ in metrics:
+                lines.append(f"# HELP {p}_{metric} {help_}")
+                lines.append(f"# TYPE {p}_{metric} counter")
+                for node, row in sorted(self._rows.items()):
+                    lines.append(f'{p}_{metric}{{node="{node}"}} {row[key]:g}')
+        return "\n".join(lines) + "\n"
@@ -1,6 +1,105 @@
 # app/utils.py
 import json, re
-from typing import Any, List
+from typing import Any, Dict, List, Optional, Tuple
+
+class JSONStream:
+    """
+    Incremental, tolerant reader for one JSON object arriving in chunks.
+
+    feed(chunk) returns the top-level (key, value) members completed by that
+    chunk, so callers can act on e.g. "scores" before "evidence" is written.
+    value() returns the object so far: complete if the closing brace arrived,
+    otherwise cut back to the last complete value with the open brackets
+    closed (how a reply truncated at max_tokens is recovered).
+    Text before the first "{" (prose, code fences) is skipped.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.members: Dict[str, Any] = {}
+        self.done = False
+        self._pos = 0
+        self._start = None     # index of the outer "{"
+        self._end = None
+        self._member = None    # start of the current top-level member
+        self._stack: List[str] = []   # closers for the open containers
+        self._in_str = False
+        self._esc = False
+        self._cuts: List[Tuple[int, str]] = []   # (end, closers) of known-complete prefixes
+
+    def _emit(self, a: int, b: int) -> List[Tuple[str, Any]]:
+        seg = self.text[a:b].strip()
+        if not seg:
+            return []
+        try:
+            obj = json.loads("{" + seg + "}")
+        except ValueError:
+            return []
+        self.members.update(obj)
+        return list(obj.items())
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        self.text += chunk
+        t, new = self.text, []
+        for i in range(self._pos, len(t)):
+            if self.done:
+                break
+            c = t[i]
+            if self._start is None:
+                if c == "{":
+                    self._start, self._member = i, i + 1
+                    self._stack.append("}")
+                    self._cuts.append((i + 1, "}"))
+                continue
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif c == "\\":
+                    self._esc = True
+                elif c == '"':
+                    self._in_str = False
+                continue
+            if c == '"':
+                self._in_str = True
+            elif c == "{" or c == "[":
+                self._stack.append("}" if c == "{" else "]")
+            elif c == "}" or c == "]":
+                if self._stack:
+                    self._stack.pop()
+                if not self._stack:
+                    new += self._emit(self._member, i)
+                    self.done = True
+                    self._end = i + 1
+                else:
+                    self._cuts.append((i + 1, "".join(reversed(self._stack))))
+            elif c == ",":
+                self._cuts.append((i, "".join(reversed(self._stack))))
+                if len(self._stack) == 1:
+                    new += self._emit(self._member, i)
+                    self._member = i + 1
+        self._pos = len(t)
+        return new
+
+    def value(self) -> Optional[Dict]:
+        if self._start is None:
+            return None
+        if self.done:
+            try:
+                return json.loads(self.text[self._start:self._end])
+            except ValueError:
+                pass
+        for end, closers in reversed(self._cuts):
+            try:
+                return json.loads(self.text[self._start:end] + closers)
+            except ValueError:
+                continue
+        return None
+
+def repair_json(s: str) -> Optional[Dict]:
+    """Best-effort object from truncated or slightly malformed JSON text."""
+    p = JSONStream()
+    p.feed(s)
+    return p.value()
 
 def extract_json(s: str) -> Any:
     s = s.strip()
@@ -11,7 +110,14 @@ def extract_json(s: str) -> Any:
             return json.loads(m.group(0))
         except Exception:
             pass
-    return json.loads(s)
+    try:
+        return json.loads(s)
+    except ValueError:
+        # e.g. cut off at max_tokens: keep every complete field instead of losing the call
+        fixed = repair_json(s)
+        if fixed is None:
+            raise
+        return fixed
 
 def force_list(x) -> List[str]:
     if x is None:
@@ -0,0 +1,120 @@
+# benchmarks/bench_e2e.py
+"""
+End-to-end benchmark against the local fake chat-completions server.
+
+Runs a fixed corpus through the compiled graph (sequentially, then concurrently
+on the async graph) and reports end-to-end p50/p95 plus per-node timings from
+state["telemetry"]. Replies come from --fixtures when given (recorded with
+--record), otherwise from deterministic synthetic replies.
+
+    python -m benchmarks.bench_e2e --latency-ms 400 --per-token-ms 5 --concurrency 16
+    python -m benchmarks.bench_e2e --judges 3 --jitter-ms 150     # judge ensemble, quorum early exit
+    OPENAI_API_KEY=sk-... python -m benchmarks.bench_e2e --fixtures fx.jsonl --record
+"""
+import argparse, asyncio, os, statistics, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+
+from app.batch import percentile
+from app.cache import configure_cache
+from app.llm import configure_client
+from app.ensemble import get_panel_stats
+from app.graph import get_graph
+from app.replay import FakeChatServer, FixtureStore
+from app.telemetry import summarize
+
+CORPUS = [
+    "A cosy story about a shy firefly who learns to glow with a friend.",
+    "A sleepy bear who cannot find his blanket.",
+    "A little cloud that wants to rain lemonade, not a bedtime story.",
+    "Two snails racing very slowly to the garden party.",
+    "A kind dragon who bakes bread for the village.",
+    "A king and queen who lost everything but found their kindness.",
+    "A penguin who wants to see the northern lights.",
+    "A robot learning to whisper goodnight to the moon.",
+    "A brave mouse who helps an owl find its hat.",
+    "A rainbow fish sharing colours with the whole reef.",
+    "A bunny who counts stars until she falls asleep.",
+    "A turtle and a hummingbird become friends.",
+]
+
+def _report(label, states, latencies):
+    print(f"\n== {label}: {len(states)} stories")
+    print(f"end-to-end  p50 {percentile(latencies, 50) * 1000:8.1f} ms   p95 {percentile(latencies, 95) * 1000:8.1f} ms")
+    per_node = {}
+    for st in states:
+        for node, row in summarize(st.get("telemetry")).items():
+            if node != "total":
+                per_node.setdefault(node, []).append(row)
+    print(f"{'node':15s} {'runs':>5s} {'mean ms':>9s} {'p95 ms':>9s} {'calls':>6s} {'tok in':>7s} {'tok out':>8s}")
+    for node, rows in sorted(per_node.items(), key=lambda kv: -sum(r["latency_ms"] for r in kv[1])):
+        lat = [r["latency_ms"] for r in rows]
+        print(f"{node:15s} {len(rows):5d} {statistics.mean(lat):9.1f} {percentile(lat, 95):9.1f} "
+              f"{sum(r['llm_calls'] for r in rows):6d} {sum(r['prompt_tokens'] for r in rows):7d} "
+              f"{sum(r['completion_tokens'] for r in rows):8d}")
+
+def run_sequential(repeat: int, **graph_options):
+    graph = get_graph(**graph_options)
+    states, lat = [], []
+    for _ in range(repeat):
+        for req in CORPUS:
+            t = time.perf_counter()
+            states.append(graph.invoke({"user_request": req, "revise_count": 0}))
+            lat.append(time.perf_counter() - t)
+    return states, lat
+
+async def run_concurrent(repeat: int, concurrency: int, **graph_options):
+    graph = get_graph(use_async=True, **graph_options)
+    sem = asyncio.Semaphore(concurrency)
+    states, lat = [], []
+
+    async def one(req):
+        async with sem:
+            t = time.perf_counter()
+            states.append(await graph.ainvoke({"user_request": req, "revise_count": 0}))
+            lat.append(time.perf_counter() - t)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(r) for _ in range(repeat) for r in CORPUS))
+    return states, lat, time.perf_counter() - t0
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--fixtures", help="JSONL fixture store to replay (and append to with --record)")
+    ap.add_argument("--record", action="store_true", help="forward misses to the real API and save them")
+    ap.add_argument("--latency-ms", type=float, default=200.0)
+    ap.add_argument("--jitter-ms", type=float, default=50.0)
+    ap.add_argument("--per-token-ms", type=float, default=1.0)
+    ap.add_argument("--failure-rate", type=float, default=0.0)
+    ap.add_argument("--repeat", type=int, default=1)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--judges", type=int, default=1, help="judge ensemble size (app.ensemble)")
+    args = ap.parse_args()
+
+    configure_cache(None)   # measure the pipeline, not cache hits
+    store = FixtureStore(args.fixtures)
+    upstream = None
+    if args.record:
+        from openai import OpenAI
+        upstream = OpenAI()
+    server = FakeChatServer(
+        store, fallback="upstream" if args.record else "synthetic",
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, per_token_ms=args.per_token_ms,
+        failure_rate=args.failure_rate, upstream=upstream, seed=args.seed,
+    )
+    with server:
+        configure_client(base_url=server.base_url, api_key="fake")
+        options = {"judges": args.judges} if args.judges > 1 else {}
+        states, lat = run_sequential(args.repeat, **options)
+        _report("sequential (sync graph)", states, lat)
+        states, lat, wall = asyncio.run(run_concurrent(args.repeat, args.concurrency, **options))
+        _report(f"concurrent (async graph, concurrency={args.concurrency})", states, lat)
+        print(f"throughput  {len(states) * 60.0 / wall:.1f} stories/min")
+        if args.judges > 1:
+            print(f"judge ensemble: {get_panel_stats().stats()}")
+        print(f"\nserver: {server.stats}  fixtures: {len(store)}")
+
+if __name__ == "__main__":
+    main()
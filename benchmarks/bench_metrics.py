@@ -0,0 +1,101 @@
+# benchmarks/bench_metrics.py
+"""
+Metrics throughput on a synthetic corpus:
+  legacy   - the original per-story path (per-sentence word_count rescans)
+  current  - compute_metrics() per story (single text_counts() scan)
+  batch    - compute_metrics_batch() (counts vectorized over joined blocks), optionally over a process pool
+  stream   - MetricsAccumulator fed ~16-char chunks (a streamed draft), snapshot at the end
+  rescan   - compute_metrics() on the text so far after every chunk, what the
+             stream guard would do without the accumulator (on n/100 stories)
+
+Also checks that all paths agree.
+
+    python -m benchmarks.bench_metrics [--n 20000] [--processes 4]
+"""
+import argparse, os, random, re, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.metrics import compute_metrics, compute_metrics_batch, split_sentences, DQUOTE, MetricsAccumulator
+
+# --- legacy reference (as in the original app/metrics.py)
+def _legacy_word_count(text):
+    return len(re.findall(r"\b[\w']+\b", text))
+
+def _legacy(text):
+    sents = split_sentences(text)
+    avg = sum(_legacy_word_count(s) for s in sents) / len(sents) if sents else 0.0
+    wc = max(_legacy_word_count(text), 1)
+    sc = max(len(split_sentences(text)), 1)
+    L = len(re.findall(r"[A-Za-z]", text)) * 100.0 / wc
+    S = sc * 100.0 / wc
+    cli = 0.0588 * L - 0.296 * S - 15.8
+    return _legacy_word_count(text), round(avg, 2), round(cli, 2), len(DQUOTE.findall(text))
+
+WORDS = ("the little owl fox bunny moon star softly glowed quiet meadow river hummed "
+         "warm blanket sleepy friend smiled whispered gentle breeze lantern cozy nest").split()
+
+def synthetic_story(rng: random.Random) -> str:
+    sents = []
+    for _ in range(rng.randint(20, 45)):
+        s = " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 14))).capitalize()
+        if rng.random() < 0.08:
+            s = f'"{s}," said Pip'
+        sents.append(s + rng.choice(".!?" if rng.random() < 0.2 else "."))
+    return " ".join(sents) + " Sweet dreams."
+
+def _streamed(story: str, chunk: int = 16) -> dict:
+    acc = MetricsAccumulator([], "bedtime", 500)
+    for i in range(0, len(story), chunk):
+        acc.feed(story[i:i + chunk])
+    return acc.snapshot()
+
+def _rescanned(story: str, chunk: int = 16) -> dict:
+    for i in range(chunk, len(story) + chunk, chunk):
+        m = compute_metrics(story[:i], [], "bedtime", 500)
+    return m
+
+def _timed(fn):
+    t = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - t
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=20000)
+    ap.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    args = ap.parse_args()
+
+    rng = random.Random(7)
+    stories = [synthetic_story(rng) for _ in range(args.n)]
+
+    legacy, t_legacy = _timed(lambda: [_legacy(s) for s in stories])
+    current, t_current = _timed(lambda: [compute_metrics(s, [], "bedtime", 500) for s in stories])
+    batch, t_batch = _timed(lambda: compute_metrics_batch(stories))
+    pbatch, t_pbatch = _timed(lambda: compute_metrics_batch(stories, processes=args.processes))
+    streamed, t_stream = _timed(lambda: [_streamed(s) for s in stories])
+    few = stories[: max(1, args.n // 100)]
+    rescanned, t_rescan = _timed(lambda: [_rescanned(s) for s in few])
+
+    for i, (wc, avg, cli, dlg) in enumerate(legacy):
+        m = current[i]
+        assert (m["word_count"], m["avg_sentence_len"], m["coleman_liau_index"], m["dialogue_lines"]) == (wc, avg, cli, dlg), i
+        assert batch["word_count"][i] == wc and batch["dialogue_lines"][i] == dlg, i
+        assert abs(batch["coleman_liau_index"][i] - cli) < 0.011 and abs(batch["avg_sentence_len"][i] - avg) < 0.011, i
+    assert (pbatch["word_count"] == batch["word_count"]).all()
+    assert streamed == current
+    assert rescanned == current[: len(few)]
+
+    rate = lambda t: args.n / t if t else float("inf")
+    print(f"{args.n} stories")
+    print(f"legacy per-story      : {t_legacy:7.3f} s  ({rate(t_legacy):9.0f} stories/s)")
+    print(f"compute_metrics       : {t_current:7.3f} s  ({rate(t_current):9.0f} stories/s)  x{t_legacy / t_current:.1f}")
+    print(f"compute_metrics_batch : {t_batch:7.3f} s  ({rate(t_batch):9.0f} stories/s)  x{t_legacy / t_batch:.1f}")
+    print(f"  processes={args.processes:<3d}       : {t_pbatch:7.3f} s  ({rate(t_pbatch):9.0f} stories/s)  x{t_legacy / t_pbatch:.1f}")
+    print(f"MetricsAccumulator    : {t_stream:7.3f} s  ({rate(t_stream):9.0f} stories/s)  x{t_legacy / t_stream:.1f}  (16-char chunks)")
+    r_rescan = len(few) / t_rescan
+    print(f"  vs rescan per chunk : {t_rescan:7.3f} s  ({r_rescan:9.0f} stories/s)  "
+          f"accumulator x{rate(t_stream) / r_rescan:.1f}  ({len(few)} stories)")
+
+if __name__ == "__main__":
+    main()
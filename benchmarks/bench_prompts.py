@@ -0,0 +1,120 @@
+# benchmarks/bench_prompts.py
+"""
+Prompt footprint per node on a fixed corpus:
+  before - the original prompt builders (indent=2 JSON, flat max_tokens)
+  after  - the current *_call builders (compact JSON, budgets, max_tokens from word_limit)
+
+States come from deterministic synthetic replies (app.replay), so no API key or
+server is needed. Token counts use tiktoken when installed, else ~4 chars/token.
+
+    python -m benchmarks.bench_prompts [--word-limit 500]
+"""
+import argparse, json, os, statistics, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+
+from app import budget, nodes
+from app.prompts import STORYTELLER_PROMPT, REVISER_PROMPT
+from app.replay import synthetic_reply
+from benchmarks.bench_e2e import CORPUS
+
+# --- legacy reference (as in the original app/nodes.py)
+def _legacy_tell(state):
+    prompt = STORYTELLER_PROMPT.format(
+        beats_json=json.dumps(state["plan"], ensure_ascii=False, indent=2),
+        intended_use=state["classification"].get("intended_use", "bedtime"),
+        must_include=state["constraints"]["must_include"],
+        word_limit=state["plan"]["word_limit"],
+    )
+    return prompt, 0.8, 1000
+
+LEGACY_JUDGE_FORMAT = """{
+  "scores": {
+    "faithfulness": 0-5,
+    "instruction_adherence": 0-5,
+    "age_fit": 0-5,
+    "safety": 0-5,
+    "bedtime_tone": 0-5,
+    "clarity": 0-5,
+    "arc": 0-5,
+    "engagement": 0-5
+  },
+  "required_fixes": ["..."],
+  "keep_strengths": ["..."],
+  "verdict": "pass" | "revise",
+  "evidence": {
+    "faithfulness": ["quoted-or-paraphrased evidence"],
+    "instruction_adherence": ["..."],
+    "age_fit": ["..."],
+    "safety": ["..."],
+    "bedtime_tone": ["..."],
+    "clarity": ["..."],
+    "arc": ["..."],
+    "engagement": ["..."]
+  }
+}"""
+
+def _legacy_judge(state, metrics):
+    prompt = nodes.JUDGE_PROMPT.format(
+        story=state["draft_story"],
+        intended_use=state["classification"].get("intended_use", "bedtime"),
+        must_include=state["constraints"]["must_include"],
+        metrics=json.dumps(metrics, ensure_ascii=False, indent=2),
+        reply_format=LEGACY_JUDGE_FORMAT,
+    )
+    return prompt, 0.0, 900
+
+def _legacy_revise(state):
+    prompt = REVISER_PROMPT.format(
+        fixes=json.dumps(state["judge_report"].get("required_fixes", []), ensure_ascii=False),
+        strengths=json.dumps(state["judge_report"].get("keep_strengths", []), ensure_ascii=False),
+        intended_use=state["classification"].get("intended_use", "bedtime"),
+        must_include=state["constraints"]["must_include"],
+        story=state["draft_story"],
+    )
+    return prompt, 0.5, 1000
+
+def build_state(req: str, word_limit=None) -> dict:
+    """Run the non-story nodes' builders/parsers on synthetic replies."""
+    st = {"user_request": req, "revise_count": 0}
+    st.update(nodes._classify_apply(st, synthetic_reply(nodes._classify_call(st)[0])))
+    st.update(nodes._extract_apply(st, synthetic_reply(nodes._extract_call(st)[0])))
+    st.update(nodes._plan_apply(st, synthetic_reply(nodes._plan_call(st)[0])))
+    if word_limit:
+        st["plan"]["word_limit"] = word_limit
+    st.update(nodes._tell_apply(st, synthetic_reply(nodes._tell_call(st)[0])))
+    metrics = nodes._judge_metrics(st)
+    st.update(nodes._judge_apply(st, synthetic_reply(nodes._judge_call(st, metrics)[0]), metrics))
+    return st
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--word-limit", type=int, default=0, help="override the plans' word_limit")
+    args = ap.parse_args()
+
+    states = [build_state(r, args.word_limit) for r in CORPUS]
+    rows = {
+        "plan_step": (lambda st: nodes._plan_call(st), lambda st: nodes._plan_call(st)),
+        "tell_step": (_legacy_tell, lambda st: nodes._tell_call(st)),
+        "judge_step": (lambda st: _legacy_judge(st, nodes._judge_metrics(st)),
+                       lambda st: nodes._judge_call(st, nodes._judge_metrics(st))),
+        "revise_step": (_legacy_revise, lambda st: nodes._revise_call(st)),
+    }
+    tok = "tiktoken" if budget.load_encoder() else f"len/4 estimate x{budget.ESTIMATE_HEADROOM}"
+    print(f"{len(states)} requests, token counts: {tok}")
+    print(f"{'node':12s} {'prompt before':>14s} {'prompt after':>13s} {'saved':>7s} "
+          f"{'max_tok before':>15s} {'max_tok after':>14s} {'over budget':>12s}")
+    for node, (before, after) in rows.items():
+        b = [before(st) for st in states]
+        a = [after(st) for st in states]
+        pb = statistics.mean(budget.count_tokens(p) for p, _, _ in b)
+        pa = statistics.mean(budget.count_tokens(p) for p, _, _ in a)
+        limit = budget.PROMPT_BUDGETS.get(node)
+        over = sum(budget.count_tokens(p) > limit for p, _, _ in b) if limit else 0
+        print(f"{node:12s} {pb:14.1f} {pa:13.1f} {(1 - pa / pb) * 100:6.1f}% "
+              f"{statistics.mean(m for _, _, m in b):15.0f} {statistics.mean(m for _, _, m in a):14.0f} "
+              f"{over if limit else '-':>12}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# benchmarks/bench_revise.py
+"""
+Feedback-turn cost by story length: edit list (app/edits.py) vs. whole-story rewrite.
+
+The same small feedback ("add a friendly owl") is applied to stories of growing
+length against the local fake server, whose replies take --per-token-ms per
+output token. A rewrite's reply (and latency) grows with the story; an edit
+list's grows with the edit.
+
+    python -m benchmarks.bench_revise [--per-token-ms 5] [--latency-ms 100] [--repeat 3]
+"""
+import argparse, os, statistics, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+
+from app import nodes
+from app.cache import configure_cache
+from app.llm import configure_client
+from app.replay import FakeChatServer
+from app.telemetry import summarize
+from benchmarks.bench_e2e import CORPUS
+from benchmarks.bench_prompts import build_state
+
+LINES = [
+    "Pip was a small firefly in a quiet meadow.",
+    "Each night Pip hid under a wide green leaf.",
+    "The stars came out one by one.",
+    "A kind frog named Moss hopped close.",
+    "Pip took a slow breath and tried.",
+    "A soft light came, warm like a candle.",
+    "The wind hummed a gentle song.",
+]
+
+def story_of(n: int) -> str:
+    sents = [LINES[i % len(LINES)] for i in range(n)]
+    paras = [" ".join(sents[i:i + 5]) for i in range(0, n, 5)]
+    return "\n\n".join(paras) + "\n\nSweet dreams."
+
+def run(state: dict, edit: bool, repeat: int):
+    nodes.EDIT_REVISE = edit
+    lat, toks, modes = [], [], []
+    for i in range(repeat):
+        t = time.perf_counter()
+        out = nodes.feedback_revise(state, f"Add a friendly owl. ({i})")
+        lat.append(time.perf_counter() - t)
+        toks.append(summarize(out["telemetry"])["feedback_step"]["completion_tokens"])
+        modes.append(out["revision"]["mode"])
+    return statistics.median(lat) * 1000, statistics.median(toks), modes.count("rewrite")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--per-token-ms", type=float, default=5.0)
+    ap.add_argument("--latency-ms", type=float, default=100.0)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    base = build_state(CORPUS[0])
+    configure_cache(None)
+    with FakeChatServer(latency_ms=args.latency_ms, per_token_ms=args.per_token_ms) as srv:
+        configure_client(base_url=srv.base_url, api_key="fake")
+        print(f"{'sentences':>9s} {'words':>6s} {'rewrite ms':>11s} {'tok out':>8s} "
+              f"{'edits ms':>9s} {'tok out':>8s} {'fell back':>10s} {'speedup':>8s}")
+        for n in (10, 25, 50, 100):
+            story = story_of(n)
+            state = {**base, "final_story": story, "plan": {**base["plan"], "word_limit": 2 * len(story.split())}}
+            r_ms, r_tok, _ = run(state, False, args.repeat)
+            e_ms, e_tok, fell = run(state, True, args.repeat)
+            print(f"{n:9d} {len(story.split()):6d} {r_ms:11.1f} {r_tok:8.0f} "
+                  f"{e_ms:9.1f} {e_tok:8.0f} {fell:>6d}/{args.repeat:<3d} x{r_ms / e_ms:7.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# benchmarks/bench_startup.py
+"""
+Cold-start import cost per entry point, from `python -X importtime`.
+
+Each target is imported in a fresh interpreter (--repeat times, median kept);
+the report shows the import time of the target itself and of the heaviest
+packages it pulled in. Modules the bare interpreter already loads are excluded.
+
+    python -m benchmarks.bench_startup [--repeat 5] [--top 5] [target ...]
+"""
+import argparse, os, statistics, subprocess, sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TARGETS = [
+    "app.metrics", "app.utils", "app.repair", "app.safety", "app.telemetry",
+    "app.nodes", "app.graph", "main",
+]
+
+def _importtime(code: str) -> list:
+    env = {**os.environ, "PYTHONWARNINGS": "ignore"}
+    err = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                         cwd=ROOT, env=env, capture_output=True, text=True, check=True).stderr
+    rows = []
+    for line in err.splitlines():
+        parts = line[len("import time:"):].split("|") if line.startswith("import time:") else []
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            name = parts[2]
+            rows.append((len(name) - len(name.lstrip()), name.strip(), int(parts[1])))
+    return rows
+
+_STARTUP = None   # modules the bare interpreter already imports (site, encodings, ...)
+
+def import_times(target: str) -> dict:
+    """{"__total__": us, package: cumulative us} for one cold import of target."""
+    global _STARTUP
+    if _STARTUP is None:
+        _STARTUP = {name for _, name, _ in _importtime("pass")}
+    times = {"__total__": 0}
+    for indent, name, cumulative in _importtime(f"import {target}"):
+        if name in _STARTUP:
+            continue
+        if indent == 1:   # top level: "import time: ... | name" has one space
+            times["__total__"] += cumulative
+        root = name.split(".")[0]
+        times[root] = max(times.get(root, 0), cumulative)   # a package's first import covers it
+    return times
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("targets", nargs="*", default=TARGETS)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--top", type=int, default=4, help="heaviest dependencies to list per target")
+    args = ap.parse_args()
+
+    print(f"{'target':14s} {'import ms':>10s}  heaviest dependencies (ms)")
+    for target in args.targets:
+        runs = [import_times(target) for _ in range(args.repeat)]
+        total = statistics.median(r["__total__"] for r in runs) / 1000
+        deps = {}
+        for r in runs:
+            for k, v in r.items():
+                if k not in ("__total__", "app", target.split(".")[0]):
+                    deps.setdefault(k, []).append(v)
+        heavy = sorted(((statistics.median(v) / 1000, k) for k, v in deps.items()), reverse=True)[: args.top]
+        print(f"{target:14s} {total:10.1f}  " + ", ".join(f"{k} {ms:.1f}" for ms, k in heavy if ms >= 1.0))
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,10 @@
 # main.py
-import os, textwrap
-from dotenv import load_dotenv
-from app.graph import build_graph
+import os, sys, textwrap, asyncio, argparse, json
+from app.graph import get_graph, warm_graphs
+from app.budget import load_encoder
 from app.nodes import judge_node, feedback_revise, finalize_node
-
-load_dotenv()
+from app.streaming import stream_story
+from app.state import merge_update
 
 def print_scores(report):
     s = report["scores"]
@@ -24,30 +24,78 @@ def print_scores(report):
 
 
 def run_once(user_request: str):
-    graph = build_graph()
+    graph = get_graph()
     state = {"user_request": user_request, "revise_count": 0}
     # No recursion limit needed now; graph is DAG
     state = graph.invoke(state)
     return state
 
 
+async def arun_once(user_request: str):
+    # async entry point: one event loop can keep many stories in flight
+    graph = get_graph(use_async=True)
+    state = {"user_request": user_request, "revise_count": 0}
+    return await graph.ainvoke(state)
+
+
+async def arun_many(user_requests, concurrency: int = 100):
+    # run many requests concurrently; results keep input order
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(req):
+        async with sem:
+            return await arun_once(req)
+
+    return await asyncio.gather(*(one(r) for r in user_requests))
+
+
+STREAM_HEADERS = {
+    "tell_step": "\nWriting your story...\n\n",
+    "retell_step": "\n\n(starting over with a gentler story...)\n\n",
+    "soften_step": "\n\n(softening a few words...)\n\n",
+    "revise_step": "\n\n(polishing after the judge's notes...)\n\n",
+}
+
+def run_streaming(user_request: str):
+    # prints story text as it arrives; returns (final state, last streamed text)
+    state, node, parts = None, None, []
+    for ev in stream_story(user_request):
+        if ev["type"] == "token":
+            if ev["node"] != node:
+                node, parts = ev["node"], []
+                print(STREAM_HEADERS.get(node, "\n"), end="", flush=True)
+            parts.append(ev["text"])
+            print(ev["text"], end="", flush=True)
+        elif ev["type"] == "done":
+            state = ev["state"]
+    print()
+    return state, "".join(parts).strip()
+
+
 def main():
+    warm_graphs()
+    load_encoder()
     print("Welcome to the Bedtime Story Agent ✨ (ages 5–10)")
     user_request = input("What kind of story do you want to hear? ").strip()
     if not user_request:
         user_request = "A cosy story about a shy firefly who learns to glow with a friend."
 
-    # First pass
-    state = run_once(user_request)
+    # First pass (draft is printed live as it streams)
+    state, streamed = run_streaming(user_request)
 
-    print("\n" + "-"*70)
-    print("\nFINAL STORY (v1)\n")
-    print(textwrap.fill(state["final_story"], width=92))
-    print("\n" + "-"*70)
+    if streamed and state["final_story"].startswith(streamed):
+        # finalize only appended the goodnight tail
+        print(state["final_story"][len(streamed):].strip())
+        print("\n" + "-"*70)
+    else:
+        print("\n" + "-"*70)
+        print("\nFINAL STORY (v1)\n")
+        print(textwrap.fill(state["final_story"], width=92))
+        print("\n" + "-"*70)
 
     # Re-judge the FINAL story
     state["draft_story"] = state["final_story"]
-    state = judge_node(state)
+    state = merge_update(state, judge_node(state))
     print_scores(state["judge_report"])
 
     if state["judge_report"].get("metrics"):
@@ -59,8 +107,9 @@ def main():
     print("\nWould you like any changes? (e.g., 'make it shorter', 'add a friendly owl', 'more rhyme')")
     fb = input("Your feedback (or press Enter to skip): ").strip()
     if fb:
-        state = feedback_revise(state, fb)
-        state = finalize_node(state)
+        print("\nRevising...\n")
+        state = merge_update(state, feedback_revise(state, fb, on_token=lambda node, text: print(text, end="", flush=True)))
+        state = merge_update(state, finalize_node(state))
 
         print("\n" + "-"*70)
         print("\nFINAL STORY (v2, after feedback)\n")
@@ -68,8 +117,93 @@ def main():
         print("\n" + "-"*70)
 
         state["draft_story"] = state["final_story"]
-        state = judge_node(state)
+        state = merge_update(state, judge_node(state))
         print_scores(state["judge_report"])
 
+def batch_main(argv):
+    from app.batch import run_batch_sync
+    ap = argparse.ArgumentParser(prog="main.py batch", description="Generate stories for a JSONL file of requests.")
+    ap.add_argument("input", help='JSONL, one {"id": ..., "user_request": ...} per line')
+    ap.add_argument("output", help="JSONL results, appended incrementally")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--no-resume", action="store_true", help="overwrite output instead of skipping finished ids")
+    ap.add_argument("--max-retries", type=int, default=5, help="retries per story on rate limits / connection errors")
+    ap.add_argument("--best-of", type=int, default=1, help="draft N stories in parallel per request and keep the best")
+    args = ap.parse_args(argv)
+    load_encoder()
+    stats = run_batch_sync(
+        args.input, args.output,
+        concurrency=args.concurrency,
+        resume=not args.no_resume,
+        max_retries=args.max_retries,
+        best_of=args.best_of,
+    )
+    print(json.dumps(stats, indent=2))
+
+
+def inventory_main(argv):
+    from app.inventory import Inventory, fill_sync, fill_targets
+    ap = argparse.ArgumentParser(prog="main.py inventory", description="Pre-generate and manage the story inventory.")
+    ap.add_argument("action", choices=["fill", "stats", "prune"])
+    ap.add_argument("--db", default=os.getenv("STORYDAG_INVENTORY_DB", "inventory.db"))
+    ap.add_argument("--per-bucket", type=int, default=2, help="stories per category/mood/use combination")
+    ap.add_argument("--popular", type=int, default=20, help="most requested must_include sets to stock")
+    ap.add_argument("--per-popular", type=int, default=3, help="stories per popular must_include set")
+    ap.add_argument("--concurrency", type=int, default=4)
+    ap.add_argument("--max-stories", type=int, default=None, help="stop after this many new stories")
+    ap.add_argument("--window", default=None, help="off-peak hours, e.g. 1-6 or 22-6 (local time); no new stories outside it")
+    args = ap.parse_args(argv)
+    inv = Inventory(args.db)
+    if args.action == "fill":
+        load_encoder()
+        inv.prune()
+        window = tuple(int(h) for h in args.window.split("-")) if args.window else None
+        targets = fill_targets(inv, args.per_bucket, args.popular, args.per_popular)
+        print(json.dumps(fill_sync(inv, targets=targets, concurrency=args.concurrency,
+                                   max_stories=args.max_stories, window=window), indent=2))
+    elif args.action == "prune":
+        print(json.dumps({"pruned": inv.prune()}))
+    print(json.dumps(inv.stats(), indent=2))
+
+
+def serve_main(argv):
+    import uvicorn
+    from app.server import create_app
+    ap = argparse.ArgumentParser(prog="main.py serve", description="Serve stories over HTTP.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8000)
+    ap.add_argument("--concurrency", type=int, default=None, help="stories running at once")
+    ap.add_argument("--queue", type=int, default=None, help="admitted requests that may wait for a slot")
+    ap.add_argument("--per-client", type=int, default=None, help="requests one client may have in flight")
+    ap.add_argument("--sessions", default=None, help="SQLite file for feedback sessions (default: in memory)")
+    ap.add_argument("--fake-llm", action="store_true", help="answer LLM calls from a local fake server (app.replay)")
+    args = ap.parse_args(argv)
+    if args.fake_llm:
+        from app.llm import configure_client
+        from app.replay import FakeChatServer
+        srv = FakeChatServer().start()
+        configure_client(base_url=srv.base_url, api_key="fake")
+    store = None
+    if args.sessions:
+        from app.sessions import SessionStore
+        store = SessionStore(args.sessions)
+    app = create_app(store, concurrency=args.concurrency, queue_size=args.queue, per_client=args.per_client)
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+def cli(argv=None):
+    from dotenv import load_dotenv
+    load_dotenv()
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "batch":
+        batch_main(argv[1:])
+    elif argv and argv[0] == "inventory":
+        inventory_main(argv[1:])
+    elif argv and argv[0] == "serve":
+        serve_main(argv[1:])
+    else:
+        main()
+
+
 if __name__ == "__main__":
-    main()
+    cli()
@@ -0,0 +1,15 @@
+import pytest
+
+from app import cache, llm
+from app.llm import configure_client
+from app.replay import FakeChatServer
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    """The process-wide client pointed at a local FakeChatServer; no response cache."""
+    monkeypatch.setattr(llm, "_CLIENT", None)
+    monkeypatch.setattr(cache, "_CACHE", None)
+    with FakeChatServer() as srv:
+        configure_client(base_url=srv.base_url, api_key="fake")
+        yield srv
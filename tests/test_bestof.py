@@ -0,0 +1,22 @@
+from app.bestof import _to_judge
+from app.repair import FIX_DIALOGUE, FIX_TAIL, FIX_TRIM
+
+
+def cand(index, *faults):
+    return {"index": index, "faults": list(faults)}
+
+
+def test_mechanical_faults_are_still_judged():
+    cands = [cand(0, FIX_TAIL), cand(1, FIX_TRIM, FIX_DIALOGUE), cand(2), cand(3, "age_fit")]
+    assert [c["index"] for c in _to_judge(cands)] == [0, 1, 2]
+
+
+def test_unsafe_drafts_are_dropped():
+    cands = [cand(0, "unsafe"), cand(1, FIX_TAIL)]
+    assert [c["index"] for c in _to_judge(cands)] == [1]
+
+
+def test_all_doomed_keeps_the_least_bad():
+    cands = [cand(0, "unsafe", FIX_TAIL), cand(1, "missing_must_include", "age_fit"),
+             cand(2, "age_fit", FIX_TAIL), cand(3, "age_fit")]
+    assert [c["index"] for c in _to_judge(cands)] == [3]
@@ -0,0 +1,69 @@
+import asyncio
+import json
+
+import pytest
+
+from app import cache, nodes
+from app.cache import LRUCache, ResponseCache, SQLiteCache
+
+KEYS = ("scores", "required_fixes")
+WHOLE = '{"scores": {"arc": 4}, "required_fixes": [], "keep_strengths": []}'
+
+
+@pytest.fixture
+def rc(monkeypatch):
+    rc = ResponseCache()
+    monkeypatch.setattr(cache, "_CACHE", rc)
+    return rc
+
+def streaming(monkeypatch, text):
+    chunks = [text[i:i + 7] for i in range(0, len(text), 7)]
+
+    def gen():
+        yield from chunks
+
+    async def agen():
+        for c in chunks:
+            yield c
+    monkeypatch.setattr(nodes, "_chat_stream", lambda *a, **kw: gen())
+    monkeypatch.setattr(nodes, "_achat_stream", lambda *a, **kw: agen())
+
+
+def test_a_cut_off_judge_reply_is_not_cached(rc, monkeypatch):
+    streaming(monkeypatch, '{"scores": {"arc": 4}, "requir')
+    out = nodes._json_until("judge me", 0.0, 100, KEYS)
+    assert json.loads(out) == {"scores": {"arc": 4}}
+    assert len(rc.memory) == 0
+
+
+def test_a_complete_judge_reply_is_cached(rc, monkeypatch):
+    streaming(monkeypatch, WHOLE)
+    out = nodes._json_until("judge me", 0.0, 100, KEYS)
+    assert set(json.loads(out)) >= set(KEYS)
+    assert nodes._json_until("judge me", 0.0, 100, KEYS) == out
+    assert rc.stats()["hits"] == 1
+
+
+def test_async_cut_off_reply_is_not_cached(rc, monkeypatch):
+    streaming(monkeypatch, '{"scores": {"arc": 4}')
+    asyncio.run(nodes._ajson_until("judge me", 0.0, 100, KEYS))
+    assert len(rc.memory) == 0
+    streaming(monkeypatch, WHOLE)
+    asyncio.run(nodes._ajson_until("judge me", 0.0, 100, KEYS))
+    assert len(rc.memory) == 1
+
+
+def test_async_tiers(tmp_path):
+    disk = SQLiteCache(str(tmp_path / "cache.db"))
+    rc = ResponseCache(memory=LRUCache(), disk=disk)
+
+    async def run():
+        await rc.aset("k", "v")
+        rc.memory.clear()
+        assert await rc.aget("k") == "v"    # from disk, promoted
+        assert await rc.aget("k") == "v"    # from memory
+        assert await rc.aget("missing") is None
+    asyncio.run(run())
+    stats = rc.stats()
+    assert (stats["disk_hits"], stats["memory_hits"], stats["misses"]) == (1, 1, 1)
+    disk.close()
@@ -0,0 +1,87 @@
+import pytest
+
+from app.edits import EditError, EditableStory, parse_edits
+from app.metrics import compute_metrics
+
+STORY = "Pip was small. Pip was shy!\n\nA frog came by. \"Hello,\" said Moss.\n\nGood night."
+
+
+def test_round_trip_and_numbering():
+    ed = EditableStory(STORY)
+    assert ed.text == STORY
+    assert len(ed) == 5
+    assert ed.numbered() == ('s1: Pip was small.\ns2: Pip was shy!\n\ns3: A frog came by.\n'
+                             's4: "Hello," said Moss.\n\ns5: Good night.')
+
+
+def test_round_trip_keeps_leading_whitespace_and_unterminated_tail():
+    story = "  Once upon a time\nthere was an owl"
+    assert EditableStory(story).text == story
+
+
+def test_replace_insert_delete():
+    ed = EditableStory(STORY)
+    changed = ed.apply([
+        {"op": "replace", "id": "s1", "text": "Pip was a tiny firefly."},
+        {"op": "insert", "id": "s2", "text": "An owl hooted."},
+        {"op": "delete", "id": "s4"},
+    ])
+    assert ed.text == ("Pip was a tiny firefly. Pip was shy! An owl hooted.\n\n"
+                       "A frog came by.\n\nGood night.")
+    assert changed == ["s1", "s6"]
+
+
+def test_inserts_on_one_anchor_keep_their_order():
+    ed = EditableStory(STORY)
+    ed.apply([{"op": "insert", "id": "s3", "text": "One."},
+              {"op": "insert", "id": "s3", "text": "Two."},
+              {"op": "insert", "id": "s3", "text": "Three."}])
+    assert "A frog came by. One. Two. Three. \"Hello,\"" in ed.text
+
+
+def test_inserts_at_the_start_keep_their_order():
+    ed = EditableStory(STORY)
+    ed.apply([{"op": "insert", "id": "s0", "text": "First."},
+              {"op": "insert", "id": "s0", "text": "Second."}])
+    assert ed.text.startswith("First. Second. Pip was small.")
+
+
+def test_inserts_after_a_paragraph_end_take_over_the_break():
+    ed = EditableStory(STORY)
+    ed.apply([{"op": "insert", "id": "s2", "text": "One."},
+              {"op": "insert", "id": "s2", "text": "Two."}])
+    assert ed.text.startswith("Pip was small. Pip was shy! One. Two.\n\nA frog came by.")
+
+
+@pytest.mark.parametrize("edits", [
+    [{"op": "replace", "id": "s9", "text": "x"}],
+    [{"op": "rewrite", "id": "s1", "text": "x"}],
+    [{"op": "replace", "id": "s1", "text": "  "}],
+    [{"op": "replace", "id": "s1", "text": "a"}, {"op": "delete", "id": "s1"}],
+    ["s1"],
+])
+def test_bad_edit_lists_change_nothing(edits):
+    ed = EditableStory(STORY)
+    with pytest.raises(EditError):
+        ed.apply([{"op": "insert", "id": "s1", "text": "Fine."}] + edits)
+    assert ed.text == STORY
+
+
+def test_metrics_match_compute_metrics_after_edits():
+    ed = EditableStory(STORY)
+    ed.metrics(["owl"], "bedtime", 50)   # warm the per-sentence counts
+    ed.apply([{"op": "replace", "id": "s3", "text": "An owl and a frog came by."},
+              {"op": "insert", "id": "s4", "text": "'Sleep,' said Owl."},
+              {"op": "delete", "id": "s1"}])
+    assert ed.metrics(["owl"], "bedtime", 50) == compute_metrics(ed.text, ["owl"], "bedtime", 50)
+
+
+def test_parse_edits():
+    raw = 'Sure! {"edits": [{"op": "delete", "id": "s2"}]} Hope that helps.'
+    assert parse_edits(raw) == [{"op": "delete", "id": "s2"}]
+    with pytest.raises(EditError):
+        parse_edits('{"edits": [{"op": "delete", "id": "s2"}')   # cut off at max_tokens
+    with pytest.raises(EditError):
+        parse_edits('{"changes": []}')
+    with pytest.raises(EditError):
+        parse_edits(None)
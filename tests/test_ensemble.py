@@ -0,0 +1,115 @@
+import asyncio
+import json
+
+import pytest
+
+from app import ensemble
+from app.ensemble import PANEL, _Round, make_ensemble_judge_node
+from app.nodes import _judge_metrics
+from app.prompts import _SCORE_KEYS
+
+STATE = {
+    "classification": {"intended_use": "bedtime"},
+    "constraints": {"must_include": ["owl"]},
+    "plan": {"word_limit": 120},
+    "draft_story": "An owl sat in a tree. The moon was big and soft. The owl said good night to the stars.\n\n"
+                   "The end. Sweet dreams.",
+}
+JUDGES = list(PANEL)
+
+def reply(low=None, fixes=(), strengths=()):
+    scores = {k: 5 for k in _SCORE_KEYS}
+    scores.update(low or {})
+    return json.dumps({"scores": scores, "required_fixes": list(fixes), "keep_strengths": list(strengths)})
+
+PASS = reply(strengths=["calm"])
+REVISE = reply({"arc": 2}, ["Give the owl a small problem."])
+
+def new_round(quorum=2):
+    return _Round(STATE, _judge_metrics(STATE), JUDGES, quorum)
+
+
+def test_quorum_decides_early():
+    rnd = new_round()
+    assert not rnd.done(JUDGES[0], PASS, 0.1)
+    assert rnd.done(JUDGES[1], PASS, 0.2)
+    rep = rnd.result()["judge_report"]
+    assert rep["verdict"] == "pass"
+    assert rep["source"] == "ensemble"
+    ens = rep["ensemble"]
+    assert ens["reached"] and ens["votes"] == {"pass": 2, "revise": 0}
+    assert ens["cancelled"] == 1
+    assert [r["status"] for r in ens["judges"]] == ["done", "done", "cancelled"]
+
+
+def test_merge_takes_minimum_of_the_winning_side():
+    rnd = new_round()
+    rnd.done(JUDGES[0], reply({"arc": 3, "clarity": 4}, ["Give the owl a small problem."]), 0.1)
+    rnd.done(JUDGES[1], PASS, 0.1)
+    assert rnd.done(JUDGES[2], reply({"arc": 2}, ["Give the owl a small problem.", "Add a friend."]), 0.1)
+    rep = rnd.result()["judge_report"]
+    assert rep["verdict"] == "revise"
+    assert rep["scores"]["arc"] == 2
+    assert rep["scores"]["clarity"] == 4   # the passing judge's 5 doesn't count
+    assert rep["required_fixes"] == ["Give the owl a small problem.", "Add a friend."]
+    assert rep["ensemble"]["agreement"] == round(2 / 3, 4)
+
+
+def test_clamp_fixes_are_not_repeated():
+    state = {**STATE, "constraints": {"must_include": ["fox"]}}
+    rnd = _Round(state, _judge_metrics(state), JUDGES, 2)
+    rnd.done(JUDGES[0], PASS, 0.1)
+    rnd.done(JUDGES[1], PASS, 0.1)
+    fixes = rnd.result()["judge_report"]["required_fixes"]
+    assert fixes == ["Explicitly include: ['fox']."]
+
+
+def test_tie_revises():
+    rnd = new_round(quorum=2)
+    rnd.done(JUDGES[0], PASS, 0.1)
+    rnd.done(JUDGES[1], REVISE, 0.1)
+    assert not rnd.done(JUDGES[2], None, 0.1, TimeoutError("slow"))
+    rep = rnd.result()["judge_report"]
+    assert rep["verdict"] == "revise"
+    assert not rep["ensemble"]["reached"]
+    assert rep["ensemble"]["judges"][2]["status"] == "error"
+
+
+def test_all_errors_raise_the_first():
+    rnd = new_round()
+    first = ConnectionError("down")
+    for judge, err in zip(JUDGES, (first, TimeoutError("slow"), ValueError("bad"))):
+        rnd.done(judge, None, 0.1, err)
+    with pytest.raises(ConnectionError):
+        rnd.result()
+
+
+def test_node_reports_the_ensemble(monkeypatch):
+    monkeypatch.setattr(ensemble, "_judge_raw", lambda call, cancel=None: PASS)
+    node = make_ensemble_judge_node(2, prejudge=False, quorum=1)
+    rep = node(STATE)["judge_report"]
+    assert rep["verdict"] == "pass"
+    assert rep["ensemble"]["votes"]["pass"] >= 1
+
+
+def test_async_garbage_reply_counts_as_an_error(monkeypatch):
+    async def judge_raw(call):
+        if "parent at bedtime" in call[0]:
+            return "I loved it!"   # answers first, unparseable
+        await asyncio.sleep(0.01)
+        return PASS
+
+    monkeypatch.setattr(ensemble, "_ajudge_raw", judge_raw)
+    node = make_ensemble_judge_node(3, use_async=True, prejudge=False)
+    rep = asyncio.run(node(STATE))["judge_report"]
+    assert rep["verdict"] == "pass"
+    rows = {r["name"]: r for r in rep["ensemble"]["judges"]}
+    assert rows["bedtime"]["status"] == "error"
+    assert rep["ensemble"]["votes"]["pass"] == 2
+
+
+def test_bad_panel_sizes():
+    with pytest.raises(ValueError):
+        make_ensemble_judge_node(1)
+    with pytest.raises(ValueError):
+        make_ensemble_judge_node(3, quorum=4)
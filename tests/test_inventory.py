@@ -0,0 +1,124 @@
+import sqlite3
+import time
+
+import pytest
+
+from app import inventory
+from app.graph import get_graph
+from app.inventory import Inventory, _stocked, bucket_of, must_key
+from app.sessions import SessionStore, resume_feedback, run_session
+
+CLS = {"category": "animal", "mood": "soothing", "intended_use": "bedtime"}
+
+
+@pytest.fixture
+def inv(tmp_path):
+    inv = Inventory(str(tmp_path / "inventory.db"), max_age_s=3600, max_serves=2)
+    yield inv
+    inv.close()
+
+def put(inv, story, must=(), classification=CLS):
+    return inv.put({"classification": classification, "constraints": {"must_include": list(must)},
+                    "user_request": story, "final_story": story, "judge_report": {"verdict": "pass"}})
+
+def take(inv, must=(), classification=CLS):
+    return inv.take(classification, {"must_include": list(must)}, "request")
+
+
+def test_bucket_and_must_key():
+    assert bucket_of(CLS) == "animal/soothing/bedtime"
+    assert bucket_of({}) == "custom/soothing/bedtime"
+    assert must_key([" Owl", "fox", "owl", ""]) == "fox|owl"
+
+
+def test_other_bucket_misses(inv):
+    put(inv, "A fox naps.")
+    assert take(inv, classification={**CLS, "mood": "light-playful"}) is None
+    assert take(inv)["story"] == "A fox naps."
+
+
+def test_story_must_contain_every_term(inv):
+    put(inv, "A fox naps.")
+    assert take(inv, ["owl"]) is None
+    put(inv, "A fox and an owl nap.", ["fox"])
+    assert take(inv, ["owl"])["story"] == "A fox and an owl nap."
+
+
+def test_exact_terms_preferred(inv):
+    put(inv, "A fox and an owl nap.")
+    owl = put(inv, "An owl and a fox nap.", ["owl"])
+    assert take(inv, ["owl"])["id"] == owl
+
+
+def test_rotation_by_serves(inv):
+    a, b = put(inv, "A fox naps."), put(inv, "A fox dreams.")
+    assert [take(inv)["id"] for _ in range(4)] == [a, b, a, b]
+    assert take(inv) is None   # both served max_serves times
+
+
+def test_retired_by_age(inv):
+    sid = put(inv, "A fox naps.")
+    inv._db.execute("UPDATE stories SET created = ? WHERE id = ?", (time.time() - 7200, sid))
+    assert take(inv) is None
+    assert inv.live() == {}
+
+
+def test_prune_drops_stale_and_used_up(inv):
+    old, used = put(inv, "A fox naps."), put(inv, "A fox dreams.")
+    put(inv, "A fox sleeps.")
+    inv._db.execute("UPDATE stories SET created = ? WHERE id = ?", (time.time() - 7200, old))
+    inv._db.execute("UPDATE stories SET served = 2 WHERE id = ?", (used,))
+    assert inv.prune() == 2
+    assert inv.stats()["stories"] == 1
+
+
+def test_demand_and_stats(inv):
+    put(inv, "A fox and an owl nap.", ["owl"])
+    take(inv, ["owl"])
+    take(inv, ["moon"])
+    take(inv, ["moon"])
+    assert [m for _, m, _ in inv.popular(5)] == ["moon", "owl"]
+    stats = inv.stats()
+    assert stats["lookups"] == 3
+    assert stats["hits"] == 1
+    assert stats["hit_rate"] == round(1 / 3, 4)
+    assert stats["servable"] == 1
+    assert stats["buckets"] == 1
+
+
+def test_stocked_counts_supersets():
+    live = {("animal/soothing/bedtime", "fox|owl"): 2, ("animal/soothing/bedtime", "fox"): 1,
+            ("fantasy-gentle/soothing/bedtime", "owl"): 5}
+    assert _stocked(live, "animal/soothing/bedtime", "owl") == 2
+    assert _stocked(live, "animal/soothing/bedtime", "") == 3
+
+
+def test_feedback_after_inventory_hit(inv, fake_llm, monkeypatch):
+    request = "A sleepy hedgehog under the moon"
+    stocked = get_graph(inventory=False).invoke({"user_request": request, "revise_count": 0})
+    inv.put(stocked)
+    monkeypatch.setattr(inventory, "_INVENTORY", inv)
+    monkeypatch.setattr(inventory, "_LOADED", True)
+
+    store = SessionStore(":memory:")
+    sid, state = run_session(store, request)
+    assert state["inventory"]["hit"]
+    assert state["plan"] == stocked["plan"]
+    state = resume_feedback(store, sid, "Add a friendly owl.")
+    assert state["final_story"] != stocked["final_story"]
+    assert state["judge_report"]["metrics"]["word_limit"] == stocked["plan"]["word_limit"]
+
+
+def test_legacy_rows_serve_without_a_plan(tmp_path):
+    path = str(tmp_path / "old.db")
+    db = sqlite3.connect(path)
+    db.execute("CREATE TABLE stories (id INTEGER PRIMARY KEY AUTOINCREMENT, bucket TEXT NOT NULL, must TEXT NOT NULL,"
+               " user_request TEXT NOT NULL, story TEXT NOT NULL, report TEXT NOT NULL, created REAL NOT NULL,"
+               " served INTEGER NOT NULL DEFAULT 0, last_served REAL NOT NULL DEFAULT 0)")
+    db.execute("INSERT INTO stories (bucket, must, user_request, story, report, created) VALUES (?, '', '', ?, '{}', ?)",
+               (bucket_of(CLS), "A fox naps.", time.time()))
+    db.commit()
+    db.close()
+    old = Inventory(path)
+    assert take(old)["plan"] == {}
+    old.close()
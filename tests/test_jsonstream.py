@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+from app.utils import JSONStream, extract_json, repair_json
+
+REPORT = {
+    "scores": {"safety": 5, "arc": 4},
+    "required_fixes": ["Trim to word limit.", "Say \"good night\", {gently}"],
+    "keep_strengths": [],
+    "verdict": "revise",
+    "evidence": {"arc": "a clear beginning, middle and end"},
+}
+
+
+def _fed(text, step):
+    p, members = JSONStream(), []
+    for i in range(0, len(text), step):
+        members += p.feed(text[i:i + step])
+    return p, members
+
+
+@pytest.mark.parametrize("step", [1, 3, 7, 1000])
+def test_members_arrive_in_order_whatever_the_chunking(step):
+    p, members = _fed("Here you go:\n```json\n" + json.dumps(REPORT) + "\n```", step)
+    assert [k for k, _ in members] == list(REPORT)
+    assert dict(members) == REPORT
+    assert p.done and p.value() == REPORT
+
+
+def test_a_member_is_reported_once_its_comma_arrives():
+    p = JSONStream()
+    assert p.feed('{"verdict": "pass"') == []
+    assert p.feed(', "scores": {"safety": 5') == [("verdict", "pass")]
+    assert p.feed("}}") == [("scores", {"safety": 5})]
+
+
+def test_truncated_inside_a_string_cuts_back_to_the_last_complete_value():
+    text = json.dumps(REPORT)
+    cut = text[: text.index("a clear") + 5]
+    p, _ = _fed(cut, 4)
+    assert not p.done
+    # the half-written member is dropped whole
+    assert p.value() == {k: REPORT[k] for k in ("scores", "required_fixes", "keep_strengths", "verdict")}
+
+
+def test_truncated_inside_a_nested_list_keeps_its_complete_items():
+    assert repair_json('{"scores": {"safety": 5}, "required_fixes": ["one", "tw') == {
+        "scores": {"safety": 5}, "required_fixes": ["one"]}
+
+
+def test_no_object_yet():
+    p = JSONStream()
+    p.feed("Sure, here is the JSON")
+    assert p.value() is None
+    assert repair_json('{"a') == {}
+
+
+def test_extract_json_recovers_a_reply_cut_off_at_max_tokens():
+    assert extract_json('{"category": "animal", "mood": "soo') == {"category": "animal"}
+    assert extract_json('```json\n{"a": 1}\n```') == {"a": 1}
+    with pytest.raises(ValueError):
+        extract_json("no json here")
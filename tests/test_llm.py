@@ -0,0 +1,150 @@
+import asyncio
+import contextlib
+import time
+import types
+
+import httpx
+import pytest
+from openai import APIConnectionError
+
+from app import telemetry
+from app.llm import LLMClient
+
+
+def _reply(text="ok", total=50):
+    usage = types.SimpleNamespace(total_tokens=total)
+    msg = types.SimpleNamespace(message=types.SimpleNamespace(content=text))
+    return types.SimpleNamespace(choices=[msg], usage=usage)
+
+
+@pytest.fixture
+def client():
+    c = LLMClient(api_key="x", base_url="http://127.0.0.1:9", rpm=0, tpm=60_000,
+                  base_delay=0.0, hedge_nodes=())
+    return c
+
+
+def _fail_then(client, failures, reply):
+    calls = []
+
+    def create(**req):
+        calls.append(req)
+        if len(calls) <= failures:
+            raise APIConnectionError(request=httpx.Request("POST", "http://x"))
+        return reply
+    client.client.chat.completions.create = create
+    return calls
+
+
+def test_retries_refund_the_failed_attempts_tokens(client):
+    bucket = client.limiter.tokens
+    start = bucket._level
+    calls = _fail_then(client, 3, _reply(total=50))
+    assert client.complete("m", "p" * 400, 0.0, 100) == "ok"
+    assert len(calls) == 4
+    # one estimate (100 prompt + 100 reply) reserved, settled down to the 50 used
+    assert start - bucket._level == pytest.approx(50, abs=1)
+
+
+def test_a_call_that_gives_up_leaves_no_reservation(client):
+    bucket = client.limiter.tokens
+    start = bucket._level
+    client.max_retries = 1
+    _fail_then(client, 5, _reply())
+    with pytest.raises(APIConnectionError):
+        client.complete("m", "p" * 400, 0.0, 100)
+    assert bucket._level == pytest.approx(start, abs=1)
+
+
+def _chunk(text):
+    return types.SimpleNamespace(usage=None, choices=[types.SimpleNamespace(delta=types.SimpleNamespace(content=text))])
+
+
+class _Stream:
+    # a chat stream whose first chunk takes `delay` seconds
+    def __init__(self, words, delay=0.0):
+        self.chunks = [_chunk(w) for w in words]
+        self.delay = delay
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.delay:
+            time.sleep(self.delay)
+            self.delay = 0
+        if not self.chunks:
+            raise StopIteration
+        return self.chunks.pop(0)
+
+    def close(self):
+        self.closed = True
+
+
+class _AStream(_Stream):
+    async def __anext__(self):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+            self.delay = 0
+        if not self.chunks:
+            raise StopAsyncIteration
+        return self.chunks.pop(0)
+
+    async def close(self):
+        self.closed = True
+
+
+@contextlib.contextmanager
+def _in_node(name):
+    token = telemetry._CURRENT.set({"node": name, "calls": []})
+    try:
+        yield
+    finally:
+        telemetry._CURRENT.reset(token)
+
+
+@pytest.fixture
+def hedging():
+    c = LLMClient(api_key="x", base_url="http://127.0.0.1:9", rpm=0, tpm=0,
+                  hedge_nodes=("judge_step",), hedge_min_samples=1)
+    c.latency.add("judge_step:first_token", 0.02)
+    return c
+
+
+def test_a_slow_judge_stream_is_hedged(hedging):
+    streams = [_Stream(["slow"], delay=0.5), _Stream(["fast", "er"])]
+    opened = iter(streams)
+    hedging.client.chat.completions.create = lambda **req: next(opened)
+    with _in_node("judge_step"):
+        assert "".join(hedging.stream("m", "p", 0.0, 50)) == "faster"
+    assert hedging.stats["hedges"] == 1 and hedging.stats["hedge_wins"] == 1
+    assert streams[1].closed
+    deadline = time.time() + 2
+    while not streams[0].closed and time.time() < deadline:
+        time.sleep(0.01)
+    assert streams[0].closed   # the loser is hung up on once it opens
+
+
+def test_a_slow_judge_astream_is_hedged(hedging):
+    streams = [_AStream(["slow"], delay=0.5), _AStream(["fast", "er"])]
+
+    opened = iter(streams)
+
+    async def create(**req):
+        return next(opened)
+    hedging.aclient.chat.completions.create = create
+
+    async def run():
+        with _in_node("judge_step"):
+            return "".join([t async for t in hedging.astream("m", "p", 0.0, 50)])
+    assert asyncio.run(run()) == "faster"
+    assert hedging.stats["hedges"] == 1 and hedging.stats["hedge_wins"] == 1
+    assert streams[0].closed and streams[1].closed
+
+
+def test_other_nodes_stream_unhedged(hedging):
+    hedging.client.chat.completions.create = lambda **req: _Stream(["a", "b"], delay=0.1)
+    with _in_node("tell_step"):
+        assert "".join(hedging.stream("m", "p", 0.0, 50)) == "ab"
+    assert hedging.stats["hedges"] == 0
@@ -0,0 +1,53 @@
+import random
+
+import pytest
+
+from app.metrics import MetricsAccumulator, batch_counts, compute_metrics, compute_metrics_batch, text_counts
+
+ALPHABET = list("ab'\" .!?\n\t_9éï—“”’２𝒳　") + ["don't", "Good night.", "king"]
+
+def _corpus(seed, n, size=40):
+    rng = random.Random(seed)
+    return [""] + ["".join(rng.choice(ALPHABET) for _ in range(rng.randint(0, size))) for _ in range(n)]
+
+
+@pytest.mark.parametrize("block", [1, 3, 64])
+def test_batch_counts_match_text_counts(block):
+    stories = _corpus(block, 2000)
+    for i in range(0, len(stories), block):
+        part = stories[i:i + block]
+        assert batch_counts(part).tolist() == [list(text_counts(s)) for s in part]
+
+
+def test_batch_counts_fall_back_on_nul():
+    part = ["a\x00b. c", "'x'"]
+    assert batch_counts(part).tolist() == [list(text_counts(s)) for s in part]
+
+
+def test_compute_metrics_batch_matches_compute_metrics():
+    stories = _corpus(1, 500, size=200)
+    out = compute_metrics_batch(stories, word_limit=30, chunksize=64)
+    for i, s in enumerate(stories):
+        m = compute_metrics(s, [], "bedtime", 30)
+        assert out["word_count"][i] == m["word_count"]
+        assert out["dialogue_lines"][i] == m["dialogue_lines"]
+        assert out["over_word_limit"][i] == m["over_word_limit"]
+        assert abs(out["avg_sentence_len"][i] - m["avg_sentence_len"]) < 0.011
+        assert abs(out["coleman_liau_index"][i] - m["coleman_liau_index"]) < 0.011
+    assert compute_metrics_batch([])["word_count"].shape == (0,)
+
+
+def test_accumulator_matches_compute_metrics_at_any_point():
+    rng = random.Random(5)
+    for text in _corpus(2, 300, size=120):
+        must = rng.choice([[], ["king"], ["good night", "b"]])
+        acc = MetricsAccumulator(must, "bedtime", 20)
+        i = 0
+        while i < len(text):
+            k = rng.randint(1, 9)
+            acc.feed(text[i:i + k])
+            i += k
+            assert acc.word_count == compute_metrics(text[:i], must, "bedtime", 20)["word_count"]
+            if rng.random() < 0.3:
+                assert acc.snapshot() == compute_metrics(text[:i], must, "bedtime", 20)
+        assert acc.snapshot() == compute_metrics(text, must, "bedtime", 20)
@@ -0,0 +1,98 @@
+from app.plancache import PlanCache, normalize, same_must
+
+CLS = {"category": "animal", "mood": "soothing", "intended_use": "bedtime", "red_flags": []}
+
+def put(pc, request, must):
+    pc.put(request, CLS, {"must_include": must, "setting_hints": [], "style_hints": []}, {"title": request})
+
+
+def test_near_duplicate_hits():
+    pc = PlanCache()
+    put(pc, "a story about a shy firefly", ["firefly"])
+    hit = pc.get("shy firefly who learns to glow")
+    assert hit is not None
+    entry, sim = hit
+    assert entry["plan"] == {"title": "a story about a shy firefly"}
+    assert sim == 0.5
+
+
+def test_name_swap_misses():
+    pc = PlanCache()
+    put(pc, "a bedtime story about a sleepy fox named Milo who finds a lantern", ["Milo", "lantern"])
+    assert pc.get("a bedtime story about a sleepy fox named Luna who finds a lantern") is None
+
+
+def test_noun_swap_misses():
+    pc = PlanCache()
+    put(pc, "a friendly dragon", ["dragon"])
+    assert pc.get("a friendly unicorn") is None
+
+
+def test_dropping_a_must_include_term_misses():
+    pc = PlanCache()
+    put(pc, "a sleepy fox named Milo", ["Milo"])
+    assert pc.get("a sleepy fox") is None
+
+
+def test_guard_tokens_must_match():
+    pc = PlanCache()
+    put(pc, "a story about a shy firefly", ["firefly"])
+    assert pc.get("a shy firefly, not a bedtime story") is None
+
+
+def test_reject_takes_back_the_hit():
+    pc = PlanCache()
+    put(pc, "a shy firefly", ["firefly"])
+    _, sim = pc.get("a shy firefly")
+    pc.reject(sim)
+    assert pc.stats()["hits"] == 0
+    assert pc.stats()["rejected"] == 1
+
+
+def test_same_must_normalizes():
+    assert same_must(["Shy Fireflies", "moon"], ["moon", "shy firefly"])
+    assert not same_must(["Milo"], ["Luna"])
+
+
+def test_lru_eviction_and_index_cleanup():
+    pc = PlanCache(max_entries=2)
+    put(pc, "a shy firefly", [])
+    put(pc, "a brave turtle", [])
+    pc.get("a shy firefly")            # refreshes the firefly entry
+    put(pc, "a curious owl", [])
+    assert len(pc) == 2
+    assert pc.get("a brave turtle") is None
+    assert pc.get("a shy firefly") is not None
+    assert "turtle" not in pc._index
+
+
+def test_ttl_expiry(monkeypatch):
+    import app.plancache as plancache
+    now = [1000.0]
+    monkeypatch.setattr(plancache.time, "time", lambda: now[0])
+    pc = PlanCache(ttl=60)
+    put(pc, "a shy firefly", [])
+    now[0] += 61
+    assert pc.get("a shy firefly") is None
+    assert len(pc) == 0
+
+
+def test_normalize_drops_stopwords_and_stems():
+    assert normalize("Write a story about the fireflies who glows") == {"firefly", "glow"}
+
+
+def test_lookup_node_checks_the_new_requests_must_include(monkeypatch):
+    import app.plancache as plancache
+    pc = PlanCache()
+    put(pc, "a story about a shy firefly", ["firefly"])
+    monkeypatch.setattr(plancache, "get_plan_cache", lambda: pc)
+    state = {"user_request": "shy firefly who learns to glow"}
+
+    monkeypatch.setattr(plancache, "_chat", lambda *a, **k: '{"must_include": ["firefly"]}')
+    assert plancache.plan_lookup_node(state)["plan_cache"]["hit"] is True
+
+    monkeypatch.setattr(plancache, "_chat", lambda *a, **k: '{"must_include": ["firefly", "glow"]}')
+    out = plancache.plan_lookup_node(state)
+    assert out["plan_cache"] == {"hit": False, "rejected": "must_include"}
+    assert "plan" not in out
+    assert pc.stats()["rejected"] == 1
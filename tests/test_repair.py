@@ -0,0 +1,85 @@
+from app.metrics import compute_metrics, dialogue_lines, word_count
+from app.repair import (
+    FIX_DIALOGUE, FIX_TAIL, FIX_TRIM, collapse_dialogue, repair_node, repair_story, trim_to_limit,
+)
+
+SCORES = {"faithfulness": 5, "instruction_adherence": 5, "age_fit": 5, "safety": 5,
+          "bedtime_tone": 5, "clarity": 5, "arc": 5, "engagement": 5}
+
+
+def test_collapse_dialogue_handles_both_quote_styles():
+    story = '"Hi," said Pip. "Yes," said Moss. \'Come,\' said Owl. \'Go,\' said Fox.'
+    assert dialogue_lines(story) == 4
+    out = collapse_dialogue(story)
+    assert out == '"Hi," said Pip. "Yes," said Moss. Come, said Owl. Go, said Fox.'
+    assert dialogue_lines(out) == 2
+
+
+def test_collapse_dialogue_keeps_apostrophes_readable():
+    story = '"A," said Pip. "B," said Moss. Pip didn\'t know the owl\'s name.'
+    out = collapse_dialogue(story)
+    assert out.endswith("Pip didn’t know the owl’s name.")
+    assert dialogue_lines(out) == 2
+
+
+def test_collapse_dialogue_leaves_short_dialogue_alone():
+    story = '"Hi," said Pip. \'Hush,\' said Moss.'
+    assert collapse_dialogue(story) is story
+
+
+def test_repair_story_collapses_dialogue():
+    story = "'Hi,' said Pip. 'Hush,' said Moss. 'Look,' said Owl. The stars came out."
+    out, applied = repair_story(story, [FIX_DIALOGUE], 100, "general")
+    assert applied == [FIX_DIALOGUE]
+    assert out == "'Hi,' said Pip. 'Hush,' said Moss. Look, said Owl. The stars came out."
+    assert not compute_metrics(out, [], "general", 100)["dialogue_over_2"]
+
+
+def test_trim_to_limit_cuts_at_a_sentence_end():
+    story = 'One two three. "Four five," said six. Seven eight nine ten.'
+    assert trim_to_limit(story, 7) == 'One two three. "Four five," said six.'
+    assert trim_to_limit(story, 6) == 'One two three.'
+    assert trim_to_limit(story, 100) == story
+    assert trim_to_limit(story, 2) == story   # no whole sentence fits: leave it to the reviser
+
+
+def test_repair_story_trims_with_room_for_the_goodnight_line():
+    story = " ".join(["The moon was soft and round."] * 20)
+    out, applied = repair_story(story, [FIX_TRIM, FIX_TAIL], 40, "bedtime")
+    assert applied == [FIX_TRIM, FIX_TAIL]
+    assert word_count(out) <= 40
+    assert compute_metrics(out, [], "bedtime", 40)["bedtime_tail_ok"]
+
+
+def _state(story, fixes, scores):
+    return {
+        "draft_story": story,
+        "constraints": {"must_include": ["owl"]},
+        "classification": {"intended_use": "bedtime"},
+        "plan": {"word_limit": 200},
+        "judge_report": {"scores": scores, "required_fixes": fixes, "verdict": "revise", "source": "llm",
+                         "metrics": {"word_limit": 200}},
+    }
+
+
+def test_repair_node_marks_a_repaired_draft_as_passing():
+    story = "The owl hooted softly. The stars were kind and the night was calm."
+    out = repair_node(_state(story, [FIX_TAIL], {**SCORES, "bedtime_tone": 3}))
+    assert out["repair"] == {"applied": [FIX_TAIL], "skip_revise": True}
+    assert out["judge_report"]["verdict"] == "pass"
+    assert out["judge_report"]["source"] == "repair"
+    assert out["judge_report"]["required_fixes"] == []
+
+
+def test_repair_node_keeps_revise_when_the_judge_had_other_complaints():
+    story = "The owl hooted softly. The stars were kind and the night was calm."
+    out = repair_node(_state(story, [FIX_TAIL, "Make the middle gentler."], {**SCORES, "bedtime_tone": 3}))
+    assert out["repair"]["skip_revise"] is False
+    assert out["judge_report"]["verdict"] == "revise"
+    assert out["judge_report"]["required_fixes"] == ["Make the middle gentler."]
+
+
+def test_repair_node_without_mechanical_fixes_is_a_no_op():
+    out = repair_node(_state("The owl slept.", ["Add a friend."], {**SCORES, "arc": 3}))
+    assert out["repair"] == {"applied": [], "skip_revise": False}
+    assert "judge_report" not in out
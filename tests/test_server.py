@@ -0,0 +1,131 @@
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import server
+from app.server import Admission, Overloaded, create_app
+from app.sessions import SessionStore
+
+
+@pytest.fixture
+def make_client(fake_llm):
+    clients = []
+
+    def make(**limits):
+        client = TestClient(create_app(store=SessionStore(":memory:"), **limits), raise_server_exceptions=False)
+        clients.append(client.__enter__())
+        return client
+    yield make
+    for client in clients:
+        client.__exit__(None, None, None)
+
+def hold(client, name):
+    # take a worker slot from inside the app's loop, as a long story would
+    slot = client.app.state.admission.slot(name)
+    client.portal.call(slot.__aenter__)
+    return lambda: client.portal.call(slot.__aexit__, None, None, None)
+
+def events(text):
+    out = []
+    for block in text.strip().split("\n\n"):
+        kind, data = block.split("\n", 1)
+        out.append((kind[len("event: "):], json.loads(data[len("data: "):])))
+    return out
+
+
+def test_story_then_feedback(make_client):
+    client = make_client()
+    res = client.post("/stories", json={"user_request": "A sleepy hedgehog under the moon"})
+    assert res.status_code == 200
+    story = res.json()
+    assert story["final_story"] and story["judge_report"]["verdict"] in ("pass", "revise")
+
+    res = client.post(f"/stories/{story['session_id']}/feedback", json={"feedback": "Add a friendly owl."})
+    assert res.status_code == 200
+    assert res.json()["final_story"] != story["final_story"]
+
+    res = client.get(f"/stories/{story['session_id']}")
+    assert res.status_code == 200
+    assert [h["node"] for h in res.json()["history"]][-3:] == ["feedback_step", "finalize_step", "judge_step"]
+
+
+def test_stream_events(make_client):
+    client = make_client()
+    res = client.post("/stories/stream", json={"user_request": "A sleepy hedgehog under the moon"})
+    assert res.status_code == 200
+    evs = events(res.text)
+    assert evs[0][0] == "session"
+    assert any(kind == "token" for kind, _ in evs)
+    kind, done = evs[-1]
+    assert kind == "done" and done["session_id"] == evs[0][1]["session_id"] and done["final_story"]
+    health = client.get("/healthz").json()
+    assert health["active"] == 0 and health["waiting"] == 0
+
+
+def test_unknown_session_is_404(make_client):
+    client = make_client()
+    assert client.post("/stories/nope/feedback", json={"feedback": "shorter"}).status_code == 404
+    assert client.get("/stories/nope").status_code == 404
+
+
+def test_failures_inside_feedback_are_500(make_client, monkeypatch):
+    async def broken(*args, **kwargs):
+        raise KeyError("plan")
+    monkeypatch.setattr(server, "aresume_feedback", broken)
+    client = make_client()
+    sid = client.post("/stories", json={"user_request": "A sleepy hedgehog"}).json()["session_id"]
+    assert client.post(f"/stories/{sid}/feedback", json={"feedback": "shorter"}).status_code == 500
+    assert client.get("/healthz").json()["active"] == 0
+
+
+def test_full_queue_is_429(make_client):
+    client = make_client(concurrency=1, queue_size=0)
+    release = hold(client, "someone-else")
+    for path in ("/stories", "/stories/stream"):
+        res = client.post(path, json={"user_request": "A sleepy hedgehog"})
+        assert res.status_code == 429
+        assert res.json()["error"] == "server busy"
+        assert int(res.headers["Retry-After"]) >= 1
+    release()
+    assert client.post("/stories", json={"user_request": "A sleepy hedgehog"}).status_code == 200
+    stats = client.get("/healthz").json()
+    assert stats["rejected"] == {"queue_full": 2, "client_limit": 0}
+    assert 'storydag_server_rejected_total{reason="queue_full"} 2' in client.get("/metrics").text
+
+
+def test_per_client_limit(make_client):
+    client = make_client(concurrency=4, per_client=1)
+    release = hold(client, "alice")
+    body = {"user_request": "A sleepy hedgehog"}
+    res = client.post("/stories", json=body, headers={"X-Client-Id": "alice"})
+    assert res.status_code == 429
+    assert res.json()["error"] == "too many requests in flight for this client"
+    assert client.post("/stories", json=body, headers={"X-Client-Id": "bob"}).status_code == 200
+    release()
+    assert client.post("/stories", json=body, headers={"X-Client-Id": "alice"}).status_code == 200
+
+
+def test_admission_queues_then_refuses():
+    async def run():
+        adm = Admission(concurrency=1, queue_size=1, per_client=0)
+        first = adm.slot("a")
+        await first.__aenter__()
+        entered = asyncio.Event()
+
+        async def second():
+            async with adm.slot("b"):
+                entered.set()
+        task = asyncio.create_task(second())
+        await asyncio.sleep(0)
+        assert (adm.active, adm.waiting) == (1, 1)
+        with pytest.raises(Overloaded):
+            async with adm.slot("c"):
+                pass
+        await first.__aexit__(None, None, None)
+        await task
+        assert entered.is_set()
+        assert (adm.active, adm.waiting) == (0, 0)
+        assert adm.rejected == {"queue_full": 1, "client_limit": 0}
+    asyncio.run(run())
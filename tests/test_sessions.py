@@ -0,0 +1,48 @@
+import threading
+
+from app.sessions import SessionStore, apply_delta, text_delta
+
+
+def test_text_delta_round_trips():
+    old = "Pip was a small firefly.\n\nThe stars came out."
+    new = "Pip was a tiny firefly.\n\nThe stars came out one by one. Sweet dreams."
+    assert apply_delta(old, text_delta(old, new)) == new
+
+
+def test_load_replays_checkpoints(tmp_path):
+    store = SessionStore(str(tmp_path / "s.db"))
+    sid = store.create("a shy firefly")
+    store.save(sid, "plan_step", {"plan": {"word_limit": 300}})
+    store.save(sid, "tell_step", {"draft_story": "Pip glowed."})
+    store.save(sid, "finalize_step", {"final_story": "Pip glowed. Sweet dreams."})
+    other = SessionStore(store.path)   # another worker: no cached state
+    state = other.load(sid)
+    assert state["plan"] == {"word_limit": 300}
+    assert state["final_story"] == "Pip glowed. Sweet dreams."
+    assert other.load(sid, seq=2)["draft_story"] == "Pip glowed."
+
+
+def test_workers_saving_one_session_keep_every_checkpoint(tmp_path):
+    # each store has its own connection, like separate processes on one file
+    path = str(tmp_path / "s.db")
+    sid = SessionStore(path).create("a shy firefly")
+    stores = [SessionStore(path) for _ in range(4)]
+    errors = []
+
+    def work(store, n):
+        try:
+            for i in range(25):
+                store.save(sid, f"w{n}", {f"k{n}": i})
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=work, args=(s, n)) for n, s in enumerate(stores)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    history = SessionStore(path).history(sid)
+    assert [h["seq"] for h in history] == list(range(101))
+    assert SessionStore(path).load(sid) == {"user_request": "a shy firefly", "revise_count": 0,
+                                             "k0": 24, "k1": 24, "k2": 24, "k3": 24}
@@ -0,0 +1,49 @@
+import threading
+import time
+
+import app.streaming as streaming
+
+
+class _Graph:
+    # stands in for a compiled graph: one node that streams tokens until told to stop
+    def __init__(self, tokens=1000):
+        self.tokens = tokens
+        self.sent = 0
+        self.finished = threading.Event()
+        self.error = None
+
+    def stream(self, state, config=None, stream_mode=None):
+        on_token = config["configurable"]["on_token"]
+        try:
+            for i in range(self.tokens):
+                on_token("tell_step", f"w{i} ")
+                self.sent += 1
+                time.sleep(0.001)
+            yield {"tell_step": {"draft_story": "done"}}
+            yield {"finalize_step": {"final_story": "done"}}
+        except Exception as e:
+            self.error = e
+            raise
+        finally:
+            self.finished.set()
+
+
+def test_breaking_out_stops_the_worker(monkeypatch):
+    graph = _Graph()
+    monkeypatch.setattr(streaming, "get_graph", lambda **kw: graph)
+    for i, ev in enumerate(streaming.stream_story("a shy firefly")):
+        if i == 5:
+            break
+    assert graph.finished.wait(2)
+    assert graph.sent < graph.tokens
+    assert isinstance(graph.error, streaming._Closed)
+
+
+def test_a_full_run_ends_with_done(monkeypatch):
+    graph = _Graph(tokens=3)
+    monkeypatch.setattr(streaming, "get_graph", lambda **kw: graph)
+    seen = []
+    events = list(streaming.stream_story("a shy firefly", on_update=lambda node, d: seen.append(node)))
+    assert [e["type"] for e in events] == ["token"] * 3 + ["node", "node", "done"]
+    assert events[-1]["state"]["final_story"] == "done"
+    assert seen == ["tell_step", "finalize_step"]